@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Coordinator/worker mode for batches and sweeps: a SQLite work queue on a shared filesystem.
+
+A unit of work is one task under one run config (model x attempts, or the
+baseline). `submit` creates a run dir per config and enqueues every
+task x config, slowest expected tasks first (demas.core.task_cost). Any number
+of `worker` processes, on any host that mounts the repo's sandbox/ at the same
+path, claim units, run them with swebench_batch's per-task runner and store
+the result row back in the queue. `collect` waits for the queue to drain, then
+writes each run's results.jsonl, records/, summary.csv and test timings and
+appends one BENCHMARKS row per model, like demas.benchmarks.sweep.
+
+Claims are leases (SWE_DIST_LEASE_S, default 1800 s) renewed by the worker
+while a unit runs; a unit whose worker died is claimed again once the lease
+expires and continues after its last finished attempt (logs/<task>.attempt.json),
+up to SWE_DIST_MAX_TRIES (default 3) claims. The database uses rollback
+journaling (no WAL), which works over NFS/SMB as long as the mount honours
+POSIX locks.
+
+Usage:
+  python -m demas.benchmarks.distributed submit --queue sandbox/_dist/q.db --models m1 m2 --attempts-mode both
+  python -m demas.benchmarks.distributed worker --queue sandbox/_dist/q.db --jobs 8      # on each host
+  python -m demas.benchmarks.distributed collect --queue sandbox/_dist/q.db --notes "full suite"
+  python -m demas.benchmarks.distributed status --queue sandbox/_dist/q.db
+  # one machine: N worker processes + collect (e.g. against demas.benchmarks.mock_llm)
+  python -m demas.benchmarks.distributed local --queue sandbox/_dist/q.db --workers 4 --jobs 2
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import threading
+import subprocess
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from demas.core import config as _cfg  # triggers local credentials loading
+from demas.core import cassette, task_cost
+from demas.core.io import load_seed_tasks, write_json_atomic
+from demas.core.models import TRACKED_MODELS, DEFAULT_TEMPERATURE, DEFAULT_MAX_TURNS
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LEASE_S = float(os.environ.get("SWE_DIST_LEASE_S", "1800"))
+MAX_TRIES = int(os.environ.get("SWE_DIST_MAX_TRIES", "3"))
+POLL_S = float(os.environ.get("SWE_DIST_POLL_S", "5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_key TEXT PRIMARY KEY, mode TEXT, model TEXT, attempts INTEGER, temperature REAL,
+    max_turns INTEGER, attempt_cap_s INTEGER, run_dir TEXT, aggregated INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, run_key TEXT, task_id TEXT, task TEXT,
+    status TEXT DEFAULT 'pending', worker TEXT DEFAULT '', lease_until REAL DEFAULT 0,
+    tries INTEGER DEFAULT 0, result TEXT DEFAULT '', updated REAL DEFAULT 0,
+    UNIQUE (run_key, task_id)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # isolation_level=None: explicit BEGIN IMMEDIATE around every read-modify-write
+    con = sqlite3.connect(path, timeout=120, isolation_level=None)
+    con.execute("PRAGMA journal_mode=DELETE")
+    con.executescript(SCHEMA)
+    return con
+
+
+def _meta(con: sqlite3.Connection, key: str, default: str = "") -> str:
+    row = con.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_meta(con: sqlite3.Connection, key: str, value: str) -> None:
+    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _counts(con: sqlite3.Connection) -> Dict[str, int]:
+    return {s: n for s, n in con.execute("SELECT status, COUNT(*) FROM units GROUP BY status")}
+
+
+# ---------------------------------------------------------------- submit
+
+def submit(queue: str, tasks: List[Dict[str, Any]], *, models: List[str], attempts: List[int], baseline: bool,
+           temperature: float, max_turns: int, attempt_cap_s: int) -> Dict[str, int]:
+    """Create one run (and run dir) per config and enqueue task x config units."""
+    ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    configs: List[Tuple[str, str, str, int]] = []  # (run_key, mode, model, attempts)
+    if baseline:
+        configs.append(("baseline", "baseline", "", 1))
+    configs += [(f"{m}|attempts={k}", "agent", m, k) for m in models for k in attempts]
+    hist = task_cost.load_history(_cfg.WORKDIR)
+    con = _connect(queue)
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        if not _meta(con, "ts"):
+            _set_meta(con, "ts", ts)
+        ts = _meta(con, "ts")
+        for i, (key, mode, model, k) in enumerate(configs):
+            if con.execute("SELECT 1 FROM runs WHERE run_key=?", (key,)).fetchone():
+                continue
+            sub = "agent_batch_runs" if mode == "agent" else "batch_runs"
+            run_dir = os.path.join(_cfg.WORKDIR, sub, f"{ts}_{i:02d}")
+            os.makedirs(os.path.join(run_dir, "logs"), exist_ok=True)
+            con.execute("INSERT INTO runs (run_key, mode, model, attempts, temperature, max_turns, attempt_cap_s, run_dir) VALUES (?,?,?,?,?,?,?,?)",
+                        (key, mode, model, k, temperature, max_turns, attempt_cap_s, run_dir))
+        # Slowest expected (task, config) first across all runs, so no long unit starts last
+        units = []
+        for key, mode, model, _k in configs:
+            est = task_cost.estimate(tasks, hist, model=model, mode=mode)
+            units += [(-est[t.get("task_id", "")][0], key, t) for t in tasks]
+        units.sort(key=lambda u: u[0])
+        for _, key, t in units:
+            con.execute("INSERT OR IGNORE INTO units (run_key, task_id, task, updated) VALUES (?,?,?,?)",
+                        (key, t.get("task_id", ""), json.dumps(t), time.time()))
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        counts = _counts(con)
+        con.close()
+    return counts
+
+
+# ---------------------------------------------------------------- worker
+
+def _claim(con: sqlite3.Connection, worker: str) -> Optional[Tuple[int, Dict[str, Any], Dict[str, Any]]]:
+    """Lease the next pending (or lease-expired) unit: (unit id, task, run config), or None."""
+    now = time.time()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        row = con.execute(
+            "SELECT u.id, u.task, u.tries, r.run_key, r.mode, r.model, r.attempts, r.temperature, r.max_turns, r.attempt_cap_s, r.run_dir "
+            "FROM units u JOIN runs r ON r.run_key = u.run_key "
+            "WHERE u.status='pending' OR (u.status='running' AND u.lease_until < ?) ORDER BY u.id LIMIT 1", (now,)).fetchone()
+        if row is None:
+            con.execute("COMMIT")
+            return None
+        uid, task, tries = row[0], json.loads(row[1]), row[2]
+        run = dict(zip(("run_key", "mode", "model", "attempts", "temperature", "max_turns", "attempt_cap_s", "run_dir"), row[3:]))
+        if tries >= MAX_TRIES:
+            res = {"task_id": task.get("task_id", ""), "error": f"abandoned after {tries} claims"}
+            con.execute("UPDATE units SET status='done', result=?, updated=? WHERE id=?", (json.dumps(res), now, uid))
+            con.execute("COMMIT")
+            return _claim(con, worker)
+        con.execute("UPDATE units SET status='running', worker=?, lease_until=?, tries=tries+1, updated=? WHERE id=?",
+                    (worker, now + LEASE_S, now, uid))
+        con.execute("COMMIT")
+        return uid, task, run
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+
+
+def _complete(con: sqlite3.Connection, uid: int, worker: str, res: Dict[str, Any]) -> None:
+    # Only the current lease holder may finish a unit (a re-claimed unit belongs to its new worker)
+    con.execute("UPDATE units SET status='done', result=?, lease_until=0, updated=? WHERE id=? AND worker=? AND status='running'",
+                (json.dumps(res), time.time(), uid, worker))
+
+
+def run_unit(task: Dict[str, Any], run: Dict[str, Any]) -> Dict[str, Any]:
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import swebench_batch
+    res, _msg = swebench_batch._run_single_task(
+        task, agent=run["mode"] == "agent", out_dir=run["run_dir"], model=run["model"], temperature=run["temperature"],
+        max_turns=run["max_turns"], attempts=run["attempts"], attempt_cap_s=run["attempt_cap_s"])
+    return res
+
+
+def worker(queue: str, *, jobs: int, worker_id: str = "") -> int:
+    """Claim and run units with `jobs` threads until nothing is left to claim; returns units completed."""
+    name = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    os.environ.setdefault("SWE_CPU_BUDGET", str(max(1, (os.cpu_count() or 1) // max(1, jobs))))
+    held: Dict[int, str] = {}
+    held_lock = threading.Lock()
+    stop = threading.Event()
+    done = [0]
+
+    def _renew() -> None:
+        con = _connect(queue)
+        while not stop.wait(max(1.0, LEASE_S / 3)):
+            with held_lock:
+                leases = list(held.items())
+            # Units are claimed per slot ("<name>/<slot>"): renew under the holder recorded at claim
+            for uid, me in leases:
+                try:
+                    con.execute("UPDATE units SET lease_until=? WHERE id=? AND worker=? AND status='running'", (time.time() + LEASE_S, uid, me))
+                except sqlite3.Error as e:
+                    print(f"[worker {name}] lease renewal failed: {e}")
+        con.close()
+
+    def _loop(slot: int) -> None:
+        me = f"{name}/{slot}"
+        con = _connect(queue)
+        while True:
+            unit = _claim(con, me)
+            if unit is None:
+                # Leases held by other workers may still expire; wait for them rather than exit early
+                if _counts(con).get("running", 0) and not stop.is_set():
+                    time.sleep(POLL_S)
+                    continue
+                break
+            uid, task, run = unit
+            with held_lock:
+                held[uid] = me
+            t0 = time.time()
+            try:
+                res = run_unit(task, run)
+            except Exception as e:
+                res = {"task_id": task.get("task_id", ""), "error": f"worker_failed: {e}"}
+            with held_lock:
+                held.pop(uid, None)
+            _complete(con, uid, me, res)
+            done[0] += 1
+            print(f"[worker {me}] {run['run_key']} {task.get('task_id','')} -> {res.get('status', 'error')} ({time.time() - t0:.1f}s)")
+        con.close()
+
+    renew = threading.Thread(target=_renew, name="dist-lease", daemon=True)
+    renew.start()
+    loops = [threading.Thread(target=_loop, args=(i,), name=f"dist-worker-{i}") for i in range(max(1, jobs))]
+    for t in loops:
+        t.start()
+    for t in loops:
+        t.join()
+    stop.set()
+    return done[0]
+
+
+# ---------------------------------------------------------------- collect
+
+def write_run_dir(run: Dict[str, Any], rows: List[Dict[str, Any]]) -> str:
+    """Same artifacts as a swebench_batch run dir; returns the summary.csv path."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from swebench_batch import _record_path
+    from demas.core.summaries import write_agent_csv, write_baseline_csv, write_test_timings_csv, first_attempt_rows
+    out_dir = run["run_dir"]
+    for r in rows:
+        if r.get("task_id") and "error" not in r:
+            write_json_atomic(_record_path(out_dir, r["task_id"]), r)
+    out_path = os.path.join(out_dir, "results.jsonl")
+    with open(out_path + ".tmp", "w", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r) + "\n")
+    os.replace(out_path + ".tmp", out_path)
+    csv_path = os.path.join(out_dir, "summary.csv")
+    (write_agent_csv if run["mode"] == "agent" else write_baseline_csv)(rows, csv_path)
+    if run["mode"] == "agent" and int(run["attempts"]) > 1:
+        csv1_path = os.path.join(out_dir, "summary_attempt1.csv")
+        rows1 = first_attempt_rows(rows)
+        if rows1:
+            write_agent_csv(rows1, csv1_path)
+        elif os.path.exists(csv1_path):
+            os.remove(csv1_path)
+    write_test_timings_csv(rows, os.path.join(out_dir, "test_timings.csv"))
+    return csv_path
+
+
+def collect(queue: str, *, wait: bool, notes: str) -> int:
+    from demas.benchmarks.append import parse_csv, append_row
+    from demas.benchmarks.sweep import attempt1_csv
+    con = _connect(queue)
+    while True:
+        c = _counts(con)
+        left = c.get("pending", 0) + c.get("running", 0)
+        if not left:
+            break
+        if not wait:
+            print(f"[collect] {left} units not finished: {json.dumps(c)}")
+            return 1
+        print(f"[collect] waiting: {json.dumps(c)}")
+        time.sleep(max(POLL_S, 10.0))
+
+    runs = [dict(zip(("run_key", "mode", "model", "attempts", "run_dir", "aggregated"), r))
+            for r in con.execute("SELECT run_key, mode, model, attempts, run_dir, aggregated FROM runs ORDER BY rowid")]
+    csvs: Dict[str, str] = {}
+    for run in runs:
+        rows = [json.loads(r[0]) for r in con.execute("SELECT result FROM units WHERE run_key=? ORDER BY task_id", (run["run_key"],))]
+        csvs[run["run_key"]] = write_run_dir(run, rows)
+        print(f"[collect] {run['run_key']}: {len(rows)} rows -> {csvs[run['run_key']]}")
+    if "baseline" in csvs:
+        print(f"Baseline pass_rate: {parse_csv(csvs['baseline']).get('pass_rate', '')}")
+
+    # One BENCHMARKS row per model, as the sequential sweep writes it; never twice per queue
+    ts = _meta(con, "ts")
+    appended = json.loads(_meta(con, "appended", "[]"))
+    for m in dict.fromkeys(r["model"] for r in runs if r["mode"] == "agent"):
+        if m in appended:
+            continue
+        csv1 = csvs.get(f"{m}|attempts=1") or attempt1_csv(csvs.get(f"{m}|attempts=2", ""))
+        info1 = parse_csv(csv1) if csv1 else {}
+        info2 = parse_csv(csvs[f"{m}|attempts=2"]) if f"{m}|attempts=2" in csvs else {}
+        append_row(os.path.join(ROOT, "BENCHMARKS.md"), ts, info2.get("model") or info1.get("model") or m, info1.get("pass_rate", ""),
+                   info2.get("p50", ""), info2.get("p95", ""), notes, info2.get("tokens_total", ""), info2.get("pass_rate", ""))
+        appended.append(m)
+        _set_meta(con, "appended", json.dumps(appended))
+        print(f"Appended BENCHMARKS row for {m} @ {ts}")
+    con.execute("UPDATE runs SET aggregated=1")
+    con.close()
+    return 0
+
+
+def has_agent_runs(queue: str) -> bool:
+    """Whether the queue holds any agent run (baseline-only queues need no model keys)."""
+    con = _connect(queue)
+    row = con.execute("SELECT 1 FROM runs WHERE mode='agent' LIMIT 1").fetchone()
+    con.close()
+    return row is not None
+
+
+def status(queue: str) -> Dict[str, Any]:
+    con = _connect(queue)
+    out = {
+        "units": _counts(con),
+        "runs": {k: {s: n for s, n in con.execute("SELECT status, COUNT(*) FROM units WHERE run_key=? GROUP BY status", (k,))}
+                 for (k,) in con.execute("SELECT run_key FROM runs ORDER BY rowid").fetchall()},
+        "workers": {w: n for w, n in con.execute("SELECT worker, COUNT(*) FROM units WHERE status='running' GROUP BY worker")},
+    }
+    con.close()
+    return out
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Distributed batches/sweeps over a shared SQLite work queue")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("submit", help="Enqueue task x config units (idempotent per queue)")
+    sp.add_argument("--queue", required=True, help="Queue database on a filesystem shared by all workers")
+    sp.add_argument("--seeds", default="sandbox/swe_tasks.jsonl", help="Seed tasks JSONL (default: sandbox/swe_tasks.jsonl)")
+    sp.add_argument("--limit", type=int, default=0, help="Limit number of tasks (0 = all)")
+    sp.add_argument("--models", nargs="*", default=None, help="Override model list; default uses TRACKED_MODELS")
+    sp.add_argument("--chutes-only", action="store_true", help="Exclude openai/* models (routed via OpenRouter)")
+    sp.add_argument("--attempts-mode", choices=["1", "2", "both"], default="both", help="Report attempts=1, attempts=2, or both (default: both, from one attempts=2 run)")
+    sp.add_argument("--baseline", action="store_true", help="Also enqueue the baseline run")
+    sp.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE, help="Sampling temperature for all models (default from registry)")
+    sp.add_argument("--max-turns", dest="max_turns", type=int, default=DEFAULT_MAX_TURNS, help="Maximum agent turns (default from registry)")
+    sp.add_argument("--attempt-cap-s", type=int, default=60, help="Per-attempt wall-clock cap in seconds (default: 60)")
+
+    wp = sub.add_parser("worker", help="Claim and run units until the queue is drained")
+    wp.add_argument("--queue", required=True)
+    wp.add_argument("--jobs", type=int, default=4, help="Units run concurrently by this worker (default: 4)")
+    wp.add_argument("--worker-id", default="", help="Name recorded on claimed units (default: host:pid)")
+
+    cp = sub.add_parser("collect", help="Aggregate finished runs into run dirs, CSVs and BENCHMARKS.md")
+    cp.add_argument("--queue", required=True)
+    cp.add_argument("--no-wait", action="store_true", help="Fail instead of waiting when units are unfinished")
+    cp.add_argument("--notes", default="", help="Notes appended to BENCHMARKS.md rows (include 'full' to mark leaderboard)")
+
+    lp = sub.add_parser("local", help="Run N worker processes on this machine, then collect")
+    lp.add_argument("--queue", required=True)
+    lp.add_argument("--workers", type=int, default=2, help="Worker processes (default: 2)")
+    lp.add_argument("--jobs", type=int, default=2, help="Units per worker process (default: 2)")
+    lp.add_argument("--notes", default="")
+
+    stp = sub.add_parser("status", help="Unit counts by state, run and worker")
+    stp.add_argument("--queue", required=True)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "submit":
+        tasks = load_seed_tasks(args.seeds)
+        if args.limit > 0:
+            tasks = tasks[: args.limit]
+        models = args.models if args.models else TRACKED_MODELS
+        if args.chutes_only:
+            models = [m for m in models if not str(m).lower().startswith("openai/")]
+        # "both" runs attempts=2 only; collect takes attempts=1 from its first attempts
+        attempts = {"1": [1], "2": [2], "both": [2]}[args.attempts_mode]
+        counts = submit(args.queue, tasks, models=models, attempts=attempts, baseline=args.baseline,
+                        temperature=args.temperature, max_turns=args.max_turns, attempt_cap_s=args.attempt_cap_s)
+        print(f"[submit] {args.queue}: {json.dumps(counts)}")
+        return 0
+    if args.cmd == "worker":
+        if not os.environ.get("CHUTES_API_KEY") and cassette.mode() != "replay" and has_agent_runs(args.queue):
+            print("Error: CHUTES_API_KEY not set in env.", file=sys.stderr)
+            return 2
+        n = worker(args.queue, jobs=args.jobs, worker_id=args.worker_id)
+        print(f"[worker] finished {n} units")
+        return 0
+    if args.cmd == "collect":
+        return collect(args.queue, wait=not args.no_wait, notes=args.notes)
+    if args.cmd == "local":
+        procs = [subprocess.Popen([sys.executable, "-m", "demas.benchmarks.distributed", "worker", "--queue", args.queue,
+                                   "--jobs", str(args.jobs), "--worker-id", f"local{i}"], cwd=ROOT)
+                 for i in range(max(1, args.workers))]
+        codes = [p.wait() for p in procs]
+        if any(codes):
+            print(f"[local] worker exit codes: {codes}")
+        return collect(args.queue, wait=False, notes=args.notes)
+    print(json.dumps(status(args.queue), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Per-stage latency comparison: transient `docker run --rm` vs a persistent session.
+
+Runs a fixed sequence of lightweight commands shaped like one agent attempt
+(clone check, pre-test import, read file, patch check, rerun) through both
+execution paths and writes a CSV with per-stage mean/p50 seconds.
+
+Usage:
+  python -m demas.benchmarks.docker_latency --repeats 3
+"""
+
+import os
+import time
+import statistics as stats
+from typing import List, Dict, Tuple
+
+from demas.core import config as _cfg
+from demas.core.docker_exec import run_docker_bash, DockerSession
+
+
+# (stage, command) pairs approximating the oneagent tool mix
+STAGES: List[Tuple[str, str]] = [
+    ("clone", "git --version"),
+    ("pytest", "python -c 'import pytest'"),
+    ("read_file", "head -c 200 /etc/os-release"),
+    ("apply_patch", "git apply --help >/dev/null 2>&1 || true"),
+    ("pytest_rerun", "python -c 'import pytest'"),
+]
+
+
+def _time_transient(repeats: int) -> Dict[str, List[float]]:
+    out: Dict[str, List[float]] = {name: [] for name, _ in STAGES}
+    for _ in range(repeats):
+        for name, cmd in STAGES:
+            t0 = time.time()
+            run_docker_bash(cmd, image=_cfg.DOCKER_IMAGE, workdir=_cfg.WORKDIR)
+            out[name].append(time.time() - t0)
+    return out
+
+
+def _time_session(repeats: int) -> Dict[str, List[float]]:
+    out: Dict[str, List[float]] = {name: [] for name, _ in STAGES}
+    out["session_start"] = []
+    out["session_close"] = []
+    for _ in range(repeats):
+        s = DockerSession(image=_cfg.DOCKER_IMAGE, workdir=_cfg.WORKDIR)
+        t0 = time.time()
+        s.start()
+        out["session_start"].append(time.time() - t0)
+        try:
+            for name, cmd in STAGES:
+                t0 = time.time()
+                s.run(cmd)
+                out[name].append(time.time() - t0)
+        finally:
+            t0 = time.time()
+            s.close()
+            out["session_close"].append(time.time() - t0)
+    return out
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+    import csv
+    ap = argparse.ArgumentParser(description="Compare per-stage docker latency: transient run vs persistent session")
+    ap.add_argument("--repeats", type=int, default=3, help="Attempt-shaped sequences per path (default: 3)")
+    ap.add_argument("--out", default=os.path.join(_cfg.WORKDIR, "docker_latency.csv"), help="CSV output path")
+    args = ap.parse_args(argv)
+
+    transient = _time_transient(max(1, args.repeats))
+    session = _time_session(max(1, args.repeats))
+    names = [n for n, _ in STAGES] + ["session_start", "session_close"]
+
+    def _fmt(vals: List[float]) -> Tuple[str, str]:
+        if not vals:
+            return "", ""
+        return f"{stats.mean(vals):.3f}", f"{stats.median(vals):.3f}"
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", newline="", encoding="utf-8") as cf:
+        w = csv.writer(cf)
+        w.writerow(["stage", "transient_mean_s", "transient_p50_s", "session_mean_s", "session_p50_s"])
+        for n in names:
+            tm, tp = _fmt(transient.get(n, []))
+            sm, sp = _fmt(session.get(n, []))
+            w.writerow([n, tm, tp, sm, sp])
+            print(f"{n:14s} transient={tm or '-':>7s}s  session={sm or '-':>7s}s")
+        total_t = sum(sum(v) for v in transient.values()) / max(1, args.repeats)
+        total_s = sum(sum(v) for v in session.values()) / max(1, args.repeats)
+        w.writerow([])
+        w.writerow(["per_attempt_total_s", f"{total_t:.3f}", "", f"{total_s:.3f}", ""])
+    print(f"Per-attempt total: transient={total_t:.3f}s session={total_s:.3f}s")
+    print(f"Wrote CSV: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main(sys.argv[1:]))
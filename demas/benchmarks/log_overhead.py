@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Per-tool-call logging overhead: open/append/close per record vs the buffered logger.
+
+Each simulated tool call logs the CALL and result records oneagent writes (the
+result record carries an 8 KB truncated output). The caller-side time is what
+the agent's event loop pays; drain is the extra time `close` waits for the
+flusher at the end of the attempt.
+
+Usage:
+  python -m demas.benchmarks.log_overhead --calls 2000
+"""
+
+import os
+import json
+import time
+import tempfile
+from typing import List, Dict, Any, Tuple
+
+from demas.core import config as _cfg
+from demas.core import jsonl_logger
+
+
+def _records(i: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    base = {"run_id": "bench", "task_id": "bench_task", "model": "bench-model", "temperature": 0.0, "usage": None}
+    args = {"pytest_args": f"-q -k test_{i}"}
+    call = {"timestamp": "2025-01-01T00:00:00Z", "role": "assistant", "content": "CALL swe_pytest", "tool_name": "swe_pytest", "tool_args": args, "tool_result": "", **base}
+    res = {"timestamp": "2025-01-01T00:00:01Z", "role": "tool", "content": "", "tool_name": "swe_pytest", "tool_args": args,
+           "tool_result": ("E   AssertionError: expected 3, got 4\n" * 230)[:8192], **base}
+    return call, res
+
+
+def _legacy_write(path: str, record: Dict[str, Any]) -> None:
+    # Previous oneagent._log_record: open, append one line, close
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _run(mode: str, calls: int, tmp: str) -> Tuple[float, float]:
+    """(caller-side seconds, drain seconds) for `calls` tool calls."""
+    path = os.path.join(tmp, f"{mode}.jsonl")
+    lg = None
+    if mode != "legacy":
+        lg = jsonl_logger.JsonlLogger(path, compress=mode == "buffered_gzip", fsync="batch" if mode == "buffered_fsync" else "none")
+    t0 = time.perf_counter()
+    for i in range(calls):
+        for rec in _records(i):
+            if lg is None:
+                _legacy_write(path, rec)
+            else:
+                lg.write(rec)
+    caller = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    if lg is not None:
+        lg.close()
+    drain = time.perf_counter() - t0
+    n = sum(1 for _ in jsonl_logger.iter_lines(path if lg is None else lg.path))
+    if n != 2 * calls:
+        raise RuntimeError(f"{mode}: wrote {n} records, expected {2 * calls}")
+    return caller, drain
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+    import csv
+    ap = argparse.ArgumentParser(description="Measure per-tool-call JSONL logging overhead")
+    ap.add_argument("--calls", type=int, default=2000, help="Simulated tool calls per mode (default: 2000)")
+    ap.add_argument("--out", default=os.path.join(_cfg.WORKDIR, "log_overhead.csv"), help="CSV output path")
+    args = ap.parse_args(argv)
+    calls = max(1, args.calls)
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="demas_logbench_") as tmp:
+        for mode in ("legacy", "buffered", "buffered_gzip", "buffered_fsync"):
+            caller, drain = _run(mode, calls, tmp)
+            per_call_us = caller / calls * 1e6
+            rows.append([mode, calls, f"{per_call_us:.1f}", f"{drain:.3f}"])
+            print(f"{mode:15s} {per_call_us:8.1f} us/tool call (caller)  drain={drain:.3f}s")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", newline="", encoding="utf-8") as cf:
+        w = csv.writer(cf)
+        w.writerow(["mode", "tool_calls", "caller_us_per_call", "drain_s"])
+        w.writerows(rows)
+    print(f"Wrote CSV: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main(sys.argv[1:]))
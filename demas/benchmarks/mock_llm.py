@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stand-in model server for load-testing the harness.
+
+Speaks POST /v1/chat/completions (plain and streaming, incl. tool calls and
+stream usage) and GET /v1/models; GET /stats reports request counts.
+
+A policy scripts the agent: the step is chosen from the number of tool results
+already in the conversation, so the server keeps no per-session state. Default:
+  swe_clone,swe_pytest,tail
+- a tool name calls that tool; swe_clone takes repo_url/ref from the task prompt,
+  pytest tools use "-q"
+- `tail` replies with the last tool result (the pytest tail)
+- a JSON policy file may instead list {"tool": name, "args": {...}} / {"text": "..."}
+  steps ("{tail}" in text is replaced by the last tool result)
+
+Usage:
+  python -m demas.benchmarks.mock_llm --port 8765 --latency-s 0.3 --tokens-per-s 150 --rate-429 0.05
+  CHUTES_BASE_URL=http://127.0.0.1:8765/v1 CHUTES_API_KEY=mock \\
+    python swebench_batch.py --agent --engine async --jobs 64 --model mock-model
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Dict, Any, Optional
+
+
+DEFAULT_POLICY = "swe_clone,swe_pytest,tail"
+
+
+class MockConfig:
+    def __init__(self, *, policy: List[Dict[str, Any]], latency_s: float = 0.0, tokens_per_s: float = 0.0,
+                 rate_429: float = 0.0, rate_timeout: float = 0.0, timeout_s: float = 120.0, seed: Optional[int] = None):
+        self.policy = policy
+        self.latency_s = max(0.0, latency_s)
+        self.tokens_per_s = max(0.0, tokens_per_s)
+        self.rate_429 = max(0.0, rate_429)
+        self.rate_timeout = max(0.0, rate_timeout)
+        self.timeout_s = max(0.0, timeout_s)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"requests": 0, "stream": 0, "tool_calls": 0, "rate_limited": 0, "timeouts": 0, "inflight": 0, "max_inflight": 0}
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return rate > 0 and self.rng.random() < rate
+
+    def bump(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += n
+            if key == "inflight":
+                self.stats["max_inflight"] = max(self.stats["max_inflight"], self.stats["inflight"])
+
+
+def parse_policy(spec: str) -> List[Dict[str, Any]]:
+    """Comma-separated step list or a path to a JSON list of steps."""
+    if spec and os.path.isfile(spec):
+        with open(spec, "r", encoding="utf-8") as f:
+            steps = json.load(f)
+        return [s for s in steps if isinstance(s, dict)]
+    out: List[Dict[str, Any]] = []
+    for name in (spec or DEFAULT_POLICY).split(","):
+        name = name.strip()
+        if name == "tail":
+            out.append({"text": "{tail}"})
+        elif name:
+            out.append({"tool": name})
+    return out
+
+
+def _text_of(content: Any) -> str:
+    if isinstance(content, list):
+        return " ".join(str(p.get("text", "")) if isinstance(p, dict) else str(p) for p in content)
+    return str(content or "")
+
+
+def _default_args(tool: str, prompt: str) -> Dict[str, Any]:
+    if tool == "swe_clone":
+        m = re.search(r'swe_clone\(repo_url="([^"]*)", ref="([^"]*)"\)', prompt)
+        return {"repo_url": m.group(1), "ref": m.group(2)} if m else {"repo_url": ""}
+    if tool in ("swe_pytest", "swe_pytest_auto", "swe_pytest_full"):
+        return {"pytest_args": "-q"}
+    return {}
+
+
+def plan_reply(cfg: MockConfig, body: Dict[str, Any]) -> Dict[str, Any]:
+    """Return {"content": str} or {"tool_call": {"name", "arguments"}} for this request."""
+    msgs = body.get("messages") or []
+    tool_results = [m for m in msgs if m.get("role") == "tool"]
+    prompt = next((_text_of(m.get("content")) for m in msgs if m.get("role") == "user"), "")
+    tail = _text_of(tool_results[-1].get("content")) if tool_results else ""
+    if not body.get("tools"):
+        # Preflight or plain chat: short text
+        return {"content": "ok"}
+    idx = len(tool_results)
+    step = cfg.policy[idx] if idx < len(cfg.policy) else {"text": "{tail}"}
+    if "tool" in step:
+        args = step.get("args") or _default_args(step["tool"], prompt)
+        return {"tool_call": {"name": step["tool"], "arguments": json.dumps(args)}}
+    return {"content": str(step.get("text", "")).replace("{tail}", tail or "(no tail)")}
+
+
+def _tokens(s: str) -> int:
+    return max(1, len(s) // 4)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "demas-mock-llm/1"
+    cfg: MockConfig  # set on the subclass by serve()
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _json(self, code: int, obj: Dict[str, Any]) -> None:
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            with self.cfg.lock:
+                self._json(200, dict(self.cfg.stats))
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0") or 0)) or b"{}")
+        except Exception:
+            self._json(400, {"error": {"message": "bad json"}})
+            return
+        cfg = self.cfg
+        cfg.bump("requests")
+        cfg.bump("inflight")
+        try:
+            if cfg.roll(cfg.rate_429):
+                cfg.bump("rate_limited")
+                self._json(429, {"error": {"message": "rate limited (injected)", "type": "rate_limit_error"}})
+                return
+            if cfg.roll(cfg.rate_timeout):
+                cfg.bump("timeouts")
+                time.sleep(cfg.timeout_s)
+                self.close_connection = True
+                return
+            reply = plan_reply(cfg, body)
+            if "tool_call" in reply:
+                cfg.bump("tool_calls")
+            time.sleep(cfg.latency_s)
+            if body.get("stream"):
+                cfg.bump("stream")
+                self._stream(body, reply)
+            else:
+                self._complete(body, reply)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            cfg.bump("inflight", -1)
+
+    def _usage(self, body: Dict[str, Any], out_text: str) -> Dict[str, int]:
+        p = sum(_tokens(_text_of(m.get("content"))) for m in body.get("messages") or [])
+        c = _tokens(out_text)
+        return {"prompt_tokens": p, "completion_tokens": c, "total_tokens": p + c}
+
+    def _gen_delay(self, text: str) -> float:
+        return _tokens(text) / self.cfg.tokens_per_s if self.cfg.tokens_per_s > 0 else 0.0
+
+    def _complete(self, body: Dict[str, Any], reply: Dict[str, Any]) -> None:
+        msg: Dict[str, Any] = {"role": "assistant", "content": reply.get("content")}
+        out_text = reply.get("content") or ""
+        if "tool_call" in reply:
+            tc = reply["tool_call"]
+            out_text = tc["arguments"]
+            msg["content"] = None
+            msg["tool_calls"] = [{"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function", "function": tc}]
+        time.sleep(self._gen_delay(out_text))
+        self._json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:16]}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", "mock-model"),
+            "choices": [{"index": 0, "message": msg, "finish_reason": "tool_calls" if "tool_call" in reply else "stop"}],
+            "usage": self._usage(body, out_text),
+        })
+
+    def _stream(self, body: Dict[str, Any], reply: Dict[str, Any]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        cid = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+        base = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", "mock-model")}
+
+        def _send(choices: List[Dict[str, Any]], **extra: Any) -> None:
+            self.wfile.write(b"data: " + json.dumps({**base, "choices": choices, **extra}).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        if "tool_call" in reply:
+            tc = reply["tool_call"]
+            out_text = tc["arguments"]
+            _send([{"index": 0, "delta": {"role": "assistant", "tool_calls": [{"index": 0, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "function", "function": {"name": tc["name"], "arguments": ""}}]}, "finish_reason": None}])
+            pieces = [out_text[i:i + 16] for i in range(0, len(out_text), 16)] or [""]
+            for piece in pieces:
+                time.sleep(self._gen_delay(piece))
+                _send([{"index": 0, "delta": {"tool_calls": [{"index": 0, "function": {"arguments": piece}}]}, "finish_reason": None}])
+            finish = "tool_calls"
+        else:
+            out_text = reply.get("content") or ""
+            _send([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for piece in re.findall(r"\S+\s*|\s+", out_text) or [""]:
+                time.sleep(self._gen_delay(piece))
+                _send([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            finish = "stop"
+        _send([{"index": 0, "delta": {}, "finish_reason": finish}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            _send([], usage=self._usage(body, out_text))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def serve(cfg: MockConfig, *, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Create (not start) a server bound to host:port; call serve_forever() or run it in a thread."""
+    handler = type("MockHandler", (_Handler,), {"cfg": cfg})
+    srv = ThreadingHTTPServer((host, port), handler)
+    srv.daemon_threads = True
+    return srv
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock model server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--policy", default=DEFAULT_POLICY, help=f"Comma-separated steps or a JSON policy file (default: {DEFAULT_POLICY})")
+    ap.add_argument("--latency-s", type=float, default=0.0, help="Time to first token per request")
+    ap.add_argument("--tokens-per-s", type=float, default=0.0, help="Generation throughput (0 = instant)")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    ap.add_argument("--rate-timeout", type=float, default=0.0, help="Fraction of requests that hang for --timeout-s, then drop")
+    ap.add_argument("--timeout-s", type=float, default=120.0, help="Hang duration for injected timeouts")
+    ap.add_argument("--seed", type=int, default=None, help="Seed for error injection")
+    args = ap.parse_args(argv)
+    cfg = MockConfig(policy=parse_policy(args.policy), latency_s=args.latency_s, tokens_per_s=args.tokens_per_s,
+                     rate_429=args.rate_429, rate_timeout=args.rate_timeout, timeout_s=args.timeout_s, seed=args.seed)
+    srv = serve(cfg, host=args.host, port=args.port)
+    print(f"Mock LLM listening; export CHUTES_BASE_URL=http://{args.host}:{args.port}/v1")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        print(f"[mock-llm] {json.dumps(cfg.stats)}")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main(sys.argv[1:]))
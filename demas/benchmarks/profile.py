@@ -17,6 +17,9 @@ import json
 import glob
 from typing import Dict, Any, List, Tuple
 
+from demas.core import config as _cfg
+from demas.core import jsonl_logger
+
 
 def _parse_agent_log(path: str) -> Dict[str, Any]:
     """Return durations (seconds) for key phases in a single agent log."""
@@ -30,8 +33,7 @@ def _parse_agent_log(path: str) -> Dict[str, Any]:
         except Exception:
             return 0.0
 
-    with open(path, "r", encoding="utf-8") as f:
-        rows = [json.loads(line) for line in f if line.strip()]
+    rows = [json.loads(line) for line in jsonl_logger.iter_lines(path) if line.strip()]
 
     task_id = ""
     model = ""
@@ -41,6 +43,12 @@ def _parse_agent_log(path: str) -> Dict[str, Any]:
     # Track first CALL ts and matching tool result ts
     call_ts: Dict[str, float] = {}
     durations: Dict[str, float] = {}
+    # Model calls routed through the shared limiter (demas.core.ratelimit)
+    llm_calls = 0
+    llm_wait = 0.0
+    # Test-result cache (demas.core.test_cache) lookups by the pytest tools
+    tc_hits = 0
+    tc_misses = 0
 
     def _close(tool_name: str, end_ts: float):
         st = call_ts.pop(tool_name, None)
@@ -56,6 +64,12 @@ def _parse_agent_log(path: str) -> Dict[str, Any]:
         model = r.get("model", model)
         if role == "system" and content == "run_started":
             run_start = ts
+        if role == "system" and content == "llm_call":
+            llm_calls += 1
+            llm_wait += float((r.get("llm_call") or {}).get("queue_wait_s") or 0.0)
+        if role == "tool" and r.get("test_cache") in ("hit", "miss"):
+            tc_hits += r["test_cache"] == "hit"
+            tc_misses += r["test_cache"] == "miss"
         # Record last ts as run end heuristic
         if ts:
             run_end = ts
@@ -68,7 +82,7 @@ def _parse_agent_log(path: str) -> Dict[str, Any]:
     total = round((run_end - run_start), 3) if (run_start and run_end and run_end >= run_start) else 0.0
 
     return {
-        "task_id": task_id or os.path.splitext(os.path.basename(path))[0],
+        "task_id": task_id or os.path.basename(path).split(".jsonl")[0],
         "model": model,
         "clone_s": durations.get("swe_clone", 0.0),
         "install_s": durations.get("swe_install", 0.0),
@@ -78,6 +92,10 @@ def _parse_agent_log(path: str) -> Dict[str, Any]:
         "pip_install_s": durations.get("swe_pip_install", 0.0),
         "patch_s": durations.get("swe_apply_patch_text", 0.0),
         "total_s": total,
+        "llm_calls": llm_calls,
+        "llm_queue_wait_s": round(llm_wait, 3),
+        "test_cache_hits": tc_hits,
+        "test_cache_misses": tc_misses,
     }
 
 
@@ -85,14 +103,14 @@ def profile_agent_run(run_dir: str) -> str:
     """Profile an agent batch run dir and write CSV; return CSV path."""
     logs_dir = os.path.join(run_dir, "logs")
     out_csv = os.path.join(run_dir, "profile.csv")
-    files = sorted(glob.glob(os.path.join(logs_dir, "*.jsonl")))
+    files = sorted(glob.glob(os.path.join(logs_dir, "*.jsonl")) + glob.glob(os.path.join(logs_dir, "*.jsonl.gz")))
     rows = [_parse_agent_log(p) for p in files]
     import csv
     with open(out_csv, "w", newline="", encoding="utf-8") as cf:
         w = csv.writer(cf)
-        w.writerow(["task_id", "model", "clone_s", "install_s", "pytest_auto_s", "pytest_full_s", "pytest_s", "pip_install_s", "patch_s", "total_s"])
+        w.writerow(["task_id", "model", "clone_s", "install_s", "pytest_auto_s", "pytest_full_s", "pytest_s", "pip_install_s", "patch_s", "total_s", "llm_calls", "llm_queue_wait_s", "test_cache_hits", "test_cache_misses"])
         for r in rows:
-            w.writerow([r["task_id"], r["model"], r["clone_s"], r["install_s"], r["pytest_auto_s"], r["pytest_full_s"], r["pytest_s"], r["pip_install_s"], r["patch_s"], r["total_s"]])
+            w.writerow([r["task_id"], r["model"], r["clone_s"], r["install_s"], r["pytest_auto_s"], r["pytest_full_s"], r["pytest_s"], r["pip_install_s"], r["patch_s"], r["total_s"], r["llm_calls"], r["llm_queue_wait_s"], r["test_cache_hits"], r["test_cache_misses"]])
     return out_csv
 
 
@@ -138,7 +156,7 @@ def main(argv: List[str]) -> int:
     if args.agent_run_dir:
         run_dir = args.agent_run_dir
     else:
-        agent_root = os.path.join("sandbox", "agent_batch_runs")
+        agent_root = os.path.join(_cfg.WORKDIR, "agent_batch_runs")
         run_dir = _latest(agent_root)
     if os.path.isdir(os.path.join(run_dir, "logs")):
         csv_path = profile_agent_run(run_dir)
@@ -147,7 +165,7 @@ def main(argv: List[str]) -> int:
     if args.baseline_run_dir:
         base_dir = args.baseline_run_dir
     else:
-        base_root = os.path.join("sandbox", "batch_runs")
+        base_root = os.path.join(_cfg.WORKDIR, "batch_runs")
         base_dir = _latest(base_root)
     if os.path.isfile(os.path.join(base_dir, "results.jsonl")):
         csv_path = profile_baseline_run(base_dir)
@@ -2,20 +2,44 @@ import os
 import sys
 import json
 import time
+import threading
 import subprocess
 from datetime import datetime
-from typing import List
+from typing import List, Dict, Any, Tuple
 
 from demas.core.models import TRACKED_MODELS, DEFAULT_TEMPERATURE, DEFAULT_MAX_TURNS
-from demas.core.io import load_seed_tasks
+from demas.core.io import load_seed_tasks, write_json_atomic
 from demas.core.summaries import write_agent_csv
 from demas.benchmarks.append import parse_csv, derive_timestamp, append_row
 from demas.core import config as _cfg  # triggers local credentials loading
+from demas.core import task_cost
 
 
-def run_agent_batch(seeds: str, limit: int, model: str, *, temperature: float, jobs: int, attempts: int = 1) -> str:
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SWEEPS_DIR = os.path.join(_cfg.WORKDIR, "sweeps")
+
+
+def _new_run_dir(kind: str) -> str:
+    """Fresh timestamped run dir under sandbox/<kind>/ (the name is the BENCHMARKS timestamp)."""
+    while True:
+        d = os.path.join(_cfg.WORKDIR, kind, datetime.utcnow().strftime("%Y%m%d_%H%M%S"))
+        if not os.path.exists(d):
+            os.makedirs(d)
+            return d
+        time.sleep(1)
+
+
+def _load_state(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def run_agent_batch(seeds: str, limit: int, model: str, *, temperature: float, jobs: int, attempts: int = 1, run_dir: str = "") -> str:
     """Delegate to swebench_batch.py to leverage its parallel --jobs implementation.
-    Returns the summary.csv path parsed from stdout.
+    `run_dir` runs into (or resumes) that directory. Returns the summary.csv path parsed from stdout.
     """
     cmd = [
         sys.executable,
@@ -29,6 +53,8 @@ def run_agent_batch(seeds: str, limit: int, model: str, *, temperature: float, j
         "--attempts", str(max(1, attempts)),
         "--no-auto-append",
     ]
+    if run_dir:
+        cmd += ["--resume", run_dir]
     p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
     out = p.stdout or ""
     csv_path = ""
@@ -40,7 +66,7 @@ def run_agent_batch(seeds: str, limit: int, model: str, *, temperature: float, j
     return csv_path
 
 
-def run_baseline_batch(seeds: str, limit: int, *, jobs: int) -> str:
+def run_baseline_batch(seeds: str, limit: int, *, jobs: int, run_dir: str = "") -> str:
     cmd = [
         sys.executable,
         os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "swebench_batch.py"),
@@ -48,6 +74,8 @@ def run_baseline_batch(seeds: str, limit: int, *, jobs: int) -> str:
         "--limit", str(limit),
         "--jobs", str(max(1, jobs)),
     ]
+    if run_dir:
+        cmd += ["--resume", run_dir]
     p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
     out = p.stdout or ""
     csv_path = ""
@@ -59,6 +87,134 @@ def run_baseline_batch(seeds: str, limit: int, *, jobs: int) -> str:
     return csv_path
 
 
+def attempt1_csv(csv2: str) -> str:
+    """summary_attempt1.csv written next to an attempts=2 run's summary.csv, or "" (runs before it existed)."""
+    p = os.path.join(os.path.dirname(csv2), "summary_attempt1.csv")
+    return p if os.path.exists(p) else ""
+
+
+def _provider(model: str) -> str:
+    """Cap group of a unit; mirrors oneagent's routing (openai/* -> OpenRouter, rest -> Chutes)."""
+    if not model:
+        return "baseline"
+    return "openrouter" if model.lower().startswith("openai/") else "chutes"
+
+
+def _parse_caps(spec: str) -> Dict[str, int]:
+    """'chutes=16,openrouter=4' -> {provider: max concurrent units}."""
+    caps: Dict[str, int] = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            caps[k.strip().lower()] = max(1, int(v))
+    return caps
+
+
+def run_interleaved(units: List[Tuple[Dict[str, Any], Dict[str, Any]]], *, jobs: int, caps: Dict[str, int], on_done) -> List[float]:
+    """Run (run config, task) units, in order, on one pool of `jobs` threads.
+
+    A unit starts only while its provider is under its cap; a capped provider
+    never holds a slot that another provider's unit could use. `on_done(run, res)`
+    is called from the worker threads. Returns the unit durations.
+    """
+    from demas.benchmarks.distributed import run_unit
+    pending = list(units)
+    active: Dict[str, int] = {}
+    durations: List[float] = []
+    cond = threading.Condition()
+
+    def _next():
+        with cond:
+            while pending:
+                for i, (run, _task) in enumerate(pending):
+                    p = _provider(run["model"])
+                    if active.get(p, 0) < caps.get(p, jobs):
+                        active[p] = active.get(p, 0) + 1
+                        return pending.pop(i)
+                cond.wait()
+            return None
+
+    def _worker() -> None:
+        while True:
+            unit = _next()
+            if unit is None:
+                return
+            run, task = unit
+            t0 = time.time()
+            try:
+                res = run_unit(task, run)
+            except Exception as e:
+                res = {"task_id": task.get("task_id", ""), "error": f"worker_failed: {e}"}
+            with cond:
+                active[_provider(run["model"])] -= 1
+                durations.append(time.time() - t0)
+                cond.notify_all()
+            on_done(run, res)
+
+    threads = [threading.Thread(target=_worker, name=f"sweep-{i}") for i in range(max(1, jobs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return durations
+
+
+def _sweep_interleaved(tasks: List[Dict[str, Any]], configs: List[Tuple[str, str, str, int]], *, state: Dict[str, Any], state_path: str,
+                       sweep_dir: str, jobs: int, caps: Dict[str, int], temperature: float) -> None:
+    """All (run config x task) units through one global pool; fills state["runs"][key]["csv"] per config."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from swebench_batch import _record_path, _load_records
+    from demas.benchmarks.distributed import write_run_dir
+    hist = task_cost.load_history(_cfg.WORKDIR)
+    runs: Dict[str, Dict[str, Any]] = {}
+    done: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    units = []
+    for key, mode, model, k in configs:
+        ent = state["runs"].setdefault(key, {})
+        if not ent.get("run_dir"):
+            ent["run_dir"] = _new_run_dir("agent_batch_runs" if mode == "agent" else "batch_runs")
+        os.makedirs(os.path.join(ent["run_dir"], "logs"), exist_ok=True)
+        runs[key] = {"run_key": key, "mode": mode, "model": model, "attempts": k, "temperature": temperature,
+                     "max_turns": int(os.environ.get("MAX_TURNS", "10")), "attempt_cap_s": 60, "run_dir": ent["run_dir"]}
+        done[key] = _load_records(ent["run_dir"])
+        est = task_cost.estimate(tasks, hist, model=model, mode=mode)
+        units += [(-est[t.get("task_id", "")][0], key, t) for t in tasks if t.get("task_id", "") not in done[key]]
+    write_json_atomic(state_path, state)
+    # Slowest expected units first across every model, so no long unit starts last
+    units.sort(key=lambda u: u[0])
+    caps_s = ", ".join(f"{p}={c}" for p, c in caps.items()) or "none"
+    print(f"[interleave] {len(units)} units over {len(configs)} runs, jobs={jobs}, provider caps: {caps_s}")
+
+    errors: Dict[str, List[Dict[str, Any]]] = {key: [] for key in runs}
+    lock = threading.Lock()
+
+    def _on_done(run: Dict[str, Any], res: Dict[str, Any]) -> None:
+        # Finished rows are atomic per-task records, so an interrupted sweep resumes unit by unit
+        if res.get("task_id") and "error" not in res:
+            write_json_atomic(_record_path(run["run_dir"], res["task_id"]), res)
+        with lock:
+            if "error" in res:
+                errors[run["run_key"]].append(res)
+            else:
+                done[run["run_key"]][res.get("task_id", "")] = res
+        print(f"[{run['run_key']}] {res.get('task_id', '')} -> {res.get('tail', '')} ({res.get('status', 'error')})")
+
+    t0 = time.time()
+    os.environ.setdefault("SWE_CPU_BUDGET", str(max(1, (os.cpu_count() or 1) // max(1, jobs))))
+    durs = run_interleaved([(runs[key], t) for _, key, t in units], jobs=jobs, caps=caps, on_done=_on_done)
+    wall_s = time.time() - t0
+    sched = task_cost.schedule_report(durs, jobs=jobs, wall_s=wall_s, order="longest")
+    write_json_atomic(os.path.join(sweep_dir, "schedule.json"), sched)
+    print(f"[interleave] {json.dumps(sched)}")
+
+    order = {t.get("task_id", ""): i for i, t in enumerate(tasks)}
+    for key, run in runs.items():
+        rows = sorted(done[key].values(), key=lambda r: order.get(r.get("task_id", ""), len(order))) + errors[key]
+        state["runs"][key]["csv"] = write_run_dir(run, rows)
+    write_json_atomic(state_path, state)
+
+
 def main(argv: List[str]) -> int:
     import argparse
     ap = argparse.ArgumentParser(description="Run a full benchmark sweep across all tracked models")
@@ -67,18 +223,61 @@ def main(argv: List[str]) -> int:
     ap.add_argument("--models", nargs="*", default=None, help="Override model list; default uses TRACKED_MODELS")
     ap.add_argument("--notes", default="", help="Notes appended to BENCHMARKS.md rows (include 'full' to mark leaderboard)")
     ap.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE, help="Sampling temperature for all models (default from registry)")
-    ap.add_argument("--jobs", type=int, default=12, help="Parallel jobs per model for task runs (agent mode)")
+    ap.add_argument("--jobs", type=int, default=12, help="Parallel jobs per model for task runs (agent mode); total budget across all models with --engine interleave")
     ap.add_argument("--chutes-only", action="store_true", help="Evaluate only models routed via Chutes (exclude openai/* which go to OpenRouter)")
-    ap.add_argument("--attempts-mode", choices=["1","2","both"], default="both", help="Whether to run attempts=1, attempts=2, or both (default: both)")
+    ap.add_argument("--attempts-mode", choices=["1","2","both"], default="both", help="Report attempts=1, attempts=2, or both (default: both; both runs one attempts=2 batch and takes pass@1 from its first attempts)")
+    ap.add_argument("--resume", default="", metavar="SWEEP_DIR", help="Continue an interrupted sweep from its sandbox/sweeps/<ts> dir: finished runs are reused, partial ones resume task-by-task, appended rows are not repeated")
+    ap.add_argument("--engine", choices=["serial", "interleave"], default=os.environ.get("SWE_SWEEP_ENGINE", "serial"), help="serial: one swebench_batch run per model and attempts mode; interleave: task units of all models in one pool of --jobs (env SWE_SWEEP_ENGINE)")
+    ap.add_argument("--provider-jobs", default=os.environ.get("SWE_PROVIDER_JOBS", ""), help="Interleave: per-provider caps within --jobs, e.g. chutes=16,openrouter=4 (env SWE_PROVIDER_JOBS)")
     args = ap.parse_args(argv)
 
     if not os.environ.get("CHUTES_API_KEY"):
         print("Error: CHUTES_API_KEY not set in env.", file=sys.stderr)
         return 2
 
+    # Sweep state: run dir + CSV of every (baseline | model x attempts) run and which BENCHMARKS rows are in
+    if args.resume:
+        sweep_dir = os.path.abspath(args.resume)
+    else:
+        sweep_dir = os.path.join(SWEEPS_DIR, datetime.utcnow().strftime("%Y%m%d_%H%M%S"))
+    os.makedirs(sweep_dir, exist_ok=True)
+    state_path = os.path.join(sweep_dir, "state.json")
+    state = _load_state(state_path) if args.resume else {}
+    state.setdefault("runs", {})
+    state.setdefault("appended", [])
+    print(f"Sweep state: {state_path}" + (f" (resuming, {len(state['appended'])} rows already appended)" if args.resume else ""))
+
+    def _run(key: str, kind: str, fn) -> str:
+        ent = state["runs"].setdefault(key, {})
+        if ent.get("csv") and os.path.exists(ent["csv"]):
+            if args.resume:
+                print(f"[resume] {key}: reusing {ent['csv']}")
+            return ent["csv"]
+        if not ent.get("run_dir"):
+            ent["run_dir"] = _new_run_dir(kind)
+            write_json_atomic(state_path, state)
+        ent["csv"] = fn(ent["run_dir"])
+        write_json_atomic(state_path, state)
+        return ent["csv"]
+
+    models = args.models if args.models else TRACKED_MODELS
+    if args.chutes_only:
+        models = [m for m in models if not str(m).lower().startswith("openai/")]
+    if args.engine == "interleave":
+        tasks = load_seed_tasks(args.seeds)
+        if args.limit > 0:
+            tasks = tasks[: args.limit]
+        # "both" runs attempts=2 only; its first attempts give the attempts=1 pass rate
+        ks = {"1": [1], "2": [2], "both": [2]}[args.attempts_mode]
+        configs = [("baseline", "baseline", "", 1)] + [(f"{m}|attempts={k}", "agent", m, k) for m in models if m not in state["appended"] for k in ks]
+        configs = [c for c in configs if not (state["runs"].get(c[0], {}).get("csv") and os.path.exists(state["runs"][c[0]]["csv"]))]
+        if configs:
+            _sweep_interleaved(tasks, configs, state=state, state_path=state_path, sweep_dir=sweep_dir, jobs=max(1, args.jobs),
+                               caps=_parse_caps(args.provider_jobs), temperature=args.temperature)
+
     # Compute baseline pass_rate once
     print("Running baseline to compute pass_rate for comparison...")
-    base_csv = run_baseline_batch(args.seeds, args.limit, jobs=args.jobs)
+    base_csv = _run("baseline", "batch_runs", lambda d: run_baseline_batch(args.seeds, args.limit, jobs=args.jobs, run_dir=d))
     # Extract baseline pass_rate
     baseline_pass_rate = 0.0
     try:
@@ -92,31 +291,38 @@ def main(argv: List[str]) -> int:
         pass
     print(f"Baseline pass_rate: {baseline_pass_rate:.2f}")
 
-    models = args.models if args.models else TRACKED_MODELS
-    if args.chutes_only:
-        models = [m for m in models if not str(m).lower().startswith("openai/")]
     print(f"Sweeping {len(models)} models...")
     for m in models:
         print(f"\n=== Model: {m} ===")
+        if m in state["appended"]:
+            print(f"[resume] {m}: BENCHMARKS row already appended, skipping")
+            continue
         pr1 = pr2 = p50 = p95 = ""
         ts = ""
         info_model = m
-        if args.attempts_mode in ("1","both"):
-            csv1 = run_agent_batch(args.seeds, args.limit, m, temperature=args.temperature, jobs=args.jobs, attempts=1)
-            info1 = parse_csv(csv1)
-            ts1 = derive_timestamp(csv1)
-            pr1 = info1.get("pass_rate", "")
-            info_model = info1.get("model", m)
-            ts = ts1
+        csv1 = ""
         if args.attempts_mode in ("2","both"):
-            csv2 = run_agent_batch(args.seeds, args.limit, m, temperature=args.temperature, jobs=args.jobs, attempts=2)
+            csv2 = _run(f"{m}|attempts=2", "agent_batch_runs",
+                        lambda d: run_agent_batch(args.seeds, args.limit, m, temperature=args.temperature, jobs=args.jobs, attempts=2, run_dir=d))
             info2 = parse_csv(csv2)
             ts2 = derive_timestamp(csv2)
             pr2 = info2.get("pass_rate", "")
             p50 = info2.get("p50", "")
             p95 = info2.get("p95", "")
             info_model = info2.get("model", info_model)
-            ts = ts2 or ts
+            ts = ts2
+            if args.attempts_mode == "both":
+                # pass@1 from the first attempts of the attempts=2 run rather than a second full batch
+                csv1 = attempt1_csv(csv2)
+        if args.attempts_mode == "1" or (args.attempts_mode == "both" and not csv1):
+            csv1 = _run(f"{m}|attempts=1", "agent_batch_runs",
+                        lambda d: run_agent_batch(args.seeds, args.limit, m, temperature=args.temperature, jobs=args.jobs, attempts=1, run_dir=d))
+        if csv1:
+            info1 = parse_csv(csv1)
+            pr1 = info1.get("pass_rate", "")
+            if args.attempts_mode == "1":
+                info_model = info1.get("model", m)
+            ts = ts or derive_timestamp(csv1)
         # Always append a row, regardless of baseline comparison or notes
         append_row(
             "BENCHMARKS.md",
@@ -129,6 +335,8 @@ def main(argv: List[str]) -> int:
             (info2.get("tokens_total", "") if args.attempts_mode in ("2","both") else ""),
             pr2,
         )
+        state["appended"].append(m)
+        write_json_atomic(state_path, state)
         print(f"Appended BENCHMARKS row for {m} @ {ts} (attempts-mode={args.attempts_mode})")
     # Normalize leaderboard to best per model if notes indicate full suite
     try:
@@ -0,0 +1,204 @@
+"""
+Record/replay of model calls ("cassettes") for deterministic, offline runs.
+
+LLM_CASSETTE=record  pass calls through and append each request/response to
+                     <LLM_CASSETTE_DIR>/<model>__<task_id>__attempt<k>.jsonl
+LLM_CASSETTE=replay  serve responses from those files in recorded order; no
+                     network or API key needed
+LLM_CASSETTE_LATENCY (replay) "" = instant, "recorded" = original call duration,
+                     or a fixed number of seconds per call
+
+Calls are matched by position within an attempt rather than by request content:
+tool results embed timings and run ids, so request bytes differ between runs
+even when the trajectory is the same. A request hash is stored for diagnosis.
+
+A recorded file starts with a header naming its owner (the recording attempt's
+log path). Re-recording the same attempt replaces the take; a file owned by
+another run is never overwritten unless LLM_CASSETTE_OVERWRITE=1.
+"""
+
+import os
+import json
+import time
+import hashlib
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+from demas.core import config as _cfg
+
+
+CASSETTE_DIR = os.environ.get("LLM_CASSETTE_DIR", os.path.join(_cfg.WORKDIR, "_cassettes"))
+
+# Set while a call must not be recorded or replayed (e.g. model preflight)
+_BYPASS: "contextvars.ContextVar[bool]" = contextvars.ContextVar("demas_cassette_bypass", default=False)
+
+
+def mode() -> str:
+    m = os.environ.get("LLM_CASSETTE", "").strip().lower()
+    return m if m in ("record", "replay") else ""
+
+
+@contextmanager
+def bypass():
+    token = _BYPASS.set(True)
+    try:
+        yield
+    finally:
+        _BYPASS.reset(token)
+
+
+def cassette_path(name: str) -> str:
+    safe = "".join(ch if ch.isalnum() or ch in "._-" else "_" for ch in name) or "task"
+    return os.path.join(CASSETTE_DIR, f"{safe}.jsonl")
+
+
+def overwrite_allowed() -> bool:
+    return os.environ.get("LLM_CASSETTE_OVERWRITE", "").strip().lower() in ("1", "true", "yes")
+
+
+def _request_hash(messages: Any, tools: Any) -> str:
+    h = hashlib.sha256()
+    for m in messages or []:
+        h.update(f"{type(m).__name__}|{getattr(m, 'source', '')}|{getattr(m, 'content', m)}".encode("utf-8", "ignore"))
+    for t in tools or []:
+        h.update(str(getattr(t, "name", None) or (t.get("name") if isinstance(t, dict) else t)).encode("utf-8", "ignore"))
+    return h.hexdigest()[:16]
+
+
+def _replay_delay(entry: Dict[str, Any]) -> float:
+    lat = os.environ.get("LLM_CASSETTE_LATENCY", "").strip().lower()
+    if not lat:
+        return 0.0
+    if lat == "recorded":
+        return float(entry.get("duration_s", 0.0))
+    try:
+        return max(0.0, float(lat))
+    except ValueError:
+        return 0.0
+
+
+class Cassette:
+    """Call sequence of one (model, task, attempt); `next_seq` counts calls made so far."""
+
+    def __init__(self, name: str, owner: str = ""):
+        self.name = name
+        self.owner = owner
+        self.path = cassette_path(name)
+        self.next_seq = 0
+        self._entries: Optional[List[Dict[str, Any]]] = None
+
+    def claim(self) -> None:
+        """Start a new recording, replacing an older take only if it is ours."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        header = json.dumps({"kind": "header", "owner": self.owner, "created": time.time()}, ensure_ascii=False) + "\n"
+        try:
+            with open(self.path, "x", encoding="utf-8") as f:
+                f.write(header)
+            return
+        except FileExistsError:
+            pass
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                first = json.loads(f.readline() or "{}")
+        except (OSError, ValueError):
+            first = {}
+        prev = first.get("owner") if first.get("kind") == "header" else None
+        if prev != self.owner and not overwrite_allowed():
+            raise RuntimeError(f"cassette {self.path} belongs to another recording ({prev or 'unknown'}); "
+                               "use a separate LLM_CASSETTE_DIR or set LLM_CASSETTE_OVERWRITE=1")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(header)
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def entry(self, seq: int) -> Dict[str, Any]:
+        if self._entries is None:
+            self._entries = []
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = [e for e in (json.loads(ln) for ln in f if ln.strip()) if e.get("kind") != "header"]
+            except FileNotFoundError:
+                pass
+        if seq >= len(self._entries):
+            raise RuntimeError(f"cassette exhausted: {self.path} has {len(self._entries)} calls, call #{seq + 1} requested")
+        return self._entries[seq]
+
+
+_CASSETTES: Dict[Tuple[str, str], Cassette] = {}
+
+
+def _cassette(name: str, owner: str) -> Cassette:
+    c = _CASSETTES.get((name, owner))
+    if c is None:
+        c = Cassette(name, owner)
+        if mode() == "record":
+            c.claim()
+        _CASSETTES[(name, owner)] = c
+    return c
+
+
+def wrap_client(client: Any, name_fn: Callable[[], str], owner_fn: Callable[[], str] = lambda: "") -> Any:
+    """Record or replay `client.create` / `client.create_stream` (patched on the instance).
+
+    `name_fn` returns the cassette name of the calling attempt (e.g. "<model>__<task>__attempt1"),
+    `owner_fn` an id of the recording attempt (see `Cassette.claim`).
+    """
+    m = mode()
+    if not m:
+        return client
+    from autogen_core.models import CreateResult
+    orig_create = client.create
+    orig_stream = client.create_stream
+
+    def _take(messages: Any, tools: Any) -> "tuple[Cassette, int, str]":
+        c = _cassette(name_fn(), owner_fn())
+        seq = c.next_seq
+        c.next_seq += 1
+        return c, seq, _request_hash(messages, tools)
+
+    async def create(messages, *args, **kwargs):
+        if _BYPASS.get():
+            return await orig_create(messages, *args, **kwargs)
+        c, seq, rh = _take(messages, kwargs.get("tools"))
+        if m == "replay":
+            e = c.entry(seq)
+            await asyncio.sleep(_replay_delay(e))
+            return CreateResult.model_validate(e["result"])
+        t0 = time.time()
+        res = await orig_create(messages, *args, **kwargs)
+        c.append({"seq": seq, "kind": "create", "request_hash": rh, "duration_s": round(time.time() - t0, 3), "result": res.model_dump(mode="json")})
+        return res
+
+    async def create_stream(messages, *args, **kwargs):
+        if _BYPASS.get():
+            async for item in orig_stream(messages, *args, **kwargs):
+                yield item
+            return
+        c, seq, rh = _take(messages, kwargs.get("tools"))
+        if m == "replay":
+            e = c.entry(seq)
+            chunks = e.get("chunks") or []
+            delay = _replay_delay(e) / (len(chunks) + 1)
+            for ch in chunks:
+                await asyncio.sleep(delay)
+                yield ch
+            await asyncio.sleep(delay)
+            yield CreateResult.model_validate(e["result"])
+            return
+        t0 = time.time()
+        chunks: List[str] = []
+        async for item in orig_stream(messages, *args, **kwargs):
+            if isinstance(item, str):
+                chunks.append(item)
+            else:
+                c.append({"seq": seq, "kind": "stream", "request_hash": rh, "duration_s": round(time.time() - t0, 3), "chunks": chunks, "result": item.model_dump(mode="json")})
+            yield item
+
+    client.create = create
+    client.create_stream = create_stream
+    return client
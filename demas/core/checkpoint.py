@@ -0,0 +1,117 @@
+"""
+Checkpoint/restore of an agent's project dir and installed environment.
+
+A checkpoint `<scope>/<name>` holds:
+- a copy of the project tree under sandbox/_checkpoints/<scope>/<name>/project
+  (`cp -a --reflink=auto`: copy-on-write where the filesystem supports it; not
+  hardlinks, since install recipes overwrite build artifacts in place)
+- a committed image `demas-ckpt:<id>` of the session container (site-packages),
+  plus its `pip freeze` fingerprint so a restore only swaps containers when the
+  environment actually changed
+
+The scope groups one task's attempts (CHECKPOINT_SCOPE, set by swebench_batch.py);
+attempt 1 saves `post_install` after a successful swe_install and later attempts
+resume from it (RESUME_CHECKPOINT) instead of cloning and installing again.
+Callers drop a scope with `remove_scope` once the task is done. SWE_CHECKPOINTS=0
+disables the automatic checkpoint.
+"""
+
+import os
+import json
+import time
+import shlex
+import shutil
+import hashlib
+import subprocess
+from typing import Optional, Dict, Any, Callable, Tuple
+
+from demas.core import config as _cfg
+from demas.core.env_cache import relink_script
+
+
+CKPT_DIR = os.path.join(_cfg.WORKDIR, "_checkpoints")
+CONTAINER_CKPT_DIR = "/workspace/_checkpoints"
+IMAGE_REPO = "demas-ckpt"
+AUTO_NAME = "post_install"
+ENV_FINGERPRINT_CMD = "python -m pip freeze --all 2>/dev/null | md5sum | cut -d' ' -f1"
+
+
+def checkpoints_enabled() -> bool:
+    return os.environ.get("SWE_CHECKPOINTS", "1").strip().lower() not in ("0", "false", "no", "")
+
+
+def _safe(part: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in "._-" else "_" for ch in (part or "")) or "default"
+
+
+def project_dir(scope: str, name: str) -> str:
+    """Container path of the checkpointed project tree."""
+    return f"{CONTAINER_CKPT_DIR}/{_safe(scope)}/{_safe(name)}/project"
+
+
+def _meta_path(scope: str, name: str) -> str:
+    return os.path.join(CKPT_DIR, _safe(scope), _safe(name), "meta.json")
+
+
+def snapshot_script(proj: str, scope: str, name: str) -> str:
+    """Bash lines (run from /workspace) copying `proj` into the checkpoint."""
+    dst = shlex.quote(project_dir(scope, name))
+    return f"rm -rf {dst} && mkdir -p $(dirname {dst}) && cp -a --reflink=auto {shlex.quote(proj)} {dst}"
+
+
+def restore_script(scope: str, name: str, dest: str, origin: str = "") -> str:
+    """Bash lines (run from /workspace) that recreate `dest` from the checkpointed tree.
+
+    `origin` is the project dir the checkpoint was taken from (its "project" meta); the
+    committed image's editable install points there and is re-pointed at `dest`.
+    """
+    d = shlex.quote(dest)
+    return f"rm -rf {d} && cp -a --reflink=auto {shlex.quote(project_dir(scope, name))} {d}\n" + relink_script(origin, dest)
+
+
+def save_env(scope: str, name: str, session, run: Callable[[str], Tuple[int, str, str]], *, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Commit the session container (if any) and write the checkpoint's meta.json.
+
+    Call after the project copy (`snapshot_script`) succeeded; returns the meta.
+    """
+    entry = dict(meta or {})
+    _, fp, _ = run(ENV_FINGERPRINT_CMD)
+    tag = ""
+    if session is not None:
+        tag = f"{IMAGE_REPO}:{hashlib.sha256(f'{scope}/{name}'.encode()).hexdigest()[:20]}"
+        if not session.commit(tag):
+            tag = ""
+    entry.update({"scope": scope, "name": name, "image_tag": tag, "env_fp": (fp or "").strip(), "created": time.time()})
+    path = _meta_path(scope, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entry, f, indent=2)
+    os.replace(tmp, path)
+    return entry
+
+
+def lookup(scope: str, name: str) -> Optional[Dict[str, Any]]:
+    """Meta of a complete checkpoint (project copy + meta written), else None."""
+    try:
+        with open(_meta_path(scope, name), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except Exception:
+        return None
+    if not os.path.isdir(os.path.join(CKPT_DIR, _safe(scope), _safe(name), "project")):
+        return None
+    return entry
+
+
+def remove_scope(scope: str) -> None:
+    """Delete every checkpoint of `scope` (images and project copies)."""
+    root = os.path.join(CKPT_DIR, _safe(scope))
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    for n in names:
+        tag = (lookup(scope, n) or {}).get("image_tag", "")
+        if tag:
+            subprocess.run(["docker", "rmi", "-f", tag], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    shutil.rmtree(root, ignore_errors=True)
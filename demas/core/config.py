@@ -45,13 +45,55 @@ _load_local_env()
 
 
 DOCKER_IMAGE = os.environ.get("SWE_IMAGE", "swebench-lite:py3.10")
-WORKDIR = os.path.abspath("sandbox")
+# Host sandbox (mounted as /workspace): anchored at the repo root, so every entry point
+# and cache agrees on it whatever the cwd
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+WORKDIR = os.path.join(REPO_ROOT, "sandbox")
 
 # Per-stage timeouts (seconds)
 TIMEOUT_CLONE = int(os.environ.get("TIMEOUT_CLONE", "5"))
 TIMEOUT_INSTALL = int(os.environ.get("TIMEOUT_INSTALL", "30"))
 TIMEOUT_TEST = int(os.environ.get("TIMEOUT_TEST", "5"))
 
+# Shared pip wheelhouse and cache (host dirs under WORKDIR, i.e. /workspace/* in containers)
+WHEELHOUSE_DIR = os.path.join(WORKDIR, "_wheelhouse")
+PIP_CACHE_DIR = os.path.join(WORKDIR, "_pip_cache")
+# Appending verbose pip log inside the container; read back for per-run cache stats
+PIP_LOG = "/tmp/demas_pip.log"
+
+
+def pip_container_env() -> dict:
+    """Pip settings exported into every task container.
+
+    SWE_PIP_OFFLINE=1 additionally disables the package index, so installs must be
+    served from the wheelhouse (see `python -m demas.core.wheelhouse`).
+    """
+    env = {
+        "PIP_FIND_LINKS": "/workspace/_wheelhouse",
+        "PIP_CACHE_DIR": "/workspace/_pip_cache",
+        "PIP_DISABLE_PIP_VERSION_CHECK": "1",
+        "PIP_LOG": PIP_LOG,
+    }
+    if os.environ.get("SWE_PIP_OFFLINE", "").strip().lower() in ("1", "true", "yes"):
+        env["PIP_NO_INDEX"] = "1"
+    return env
+
+
+def test_workers() -> int:
+    """pytest-xdist workers per test run inside the task container (1 = single process).
+
+    SWE_TEST_WORKERS=<n> fixes the count; SWE_TEST_WORKERS=auto uses the per-task CPU
+    budget SWE_CPU_BUDGET (exported by swebench_batch.py as cpu_count // jobs), else
+    all host cores.
+    """
+    raw = os.environ.get("SWE_TEST_WORKERS", "1").strip().lower()
+    if raw == "auto":
+        raw = os.environ.get("SWE_CPU_BUDGET", "") or str(os.cpu_count() or 1)
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        return 1
+
 
 def apply_task_timeouts_to_env(env: dict, timeouts: object) -> dict:
     """Apply per-task timeout overrides into an environment dict.
@@ -0,0 +1,154 @@
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple
+
+from demas.core.docker_exec import DockerSession
+
+
+# Warm-up run once per container so the first pytest call does not pay cold imports
+_WARMUP_CMD = "python -c 'import pytest' >/dev/null 2>&1; python -c 'import numpy, pandas' >/dev/null 2>&1; true"
+# Fingerprint of the container-level Python environment; a change means a task installed into it
+_ENV_FINGERPRINT_CMD = "python -m pip freeze --all 2>/dev/null | md5sum | cut -d' ' -f1"
+# Kill everything except PID 1 (sleep infinity) and this shell, then clear scratch dirs
+_SCRUB_CMD = "kill -9 -1 2>/dev/null; rm -rf /tmp/* /tmp/.[!.]* 2>/dev/null; true"
+
+
+class _PooledContainer:
+    def __init__(self, session: DockerSession, fingerprint: str):
+        self.session = session
+        self.fingerprint = fingerprint
+        self.uses = 0
+
+
+class ContainerPool:
+    """Pool of pre-started, idle task containers shared by batch workers.
+
+    - Keeps up to `size` idle containers warm (same /workspace mount as sessions)
+    - acquire() hands out an idle container (hit) or starts one on demand (miss)
+    - release() scrubs the container and returns it to the pool, or recycles it when
+      it reached `max_reuse`, fails the health check, or its pip environment changed
+    - stats() reports hits/misses/recycles for the batch summary
+    """
+
+    def __init__(self, *, size: int, image: Optional[str] = None, workdir: Optional[str] = None, max_reuse: int = 4, health_timeout: int = 10):
+        self.size = max(0, int(size))
+        self.image = image
+        self.workdir = workdir
+        self.max_reuse = max(1, int(max_reuse))
+        self.health_timeout = max(1, int(health_timeout))
+        self._idle: List[_PooledContainer] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._counts: Dict[str, int] = {"hits": 0, "misses": 0, "recycled": 0, "unhealthy": 0}
+        self._refill_threads: List[threading.Thread] = []
+        # Containers currently handed out, by container name
+        self._out: Dict[str, _PooledContainer] = {}
+
+    # ---- lifecycle ----
+    def start(self) -> "ContainerPool":
+        threads = [threading.Thread(target=self._add_one, daemon=True) for _ in range(self.size)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return self
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for t in self._refill_threads:
+            t.join(timeout=30)
+        for pc in idle:
+            pc.session.close()
+
+    def __enter__(self) -> "ContainerPool":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---- internals ----
+    def _new_container(self) -> _PooledContainer:
+        s = DockerSession(image=self.image, workdir=self.workdir).start()
+        s.run(_WARMUP_CMD, timeout=60)
+        _, fp, _ = s.run(_ENV_FINGERPRINT_CMD, timeout=60)
+        return _PooledContainer(s, (fp or "").strip())
+
+    def _add_one(self) -> None:
+        try:
+            pc = self._new_container()
+        except Exception:
+            return
+        with self._lock:
+            if not self._closed and len(self._idle) < self.size:
+                self._idle.append(pc)
+                return
+        pc.session.close()
+
+    def _refill_async(self) -> None:
+        t = threading.Thread(target=self._add_one, daemon=True)
+        t.start()
+        with self._lock:
+            self._refill_threads = [x for x in self._refill_threads if x.is_alive()] + [t]
+
+    def _healthy(self, pc: _PooledContainer) -> bool:
+        code, _, _ = pc.session.run("true", timeout=self.health_timeout)
+        return code == 0
+
+    # ---- public API ----
+    def acquire(self) -> Tuple[DockerSession, bool, float]:
+        """Return (session, hit, acquire_seconds)."""
+        t0 = time.time()
+        while True:
+            with self._lock:
+                pc = self._idle.pop() if self._idle else None
+            if pc is None:
+                break
+            if self._healthy(pc):
+                pc.uses += 1
+                with self._lock:
+                    self._counts["hits"] += 1
+                    self._out[pc.session.name] = pc
+                return pc.session, True, time.time() - t0
+            with self._lock:
+                self._counts["unhealthy"] += 1
+            pc.session.close()
+            self._refill_async()
+        pc = self._new_container()
+        pc.uses = 1
+        with self._lock:
+            self._counts["misses"] += 1
+            self._out[pc.session.name] = pc
+        return pc.session, False, time.time() - t0
+
+    def release(self, session: DockerSession) -> None:
+        with self._lock:
+            pc = self._out.pop(session.name, None)
+        if pc is None:
+            session.close()
+            return
+        recycle = pc.uses >= self.max_reuse
+        if not recycle:
+            # No in-container `timeout` wrapper here: `kill -1` would take it down with the rest.
+            # The host-side cap still bounds a hung scrub; it exits 124 and the container is recycled
+            code, _, _ = pc.session.run(_SCRUB_CMD, timeout=60, in_container_timeout=False)
+            _, fp, _ = pc.session.run(_ENV_FINGERPRINT_CMD, timeout=60)
+            recycle = code != 0 or (fp or "").strip() != pc.fingerprint
+        with self._lock:
+            if not recycle and not self._closed and len(self._idle) < self.size:
+                self._idle.append(pc)
+                return
+            self._counts["recycled"] += 1
+            closed = self._closed
+        pc.session.close()
+        if not closed:
+            self._refill_async()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._counts)
+            out["idle"] = len(self._idle)
+        out["size"] = self.size
+        out["max_reuse"] = self.max_reuse
+        return out
@@ -1,7 +1,22 @@
 import os
 import shlex
 import subprocess
-from typing import Optional, Tuple
+import uuid
+import atexit
+from typing import Optional, Tuple, List
+
+from demas.core import config as _cfg
+from demas.core.spool import SpooledOutput, run_spooled
+
+
+def _env_flags(workdir: str) -> List[str]:
+    """`-e` flags for the shared pip wheelhouse/cache; makes sure both host dirs exist."""
+    for sub in ("_wheelhouse", "_pip_cache"):
+        os.makedirs(os.path.join(workdir, sub), exist_ok=True)
+    flags: List[str] = []
+    for k, v in _cfg.pip_container_env().items():
+        flags += ["-e", f"{k}={v}"]
+    return flags
 
 
 def run_docker_bash(cmd: str, *, image: Optional[str] = None, workdir: Optional[str] = None, timeout: Optional[int] = None) -> Tuple[int, str, str]:
@@ -12,20 +27,155 @@ def run_docker_bash(cmd: str, *, image: Optional[str] = None, workdir: Optional[
     - Returns (exit_code, stdout, stderr)
     - If a timeout is provided, caps the entire container run
     """
+    with run_docker_bash_spooled(cmd, image=image, workdir=workdir, timeout=timeout) as res:
+        return res.code, res.stdout(), res.stderr()
+
+
+def run_docker_bash_spooled(cmd: str, *, image: Optional[str] = None, workdir: Optional[str] = None, timeout: Optional[int] = None) -> SpooledOutput:
+    """run_docker_bash with output left on disk (see demas.core.spool); caller closes the result."""
     img = image or os.environ.get("SWE_IMAGE", "swebench-lite:py3.10")
-    wd = os.path.abspath(workdir or "sandbox")
+    wd = os.path.abspath(workdir or _cfg.WORKDIR)
     os.makedirs(wd, exist_ok=True)
-    docker_cmd = f"docker run --rm -v {wd}:/workspace -w /workspace {img} bash -lc {shlex.quote(cmd)}"
-    try:
+    env_flags = " ".join(shlex.quote(f) for f in _env_flags(wd))
+    docker_cmd = f"docker run --rm -v {wd}:/workspace -w /workspace {env_flags} {img} bash -lc {shlex.quote(cmd)}"
+    return run_spooled(docker_cmd, shell=True, timeout=timeout)
+
+
+# Sessions still alive in this process; stopped at interpreter exit as a crash guard.
+_LIVE_SESSIONS: "set[DockerSession]" = set()
+
+
+class DockerSession:
+    """A long-lived container for one task attempt; commands run via `docker exec`.
+
+    - `start()` launches `sleep infinity` detached with the same /workspace mount
+      as run_docker_bash, so tools see identical paths
+    - `run()` keeps the (exit_code, stdout, stderr) contract of run_docker_bash;
+      `run_spooled()` leaves verbose output on disk
+    - `close()` removes the container; also runs at exit and on context-manager exit
+    """
+
+    def __init__(self, *, image: Optional[str] = None, workdir: Optional[str] = None, name: Optional[str] = None):
+        self.image = image or os.environ.get("SWE_IMAGE", "swebench-lite:py3.10")
+        self.workdir = os.path.abspath(workdir or _cfg.WORKDIR)
+        self.name = name or f"demas_{uuid.uuid4().hex[:12]}"
+        self.started = False
+        # Attached sessions reuse a container someone else owns (e.g. the batch pool) and never remove it
+        self.owned = True
+
+    @classmethod
+    def attach(cls, name: str, *, workdir: Optional[str] = None) -> "DockerSession":
+        s = cls(workdir=workdir, name=name)
+        s.started = True
+        s.owned = False
+        return s
+
+    def start(self) -> "DockerSession":
+        if self.started:
+            return self
+        os.makedirs(self.workdir, exist_ok=True)
+        owner = os.environ.get("DEMAS_SESSION_OWNER", "")
         p = subprocess.run(
-            docker_cmd,
-            shell=True,
+            ["docker", "run", "-d", "--rm", "--name", self.name, "--label", "demas.session=1",
+             "--label", f"demas.owner={owner}",
+             "-v", f"{self.workdir}:/workspace", "-w", "/workspace", *_env_flags(self.workdir),
+             self.image, "sleep", "infinity"],
             text=True,
             capture_output=True,
-            timeout=timeout if timeout and timeout > 0 else None,
         )
-        return p.returncode, p.stdout, p.stderr
-    except subprocess.TimeoutExpired as e:
-        return 124, e.stdout or "", e.stderr or ""
+        if p.returncode != 0:
+            raise RuntimeError(f"docker session start failed: {p.stderr.strip()}")
+        self.started = True
+        _LIVE_SESSIONS.add(self)
+        return self
+
+    def run(self, cmd: str, *, timeout: Optional[int] = None, in_container_timeout: bool = True) -> Tuple[int, str, str]:
+        with self.run_spooled(cmd, timeout=timeout, in_container_timeout=in_container_timeout) as res:
+            return res.code, res.stdout(), res.stderr()
+
+    def run_spooled(self, cmd: str, *, timeout: Optional[int] = None, in_container_timeout: bool = True) -> SpooledOutput:
+        """`run` with output left on disk (see demas.core.spool); caller closes the result.
+
+        in_container_timeout=False caps only the host-side `docker exec` client, for
+        commands that would kill an in-container `timeout` wrapper themselves.
+        """
+        if not self.started:
+            self.start()
+        argv = ["docker", "exec", "-w", "/workspace", self.name]
+        # Cap inside the container too: killing the `docker exec` client does not stop the process
+        if timeout and timeout > 0 and in_container_timeout:
+            argv += ["timeout", "-k", "2", f"{int(timeout)}s"]
+        argv += ["bash", "-lc", cmd]
+        return run_spooled(argv, timeout=(timeout + 5) if timeout and timeout > 0 else None)
+
+    def commit(self, tag: str, *, timeout: int = 300) -> bool:
+        """Snapshot the container filesystem (excluding the /workspace mount) as image `tag`."""
+        try:
+            p = subprocess.run(["docker", "commit", self.name, tag], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+            return p.returncode == 0
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        if not self.started:
+            return
+        self.started = False
+        if not self.owned:
+            return
+        _LIVE_SESSIONS.discard(self)
+        try:
+            subprocess.run(["docker", "rm", "-f", self.name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+        except Exception:
+            pass
+
+    def __enter__(self) -> "DockerSession":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def sessions_enabled() -> bool:
+    """Persistent sessions are on by default; SWE_DOCKER_SESSION=0 restores per-call `docker run --rm`."""
+    return os.environ.get("SWE_DOCKER_SESSION", "1").strip().lower() not in ("0", "false", "no", "")
+
+
+def open_session(*, image: Optional[str] = None, workdir: Optional[str] = None, attach: bool = True, container: Optional[str] = None) -> Optional[DockerSession]:
+    """Return the session a runner should use, or None for per-call containers.
+
+    `container` (or SWE_CONTAINER, set by the batch warm pool) attaches to a
+    pre-started container unless `attach` is False (e.g. the runner needs a
+    specific image); otherwise a fresh session is started when sessions are enabled.
+    """
+    name = (container if container is not None else os.environ.get("SWE_CONTAINER", "")).strip()
+    if name and attach:
+        return DockerSession.attach(name, workdir=workdir)
+    if sessions_enabled():
+        return DockerSession(image=image, workdir=workdir).start()
+    return None
+
+
+def remove_sessions(owner: str) -> None:
+    """Force-remove session containers labelled with `owner`.
+
+    Callers that hard-kill a runner (e.g. the batch per-attempt cap) use this,
+    since atexit hooks do not run on SIGKILL.
+    """
+    if not owner:
+        return
+    try:
+        p = subprocess.run(
+            ["docker", "ps", "-aq", "--filter", f"label=demas.owner={owner}"],
+            text=True, capture_output=True, timeout=30,
+        )
+        ids = (p.stdout or "").split()
+        if ids:
+            subprocess.run(["docker", "rm", "-f", *ids], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=60)
+    except Exception:
+        pass
 
 
+@atexit.register
+def _close_live_sessions() -> None:
+    for s in list(_LIVE_SESSIONS):
+        s.close()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Content-addressed prepared-environment cache (repo@ref + installed deps).
+
+An entry is keyed by sha256(repo, ref, image, install recipe) and holds:
+- a committed Docker image (`demas-env:<key>`) with the container-level
+  site-packages after install
+- a copy of the installed project tree under sandbox/_env_cache/<key>/project
+  (in-tree build artifacts such as compiled extensions live there)
+
+Runners start their session from the cached image and copy the project tree
+instead of cloning and installing. The image's editable install still points at
+the project dir it was built in (recorded as the entry's "project"), so a restore
+under another name re-points it (`relink_script`). The index (sandbox/_env_cache/index.json)
+tracks last use and size for LRU eviction.
+
+Maintenance:
+  python -m demas.core.env_cache --list
+  python -m demas.core.env_cache --invalidate <key> | --repo <url> | --all
+  python -m demas.core.env_cache --prune
+"""
+
+import os
+import json
+import time
+import shlex
+import shutil
+import hashlib
+import subprocess
+from typing import Optional, Dict, Any, List
+
+from demas.core import config as _cfg
+from demas.core.io import file_lock
+
+
+CACHE_DIR = os.path.join(_cfg.WORKDIR, "_env_cache")
+CONTAINER_CACHE_DIR = "/workspace/_env_cache"
+INDEX_PATH = os.path.join(CACHE_DIR, "index.json")
+IMAGE_REPO = "demas-env"
+
+# LRU limits applied after every store (and by --prune)
+MAX_ENTRIES = int(os.environ.get("ENV_CACHE_MAX_ENTRIES", "50"))
+MAX_BYTES = int(float(os.environ.get("ENV_CACHE_MAX_GB", "20")) * (1 << 30))
+
+
+def cache_enabled() -> bool:
+    return os.environ.get("ENV_CACHE", "1").strip().lower() not in ("0", "false", "no", "")
+
+
+def env_key(repo: str, ref: str, image: str, recipe: str) -> str:
+    h = hashlib.sha256()
+    for part in (repo or "", ref or "", image or "", recipe or ""):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:20]
+
+
+def _read_index() -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _write_index(index: Dict[str, Dict[str, Any]]) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = INDEX_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, INDEX_PATH)
+
+
+def _image_exists(tag: str) -> bool:
+    try:
+        p = subprocess.run(["docker", "image", "inspect", tag], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+        return p.returncode == 0
+    except Exception:
+        return False
+
+
+def _image_size(tag: str) -> int:
+    try:
+        p = subprocess.run(["docker", "image", "inspect", "-f", "{{.Size}}", tag], text=True, capture_output=True, timeout=30)
+        return int((p.stdout or "0").strip() or 0)
+    except Exception:
+        return 0
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for fn in files:
+            try:
+                total += os.lstat(os.path.join(root, fn)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def project_dir(key: str) -> str:
+    """Container path of the cached project tree for `key`."""
+    return f"{CONTAINER_CACHE_DIR}/{key}/project"
+
+
+def lookup(key: str) -> Optional[Dict[str, Any]]:
+    """Return the index entry for `key` if both image and project copy exist (and mark it used)."""
+    with file_lock(INDEX_PATH + ".lock"):
+        index = _read_index()
+        entry = index.get(key)
+        if not entry:
+            return None
+        if not _image_exists(entry.get("image_tag", "")) or not os.path.isdir(os.path.join(CACHE_DIR, key, "project")):
+            # Half-evicted or externally removed: drop it so the next run rebuilds
+            index.pop(key, None)
+            _write_index(index)
+            return None
+        entry["last_used"] = time.time()
+        entry["hits"] = int(entry.get("hits", 0)) + 1
+        _write_index(index)
+        return dict(entry)
+
+
+# Rewrites editable-install pointers (.pth, editable finders/loaders, egg-links,
+# direct_url.json) in site-packages from argv[1] to argv[2]
+_RELINK_PY = r"""
+import glob, os, site, sys
+old, new = sys.argv[1], sys.argv[2]
+dirs = list(site.getsitepackages()) + [site.getusersitepackages()]
+for d in dirs:
+    for pat in ("*.pth", "*.py", "*.egg-link", "*.dist-info/direct_url.json"):
+        for p in glob.glob(os.path.join(d, pat)):
+            try:
+                with open(p, "r", encoding="utf-8") as f:
+                    text = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            if old in text:
+                with open(p, "w", encoding="utf-8") as f:
+                    f.write(text.replace(old, new))
+"""
+
+
+def relink_script(origin: str, dest: str) -> str:
+    """Bash lines (run from /workspace) re-pointing an editable install of project dir
+    `origin` at `dest`; without a recorded origin, re-run the editable install in `dest`."""
+    d = shlex.quote(dest)
+    if not origin:
+        return f"(cd {d} && python -m pip install -q -e . --no-deps --no-build-isolation >/dev/null 2>&1 || true)\n"
+    if origin == dest:
+        return ""
+    old, new = (shlex.quote(p if p.startswith("/") else f"/workspace/{p}") for p in (origin, dest))
+    return f"python -c {shlex.quote(_RELINK_PY)} {old} {new}\n"
+
+
+def restore_script(key: str, dest: str, origin: str = "") -> str:
+    """Bash lines (run from /workspace) that recreate `dest` from the cached project tree.
+
+    `origin` is the entry's original project dir (its "project" meta).
+    """
+    d = shlex.quote(dest)
+    return f"rm -rf {d} && cp -a {shlex.quote(project_dir(key))} {d}\n" + relink_script(origin, dest)
+
+
+def store(key: str, session, proj: str, *, meta: Optional[Dict[str, Any]] = None) -> bool:
+    """Snapshot an installed session: copy the project tree, then commit the container image."""
+    tag = f"{IMAGE_REPO}:{key}"
+    with file_lock(os.path.join(CACHE_DIR, f"{key}.lock")):
+        if key in _read_index():
+            return True
+        dst = project_dir(key)
+        code, _, _ = session.run(
+            f"rm -rf {shlex.quote(dst)} && mkdir -p {shlex.quote(os.path.dirname(dst))} && cp -a {shlex.quote(proj)} {shlex.quote(dst)}",
+            timeout=300,
+        )
+        if code != 0 or not session.commit(tag):
+            shutil.rmtree(os.path.join(CACHE_DIR, key), ignore_errors=True)
+            return False
+        entry = dict(meta or {})
+        entry.update({
+            "key": key,
+            "project": proj,
+            "image_tag": tag,
+            "created": time.time(),
+            "last_used": time.time(),
+            "hits": 0,
+            "size_bytes": _dir_size(os.path.join(CACHE_DIR, key)) + _image_size(tag),
+        })
+    with file_lock(INDEX_PATH + ".lock"):
+        index = _read_index()
+        index[key] = entry
+        _write_index(index)
+    evict()
+    return True
+
+
+def _remove_entry(entry: Dict[str, Any]) -> None:
+    tag = entry.get("image_tag", "")
+    if tag:
+        subprocess.run(["docker", "rmi", "-f", tag], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    shutil.rmtree(os.path.join(CACHE_DIR, entry.get("key", "_missing_")), ignore_errors=True)
+
+
+def evict(*, max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> List[str]:
+    """Drop least-recently-used entries until both limits hold; returns evicted keys."""
+    me = MAX_ENTRIES if max_entries is None else max_entries
+    mb = MAX_BYTES if max_bytes is None else max_bytes
+    evicted: List[Dict[str, Any]] = []
+    with file_lock(INDEX_PATH + ".lock"):
+        index = _read_index()
+        order = sorted(index.values(), key=lambda e: e.get("last_used", 0.0))
+        total = sum(int(e.get("size_bytes", 0)) for e in order)
+        while order and (len(order) > me or total > mb):
+            e = order.pop(0)
+            total -= int(e.get("size_bytes", 0))
+            index.pop(e.get("key"), None)
+            evicted.append(e)
+        if evicted:
+            _write_index(index)
+    for e in evicted:
+        _remove_entry(e)
+    return [e.get("key", "") for e in evicted]
+
+
+def invalidate(*, key: str = "", repo: str = "", all_entries: bool = False) -> List[str]:
+    """Remove matching entries (by key, by repo URL, or everything); returns removed keys."""
+    removed: List[Dict[str, Any]] = []
+    with file_lock(INDEX_PATH + ".lock"):
+        index = _read_index()
+        for k, e in list(index.items()):
+            if all_entries or (key and k == key) or (repo and e.get("repo") == repo):
+                removed.append(index.pop(k))
+        if removed:
+            _write_index(index)
+    for e in removed:
+        _remove_entry(e)
+    return [e.get("key", "") for e in removed]
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Inspect and maintain the prepared-environment cache")
+    ap.add_argument("--list", action="store_true", help="List cache entries (most recently used first)")
+    ap.add_argument("--invalidate", default="", help="Remove the entry with this key")
+    ap.add_argument("--repo", default="", help="Remove all entries for this repo URL")
+    ap.add_argument("--all", action="store_true", help="Remove every entry")
+    ap.add_argument("--prune", action="store_true", help="Apply LRU limits (ENV_CACHE_MAX_ENTRIES / ENV_CACHE_MAX_GB)")
+    args = ap.parse_args(argv)
+    if args.invalidate or args.repo or args.all:
+        keys = invalidate(key=args.invalidate, repo=args.repo, all_entries=args.all)
+        print(f"Invalidated {len(keys)} entr{'y' if len(keys) == 1 else 'ies'}")
+    if args.prune:
+        keys = evict()
+        print(f"Evicted {len(keys)} entr{'y' if len(keys) == 1 else 'ies'}")
+    if args.list or not (args.invalidate or args.repo or args.all or args.prune):
+        entries = sorted(_read_index().values(), key=lambda e: e.get("last_used", 0.0), reverse=True)
+        for e in entries:
+            print(f"{e.get('key')}  {e.get('repo', '')}@{(e.get('ref') or 'HEAD')[:12]}  hits={e.get('hits', 0)}  size_mb={int(e.get('size_bytes', 0)) / (1 << 20):.1f}")
+        print(f"{len(entries)} entries in {CACHE_DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main(sys.argv[1:]))
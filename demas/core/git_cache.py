@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Host-side bare-mirror cache for task checkouts.
+
+- One bare repo per repo URL under sandbox/_git_mirrors (visible as
+  /workspace/_git_mirrors inside containers)
+- Each requested ref is fetched once (depth 1) into refs/demas/<ref-key>
+- Task checkouts borrow objects via git alternates: no network, no object copy
+
+Warm-up (pre-fetch every repo/ref in a seeds file):
+  python -m demas.core.git_cache --seeds sandbox/swe_tasks.jsonl
+"""
+
+import os
+import re
+import shlex
+import hashlib
+import subprocess
+from typing import Optional, List, Dict, Any
+
+from demas.core import config as _cfg
+from demas.core.io import file_lock
+
+
+MIRROR_DIR = os.path.join(_cfg.WORKDIR, "_git_mirrors")
+CONTAINER_MIRROR_DIR = "/workspace/_git_mirrors"
+# Populating a mirror is a one-off cost, so it gets its own (larger) cap than TIMEOUT_CLONE
+MIRROR_TIMEOUT = int(os.environ.get("GIT_MIRROR_TIMEOUT", "120"))
+
+
+def mirror_enabled() -> bool:
+    return os.environ.get("GIT_MIRROR_CACHE", "1").strip().lower() not in ("0", "false", "no", "")
+
+
+def _mirror_name(repo_url: str) -> str:
+    base = re.sub(r"[^A-Za-z0-9._-]", "_", repo_url.rstrip("/").split("/")[-1] or "repo")
+    if base.endswith(".git"):
+        base = base[:-4]
+    return f"{base}_{hashlib.sha1(repo_url.encode('utf-8')).hexdigest()[:12]}.git"
+
+
+def mirror_path(repo_url: str) -> str:
+    return os.path.join(MIRROR_DIR, _mirror_name(repo_url))
+
+
+def _ref_key(ref: str) -> str:
+    if not ref:
+        return "HEAD"
+    if re.fullmatch(r"[A-Za-z0-9._-]+", ref):
+        return ref
+    return hashlib.sha1(ref.encode("utf-8")).hexdigest()
+
+
+def _git(args: List[str], *, timeout: Optional[int] = None) -> subprocess.CompletedProcess:
+    return subprocess.run(["git", *args], text=True, capture_output=True, timeout=timeout)
+
+
+def ensure_mirror(repo_url: str, ref: str = "", *, refresh: bool = False) -> str:
+    """Make sure `repo_url@ref` is in the local mirror; return its commit sha ("" on failure).
+
+    Without `refresh`, a ref fetched before is served from the mirror with no network access.
+    """
+    if not repo_url or repo_url.startswith("/workspace/"):
+        return ""
+    path = mirror_path(repo_url)
+    refname = f"refs/demas/{_ref_key(ref)}"
+    try:
+        with file_lock(path + ".lock"):
+            if not os.path.isdir(path):
+                if _git(["init", "-q", "--bare", path]).returncode != 0:
+                    return ""
+                _git(["-C", path, "remote", "add", "origin", repo_url])
+            if not refresh:
+                p = _git(["-C", path, "rev-parse", "--verify", "-q", f"{refname}^{{commit}}"])
+                if p.returncode == 0 and p.stdout.strip():
+                    return p.stdout.strip()
+            p = _git(["-C", path, "fetch", "-q", "--depth", "1", "origin", f"+{ref or 'HEAD'}:{refname}"], timeout=MIRROR_TIMEOUT)
+            if p.returncode != 0:
+                return ""
+            p = _git(["-C", path, "rev-parse", "--verify", "-q", f"{refname}^{{commit}}"])
+            return p.stdout.strip() if p.returncode == 0 else ""
+    except Exception:
+        return ""
+
+
+def checkout_script(repo_url: str, sha: str, dest: str) -> str:
+    """Bash lines (run from /workspace) that materialize `dest` at `sha` from the mirror.
+
+    The checkout references the mirror's objects via alternates and inherits its
+    shallow boundary, so git diff/apply/log behave as in a depth-1 clone.
+    """
+    m = f"{CONTAINER_MIRROR_DIR}/{_mirror_name(repo_url)}"
+    d = shlex.quote(dest)
+    return (
+        f"mkdir -p {d} && git -C {d} init -q && "
+        f"echo {shlex.quote(m + '/objects')} > {d}/.git/objects/info/alternates && "
+        f"(cp -f {shlex.quote(m + '/shallow')} {d}/.git/shallow 2>/dev/null || true) && "
+        f"git -C {d} remote add origin {shlex.quote(repo_url)} && "
+        f"git -C {d} checkout -q --detach {shlex.quote(sha)}\n"
+    )
+
+
+def warm(tasks: List[Dict[str, Any]], *, refresh: bool = False, jobs: int = 4) -> Dict[str, str]:
+    """Pre-fetch every task's repo@ref; returns {task_id: sha or ''}."""
+    from concurrent.futures import ThreadPoolExecutor
+    out: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as ex:
+        futs = {ex.submit(ensure_mirror, t.get("repo", ""), t.get("ref", "") or "", refresh=refresh): t for t in tasks}
+        for fut, t in futs.items():
+            out[t.get("task_id", "") or t.get("repo", "")] = fut.result()
+    return out
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+    from demas.core.io import load_seed_tasks
+    ap = argparse.ArgumentParser(description="Pre-fetch repo@ref for every task into the local git mirror cache")
+    ap.add_argument("--seeds", default=os.path.join("sandbox", "swe_tasks.jsonl"), help="Seed tasks JSONL (default: sandbox/swe_tasks.jsonl)")
+    ap.add_argument("--refresh", action="store_true", help="Re-fetch refs even if already mirrored (e.g. moving branches)")
+    ap.add_argument("--jobs", type=int, default=4, help="Parallel fetches (default: 4)")
+    args = ap.parse_args(argv)
+    res = warm(load_seed_tasks(args.seeds), refresh=args.refresh, jobs=args.jobs)
+    ok = sum(1 for v in res.values() if v)
+    for tid, sha in res.items():
+        print(f"{tid} -> {sha[:12] if sha else '(failed)'}")
+    print(f"Mirrored {ok}/{len(res)} tasks into {MIRROR_DIR}")
+    return 0 if ok == len(res) else 1
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main(sys.argv[1:]))
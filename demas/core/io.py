@@ -1,4 +1,6 @@
+import os
 import json
+from contextlib import contextmanager
 from typing import List, Dict, Any, Tuple
 
 
@@ -48,3 +50,30 @@ def extract_pytest_tail(stdout: str, stderr: str) -> str:
         pass
     return "(no output)"
 
+
+
+def write_json_atomic(path: str, obj: Any) -> None:
+    """Write `obj` as JSON via temp file + fsync + rename: readers see the old or the new file, never a torn one."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive inter-process lock on `path` (created if missing).
+
+    Used for host-side caches that parallel batch workers share.
+    """
+    import fcntl
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
@@ -0,0 +1,190 @@
+"""
+Buffered JSONL writer for agent transcripts.
+
+`get(path).write(record)` enqueues the record and returns right away. A background
+thread drains the queue in batches, serializes the records and appends them with
+one write per batch. The file stays open for the logger's lifetime.
+
+- Bounded queue (SWE_LOG_QUEUE, default 10000 records): a full queue blocks the
+  caller rather than dropping records, since batch runners read results back from the log
+- SWE_LOG_FSYNC: "none" (default, same durability as before), "batch" (fsync after
+  every batch write) or "close" (fsync once when the log is closed)
+- SWE_LOG_GZIP=1 writes `<path>.gz` instead; read logs with `iter_lines(path)`,
+  which picks up either form and tolerates a gzip stream that was never closed
+- `close(path)` / `close_all()` drain and close within SWE_LOG_CLOSE_TIMEOUT_S
+  (default 10); `close_all` also runs at interpreter exit
+
+Records are written as soon as the flusher picks them up, so only records still
+queued are lost if the process is killed (SIGKILL skips the exit hook).
+"""
+
+import os
+import gzip
+import json
+import queue
+import atexit
+import threading
+from typing import Optional, Dict, Any, Iterator
+
+
+MAX_QUEUE = int(os.environ.get("SWE_LOG_QUEUE", "10000"))
+# Records serialized per write
+BATCH_MAX = 512
+CLOSE_TIMEOUT_S = float(os.environ.get("SWE_LOG_CLOSE_TIMEOUT_S", "10"))
+FSYNC_POLICIES = ("none", "batch", "close")
+
+_STOP = object()
+
+
+def fsync_policy() -> str:
+    p = os.environ.get("SWE_LOG_FSYNC", "none").strip().lower()
+    return p if p in FSYNC_POLICIES else "none"
+
+
+def gzip_enabled() -> bool:
+    return os.environ.get("SWE_LOG_GZIP", "0").strip().lower() in ("1", "true", "yes")
+
+
+class JsonlLogger:
+    """Append-only JSONL file fed by a bounded queue and one flusher thread."""
+
+    def __init__(self, path: str, *, compress: Optional[bool] = None, fsync: Optional[str] = None, max_queue: Optional[int] = None):
+        compress = gzip_enabled() if compress is None else compress
+        self.path = path + ".gz" if compress and not path.endswith(".gz") else path
+        self.compress = compress
+        self.fsync = fsync or fsync_policy()
+        self.written = 0
+        self.batches = 0
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, max_queue or MAX_QUEUE))
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"jsonl-log:{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if not self._closed:
+            self._q.put(record)
+
+    def flush(self, timeout: float = CLOSE_TIMEOUT_S) -> bool:
+        """Wait until everything queued so far is on disk; False on timeout."""
+        if self._closed:
+            return not self._thread.is_alive()
+        done = threading.Event()
+        self._q.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = CLOSE_TIMEOUT_S) -> bool:
+        """Drain, close the file and stop the flusher; False if it did not finish in time."""
+        if not self._closed:
+            self._closed = True
+            self._q.put(_STOP)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _open(self):
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        if self.compress:
+            # Appends add a gzip member; readers see one concatenated stream
+            return gzip.open(self.path, "at", encoding="utf-8")
+        return open(self.path, "a", encoding="utf-8")
+
+    def _sync(self, f) -> None:
+        try:
+            f.flush()
+            os.fsync((f.buffer.fileobj if self.compress else f).fileno())
+        except Exception:
+            pass
+
+    def _run(self) -> None:
+        try:
+            f = self._open()
+        except Exception:
+            f = None
+        stop = False
+        while not stop:
+            items = [self._q.get()]
+            while len(items) < BATCH_MAX:
+                try:
+                    items.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            events = []
+            for it in items:
+                if it is _STOP:
+                    stop = True
+                elif isinstance(it, threading.Event):
+                    events.append(it)
+                else:
+                    try:
+                        lines.append(json.dumps(it, ensure_ascii=False) + "\n")
+                    except Exception:
+                        pass
+            if f is not None and lines:
+                try:
+                    f.write("".join(lines))
+                    f.flush()
+                    if self.fsync == "batch":
+                        self._sync(f)
+                    self.written += len(lines)
+                    self.batches += 1
+                except Exception:
+                    pass
+            for ev in events:
+                ev.set()
+        if f is not None:
+            if self.fsync != "none":
+                self._sync(f)
+            try:
+                f.close()
+            except Exception:
+                pass
+
+
+_LOGGERS: Dict[str, JsonlLogger] = {}
+_LOCK = threading.Lock()
+
+
+def get(path: str) -> JsonlLogger:
+    """Open logger for `path` (one per path per process)."""
+    with _LOCK:
+        lg = _LOGGERS.get(path)
+        if lg is None:
+            lg = _LOGGERS[path] = JsonlLogger(path)
+        return lg
+
+
+def close(path: str, timeout: float = CLOSE_TIMEOUT_S) -> bool:
+    """Flush and close the logger for `path`; a later `get` reopens it in append mode."""
+    with _LOCK:
+        lg = _LOGGERS.pop(path, None)
+    return lg.close(timeout) if lg is not None else True
+
+
+def close_all(timeout: float = CLOSE_TIMEOUT_S) -> None:
+    with _LOCK:
+        loggers = list(_LOGGERS.values())
+        _LOGGERS.clear()
+    for lg in loggers:
+        lg.close(timeout)
+
+
+atexit.register(close_all)
+
+
+def iter_lines(path: str) -> Iterator[str]:
+    """Lines of a JSONL log written to `path` or `path`.gz (missing file -> nothing)."""
+    if os.path.isfile(path):
+        opener = gzip.open if path.endswith(".gz") else open
+    elif os.path.isfile(path + ".gz"):
+        path, opener = path + ".gz", gzip.open
+    else:
+        return
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                yield line
+        except EOFError:
+            # Gzip stream still open (writer running or killed): keep what was flushed
+            return
@@ -0,0 +1,91 @@
+"""
+Stage accounting for the pipelined batch scheduler (swebench_batch.py --pipeline).
+
+The scheduler runs three stages with their own worker pools:
+- prepare: clone + install into the prepared-environment cache (I/O bound)
+- agent:   model-bound attempts, started on an already prepared workspace
+- test:    CPU-bound pytest runs issued by the agents' tools; `test_slot()` caps
+           how many run at once across all attempts in the process
+
+Each Stage records busy time, time spent waiting for input and time blocked on a
+full downstream queue, so `report()` shows where the pipeline stalls.
+"""
+
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Optional, Dict, Any, Iterator
+
+
+class Stage:
+    """Worker-pool bookkeeping for one stage; safe to update from threads and coroutines."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.items = 0
+        self.busy_s = 0.0
+        self.wait_s = 0.0
+        self.blocked_s = 0.0
+        self.peak = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._sem = threading.BoundedSemaphore(self.workers)
+
+    def add(self, *, busy: float = 0.0, wait: float = 0.0, blocked: float = 0.0, items: int = 0) -> None:
+        with self._lock:
+            self.busy_s += busy
+            self.wait_s += wait
+            self.blocked_s += blocked
+            self.items += items
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """Count the body as one busy item (also usable around an `await` in a coroutine worker)."""
+        t0 = time.time()
+        with self._lock:
+            self._active += 1
+            self.peak = max(self.peak, self._active)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+            self.add(busy=time.time() - t0, items=1)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Blocking slot (for worker threads): waits for one of `workers` slots, then tracks the body."""
+        t0 = time.time()
+        self._sem.acquire()
+        self.add(wait=time.time() - t0)
+        try:
+            with self.track():
+                yield
+        finally:
+            self._sem.release()
+
+    def report(self, wall_s: float) -> Dict[str, Any]:
+        cap = self.workers * max(wall_s, 1e-9)
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "busy_s": round(self.busy_s, 3),
+            "wait_s": round(self.wait_s, 3),
+            "blocked_s": round(self.blocked_s, 3),
+            "peak_concurrency": self.peak,
+            "utilization": round(min(1.0, self.busy_s / cap), 3),
+        }
+
+
+_TEST_STAGE: Optional[Stage] = None
+
+
+def set_test_stage(stage: Optional[Stage]) -> None:
+    global _TEST_STAGE
+    _TEST_STAGE = stage
+
+
+def test_slot():
+    """Slot of the pipeline's test stage, or a no-op outside the pipelined scheduler."""
+    return _TEST_STAGE.slot() if _TEST_STAGE is not None else nullcontext()
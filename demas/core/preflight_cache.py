@@ -0,0 +1,62 @@
+"""
+Shared, file-backed cache of model preflight results.
+
+`pick_ready_model` consults it before streaming a probe, and the batch runner
+refreshes it once for all candidates up front, so per-attempt subprocesses
+skip the round trip on a fresh entry.
+
+Entries expire after PREFLIGHT_TTL_S seconds (default 600); failures expire
+after PREFLIGHT_NEG_TTL_S (default 120) so a recovering model is retried soon.
+A failure only steers candidate selection: an explicitly requested model is
+probed again rather than failed from the cache.
+PREFLIGHT_TTL_S=0 disables the cache.
+"""
+
+import os
+import json
+import time
+from typing import Optional, Dict, Any
+
+from demas.core import config as _cfg
+from demas.core.io import file_lock
+
+
+CACHE_PATH = os.path.join(_cfg.WORKDIR, "_preflight_cache.json")
+TTL_S = float(os.environ.get("PREFLIGHT_TTL_S", "600"))
+NEG_TTL_S = float(os.environ.get("PREFLIGHT_NEG_TTL_S", "120"))
+
+
+def _read() -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(CACHE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def get(model: str) -> Optional[bool]:
+    """Cached availability for `model`, or None when missing/expired."""
+    if TTL_S <= 0:
+        return None
+    e = _read().get(model)
+    if not isinstance(e, dict):
+        return None
+    ok = bool(e.get("ok"))
+    age = time.time() - float(e.get("t", 0))
+    return ok if age < (TTL_S if ok else min(TTL_S, NEG_TTL_S)) else None
+
+
+def put(model: str, ok: bool) -> None:
+    if TTL_S <= 0:
+        return
+    try:
+        with file_lock(CACHE_PATH + ".lock"):
+            data = _read()
+            data[model] = {"ok": bool(ok), "t": time.time()}
+            tmp = CACHE_PATH + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, CACHE_PATH)
+    except Exception:
+        pass
@@ -0,0 +1,136 @@
+"""
+Structured pytest results from JUnit XML.
+
+Test commands add `junit_flag(...)`, which makes pytest write its report under the
+mounted sandbox (/workspace/_reports). The host then parses it once with
+`collect(...)` into per-test outcomes, durations and collection errors, so pass/fail
+no longer depends on scraping a summary line from stdout.
+"""
+
+import os
+import uuid
+import xml.etree.ElementTree as ET
+from typing import Optional, Dict, Any, List, Tuple
+
+from demas.core import config as _cfg
+
+
+REPORTS_DIR = os.path.join(_cfg.WORKDIR, "_reports")
+CONTAINER_REPORTS_DIR = "/workspace/_reports"
+
+
+def junit_flag(name: Optional[str] = None) -> Tuple[str, str]:
+    """Return (pytest args, host path of the report) for a new report file."""
+    fn = f"{name or uuid.uuid4().hex}.xml"
+    return f"--junitxml={CONTAINER_REPORTS_DIR}/{fn} -o junit_family=xunit1", os.path.join(REPORTS_DIR, fn)
+
+
+def mkdir_cmd() -> str:
+    return f"mkdir -p {CONTAINER_REPORTS_DIR}"
+
+
+def shard_flag(workers: Optional[int] = None) -> str:
+    """pytest args sharding the run across `workers` xdist processes ("" for one).
+
+    The xdist controller merges worker results into the usual terminal summary and the
+    one JUnit report. Expands to nothing when pytest-xdist is missing from the image.
+    """
+    n = _cfg.test_workers() if workers is None else workers
+    if n <= 1:
+        return ""
+    return f"$(python -c 'import xdist' >/dev/null 2>&1 && echo '-n {int(n)}')"
+
+
+def _nodeid(classname: str, name: str, file: str = "") -> str:
+    """pytest node id from a JUnit testcase: `file::Class::name` for class-based tests.
+
+    classname is the dotted module path plus any test classes; with a `file` attribute
+    (xunit1) the classes are what follows the module, else the trailing capitalized parts.
+    """
+    parts = [p for p in classname.split(".") if p]
+    if file:
+        mod = file[:-3].replace("/", ".").split(".") if file.endswith(".py") else []
+        classes = parts[len(mod):] if mod and parts[:len(mod)] == mod else []
+    else:
+        n = len(parts)
+        while n > 1 and parts[n - 1][:1].isupper():
+            n -= 1
+        classes = parts[n:]
+        file = "/".join(parts[:n]) + ".py" if parts else ""
+    return "::".join([file, *classes, name]) if file else name
+
+
+def parse_junit(path: str) -> Optional[Dict[str, Any]]:
+    """Parse a JUnit XML file into a report dict (None if missing/unreadable)."""
+    try:
+        root = ET.parse(path).getroot()
+    except Exception:
+        return None
+    cases: List[Dict[str, Any]] = []
+    collection_errors: List[str] = []
+    for tc in root.iter("testcase"):
+        nodeid = _nodeid(tc.get("classname", "") or "", tc.get("name", "") or "", tc.get("file") or "")
+        outcome = "passed"
+        message = ""
+        for tag in ("failure", "error", "skipped"):
+            el = tc.find(tag)
+            if el is not None:
+                outcome = {"failure": "failed", "error": "error", "skipped": "skipped"}[tag]
+                message = (el.get("message") or "")[:500]
+                break
+        if outcome == "error" and "collection failure" in message.lower():
+            collection_errors.append(f"{nodeid}: {message}")
+        try:
+            dur = float(tc.get("time") or 0.0)
+        except ValueError:
+            dur = 0.0
+        cases.append({"nodeid": nodeid, "outcome": outcome, "duration_s": round(dur, 4), "message": message})
+    counts = {k: sum(1 for c in cases if c["outcome"] == k) for k in ("passed", "failed", "error", "skipped")}
+    suite = root if root.tag == "testsuite" else root.find("testsuite")
+    try:
+        wall = float((suite.get("time") if suite is not None else None) or sum(c["duration_s"] for c in cases))
+    except ValueError:
+        wall = 0.0
+    return {
+        "tests": len(cases),
+        "passed": counts["passed"],
+        "failed": counts["failed"],
+        "errors": counts["error"],
+        "skipped": counts["skipped"],
+        "duration_s": round(wall, 3),
+        "collection_errors": collection_errors,
+        "cases": cases,
+    }
+
+
+def collect(host_path: str) -> Optional[Dict[str, Any]]:
+    """Parse and remove a report written by a junit_flag() run."""
+    rep = parse_junit(host_path)
+    try:
+        os.remove(host_path)
+    except OSError:
+        pass
+    return rep
+
+
+def is_pass(report: Dict[str, Any]) -> bool:
+    return report.get("passed", 0) > 0 and not report.get("failed") and not report.get("errors")
+
+
+def summary_line(report: Dict[str, Any]) -> str:
+    """pytest-style terminal summary, e.g. "1 failed, 3 passed in 0.52s"."""
+    parts = []
+    for key, label in (("failed", "failed"), ("passed", "passed"), ("skipped", "skipped"), ("errors", "error")):
+        n = int(report.get(key, 0) or 0)
+        if n:
+            parts.append(f"{n} {label}{'s' if key == 'errors' and n > 1 else ''}")
+    return f"{', '.join(parts) or 'no tests ran'} in {float(report.get('duration_s', 0.0)):.2f}s"
+
+
+def compact(report: Dict[str, Any], *, max_items: int = 20) -> Dict[str, Any]:
+    """Counts plus failing/erroring node ids: small enough for JSONL log records."""
+    bad = [c["nodeid"] for c in report.get("cases", []) if c["outcome"] in ("failed", "error")]
+    out = {k: report.get(k) for k in ("tests", "passed", "failed", "errors", "skipped", "duration_s")}
+    out["failing"] = bad[:max_items]
+    out["collection_errors"] = list(report.get("collection_errors", []))[:max_items]
+    return out
@@ -0,0 +1,284 @@
+"""
+Pre-forked pytest server for warm reruns inside a task container.
+
+SWE_PYTEST_SERVER=1 swaps `python -m pytest ARGS` for
+`python /workspace/_tools/pytest_server.py -- ARGS` (this file, copied into the
+sandbox). The client is stdlib-only and behaves like pytest: same args, stdout,
+stderr and exit code.
+
+- No server for the project dir yet: the client starts one in the background and
+  runs this request cold (exec of `python -m pytest`).
+- The server imports pytest, SWE_PYTEST_SERVER_PRELOAD (default "numpy,pandas")
+  and the project's top-level packages once, then forks a child per request that
+  runs `pytest.main(ARGS)` against the current tree with the request's env and cwd.
+- Before each request the server compares mtimes of every module it preloaded; if
+  a patch or install touched one it exits, and the request (and next server) starts cold.
+- A dropped client (e.g. killed by `timeout`) kills the child; servers exit after
+  SWE_PYTEST_SERVER_IDLE_S (default 600) idle seconds.
+
+Needs a long-lived container (sessions or the warm pool); with per-call
+`docker run --rm` the runner keeps plain `python -m pytest`.
+"""
+
+import os
+import sys
+import json
+import socket
+import select
+import signal
+import hashlib
+import tempfile
+
+CONTAINER_PATH = "/workspace/_tools/pytest_server.py"
+COLD_CMD = "python -m pytest"
+_SKIP_PRELOAD = ("test", "tests", "testing", "doc", "docs", "benchmarks", "examples", "build")
+_installed = False
+
+
+# ---------------- host side ----------------
+def server_enabled() -> bool:
+    return os.environ.get("SWE_PYTEST_SERVER", "0").strip().lower() in ("1", "true", "yes")
+
+
+def install() -> None:
+    """Copy this script to sandbox/_tools/ (visible as CONTAINER_PATH in containers)."""
+    global _installed
+    if _installed:
+        return
+    from demas.core import config as _cfg
+    dst = os.path.join(_cfg.WORKDIR, "_tools", "pytest_server.py")
+    with open(os.path.abspath(__file__), "rb") as f:
+        src = f.read()
+    try:
+        with open(dst, "rb") as f:
+            same = f.read() == src
+    except OSError:
+        same = False
+    if not same:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(src)
+        os.replace(tmp, dst)
+    _installed = True
+
+
+def pytest_cmd(long_lived: bool) -> str:
+    """Command that runs pytest with the following args: warm server when enabled."""
+    if not (long_lived and server_enabled()):
+        return COLD_CMD
+    try:
+        install()
+    except Exception:
+        return COLD_CMD
+    return f"python {CONTAINER_PATH} --"
+
+
+# ---------------- container side ----------------
+def _sock_path(project: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f"demas_pytest_{hashlib.md5(project.encode()).hexdigest()[:12]}.sock")
+
+
+def _cold(args: list) -> None:
+    os.execvp(sys.executable, [sys.executable, "-m", "pytest", *args])
+
+
+def _spawn_server(sock: str, project: str) -> None:
+    import subprocess
+    try:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", sock, project],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True, close_fds=True)
+    except Exception:
+        pass
+
+
+def client(args: list) -> None:
+    project = os.getcwd()
+    sock = _sock_path(project)
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(sock)
+    except OSError:
+        s.close()
+        _spawn_server(sock, project)
+        _cold(args)
+    s.sendall((json.dumps({"args": args, "cwd": project, "env": dict(os.environ)}) + "\n").encode())
+    buf = b""
+    while True:
+        chunk = s.recv(65536)
+        if not chunk:
+            break
+        buf += chunk
+    s.close()
+    try:
+        resp = json.loads(buf.decode("utf-8", "replace"))
+    except ValueError:
+        resp = {"stale": True}
+    if resp.get("stale"):
+        _spawn_server(sock, project)
+        _cold(args)
+    sys.stdout.write(resp.get("out", ""))
+    sys.stderr.write(resp.get("err", ""))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    sys.exit(int(resp.get("code", 1)))
+
+
+def _preload(project: str) -> None:
+    import importlib
+    import pytest  # noqa: F401
+    names = [n.strip() for n in os.environ.get("SWE_PYTEST_SERVER_PRELOAD", "numpy,pandas").split(",") if n.strip()]
+    for base in (project, os.path.join(project, "src")):
+        try:
+            for n in sorted(os.listdir(base)):
+                if n not in _SKIP_PRELOAD and n.isidentifier() and os.path.isfile(os.path.join(base, n, "__init__.py")):
+                    names.append(n)
+        except OSError:
+            pass
+    for n in names:
+        try:
+            importlib.import_module(n)
+        except BaseException:
+            pass
+
+
+def _module_mtimes() -> dict:
+    out = {}
+    for m in list(sys.modules.values()):
+        f = getattr(m, "__file__", None)
+        if f:
+            try:
+                out[f] = os.stat(f).st_mtime_ns
+            except OSError:
+                pass
+    return out
+
+
+def _stale(snapshot: dict) -> bool:
+    for f, mt in snapshot.items():
+        try:
+            if os.stat(f).st_mtime_ns != mt:
+                return True
+        except OSError:
+            return True
+    return False
+
+
+def _run_child(req: dict, out_path: str, err_path: str) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    os.environ.clear()
+    os.environ.update(req.get("env") or {})
+    os.chdir(req.get("cwd") or "/workspace")
+    for p in reversed([p for p in os.environ.get("PYTHONPATH", "").split(":") if p]):
+        if p not in sys.path:
+            sys.path.insert(0, p)
+    fo = os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    fe = os.open(err_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    os.dup2(fo, 1)
+    os.dup2(fe, 2)
+    code = 1
+    try:
+        import pytest
+        sys.argv = ["pytest", *req.get("args", [])]
+        code = int(pytest.main(req.get("args", [])))
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        os._exit(code)
+
+
+def _handle(conn: socket.socket, req: dict) -> None:
+    fd_o, out_path = tempfile.mkstemp(prefix="demas_pt_out_")
+    fd_e, err_path = tempfile.mkstemp(prefix="demas_pt_err_")
+    os.close(fd_o)
+    os.close(fd_e)
+    pid = os.fork()
+    if pid == 0:
+        conn.close()
+        _run_child(req, out_path, err_path)
+    code = None
+    while code is None:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            code = os.waitstatus_to_exitcode(status)
+            break
+        r, _, _ = select.select([conn], [], [], 0.05)
+        if r and not conn.recv(1, socket.MSG_PEEK):
+            # Client went away (timeout/kill): stop the run
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            break
+    try:
+        if code is not None:
+            with open(out_path, "r", encoding="utf-8", errors="replace") as f:
+                out = f.read()
+            with open(err_path, "r", encoding="utf-8", errors="replace") as f:
+                err = f.read()
+            conn.sendall(json.dumps({"code": code if code >= 0 else 128 - code, "out": out, "err": err}).encode())
+    except OSError:
+        pass
+    finally:
+        for p in (out_path, err_path):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+def serve(sock: str, project: str) -> None:
+    os.chdir(project)
+    for p in reversed([p for p in os.environ.get("PYTHONPATH", "").split(":") if p]):
+        if p not in sys.path:
+            sys.path.insert(0, p)
+    _preload(project)
+    snapshot = _module_mtimes()
+    idle_s = float(os.environ.get("SWE_PYTEST_SERVER_IDLE_S", "600"))
+    try:
+        os.remove(sock)
+    except OSError:
+        pass
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    srv.bind(sock)
+    srv.listen(8)
+    srv.settimeout(idle_s)
+    try:
+        while True:
+            try:
+                conn, _ = srv.accept()
+            except socket.timeout:
+                return
+            conn.settimeout(None)
+            with conn:
+                # Close the reader right away: an open makefile() keeps the socket alive past `with conn`
+                with conn.makefile("rb") as f:
+                    line = f.readline()
+                try:
+                    req = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    continue
+                if _stale(snapshot):
+                    conn.sendall(b'{"stale": true}')
+                    return
+                _handle(conn, req)
+    finally:
+        srv.close()
+        try:
+            os.remove(sock)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == "--serve":
+        serve(sys.argv[2], sys.argv[3])
+    else:
+        client(sys.argv[2:] if len(sys.argv) > 1 and sys.argv[1] == "--" else sys.argv[1:])
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Cross-process limiter for model calls, keyed by provider and model.
+
+State lives in a small JSON file per (provider, model) under sandbox/_ratelimit,
+guarded by a file lock, so batch workers, sweep children and in-process async
+attempts all draw from the same budget:
+- max in-flight requests (slots keyed by host and pid; leases of dead local
+  processes are reclaimed at once, other hosts' slots when their lease expires)
+- requests/minute and tokens/minute token buckets (token use is settled after
+  the call from reported usage)
+- adaptive cooldown on 429: exponential backoff shared by every caller, halved
+  again on each success
+
+Limits come from the env; a provider-specific variable wins over the generic one:
+  LLM_MAX_INFLIGHT[_CHUTES|_OPENROUTER]  (default 8; 0 = unlimited)
+  LLM_RPM[_<PROVIDER>], LLM_TPM[_<PROVIDER>]  (default 0 = unlimited)
+  LLM_RATELIMIT=0 disables the limiter
+
+Inspect current state:
+  python -m demas.core.ratelimit
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import socket
+import asyncio
+from typing import Optional, Dict, Any, List, Callable
+
+from demas.core import config as _cfg
+from demas.core.io import file_lock
+
+
+STATE_DIR = os.path.join(_cfg.WORKDIR, "_ratelimit")
+# A slot held longer than this is assumed leaked (e.g. a SIGKILLed worker on another host)
+LEASE_S = 900.0
+HOST = socket.gethostname()
+MAX_BACKOFF_S = 60.0
+_POLL_S = 0.25
+
+
+def limiter_enabled() -> bool:
+    return os.environ.get("LLM_RATELIMIT", "1").strip().lower() not in ("0", "false", "no", "")
+
+
+def _limit(name: str, provider: str, default: float) -> float:
+    raw = os.environ.get(f"{name}_{provider.upper()}", os.environ.get(name, ""))
+    try:
+        return float(raw) if raw.strip() else default
+    except ValueError:
+        return default
+
+
+def _slot_alive(slot: Dict[str, Any]) -> bool:
+    """Pids only mean something on their own host; remote slots live until their lease expires."""
+    if slot.get("host", HOST) != HOST:
+        return True
+    return _pid_alive(int(slot.get("pid", 0)))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except Exception:
+        return True
+
+
+class RateLimiter:
+    """Shared budget for one (provider, model); see module docstring."""
+
+    def __init__(self, provider: str, model: str, *, max_inflight: Optional[int] = None, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.provider = provider
+        self.model = model
+        self.max_inflight = int(_limit("LLM_MAX_INFLIGHT", provider, 8) if max_inflight is None else max_inflight)
+        self.rpm = float(_limit("LLM_RPM", provider, 0) if rpm is None else rpm)
+        self.tpm = float(_limit("LLM_TPM", provider, 0) if tpm is None else tpm)
+        name = re.sub(r"[^A-Za-z0-9._-]", "_", f"{provider}__{model}")
+        self.path = os.path.join(STATE_DIR, f"{name}.json")
+
+    # ---- state file ----
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    def _write(self, state: Dict[str, Any]) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def _refill(self, state: Dict[str, Any], now: float) -> None:
+        last = float(state.get("refilled_at", now))
+        dt = max(0.0, now - last)
+        if self.rpm > 0:
+            state["req_tokens"] = min(self.rpm, float(state.get("req_tokens", self.rpm)) + dt * self.rpm / 60.0)
+        if self.tpm > 0:
+            state["tok_tokens"] = min(self.tpm, float(state.get("tok_tokens", self.tpm)) + dt * self.tpm / 60.0)
+        state["refilled_at"] = now
+        state["slots"] = {
+            sid: s for sid, s in (state.get("slots") or {}).items()
+            if now - float(s.get("t", 0)) < LEASE_S and _slot_alive(s)
+        }
+
+    def _try_acquire(self, est_tokens: int) -> "tuple[Optional[str], float]":
+        """One locked check; returns (slot_id, 0) on success or (None, suggested_wait_s)."""
+        with file_lock(self.path + ".lock"):
+            now = time.time()
+            state = self._read()
+            self._refill(state, now)
+            wait = 0.0
+            cooldown = float(state.get("cooldown_until", 0.0))
+            if now < cooldown:
+                wait = cooldown - now
+            elif self.max_inflight > 0 and len(state["slots"]) >= self.max_inflight:
+                wait = _POLL_S
+            elif self.rpm > 0 and state["req_tokens"] < 1.0:
+                wait = (1.0 - state["req_tokens"]) * 60.0 / self.rpm
+            elif self.tpm > 0 and state["tok_tokens"] < min(est_tokens, self.tpm):
+                wait = (min(est_tokens, self.tpm) - state["tok_tokens"]) * 60.0 / self.tpm
+            if wait > 0:
+                self._write(state)
+                return None, wait
+            if self.rpm > 0:
+                state["req_tokens"] -= 1.0
+            if self.tpm > 0:
+                state["tok_tokens"] -= est_tokens
+            sid = uuid.uuid4().hex[:12]
+            state["slots"][sid] = {"host": HOST, "pid": os.getpid(), "t": now, "est": est_tokens}
+            self._write(state)
+            return sid, 0.0
+
+    # ---- public API ----
+    async def acquire(self, est_tokens: int = 0) -> "tuple[str, float]":
+        """Wait for a slot; returns (slot_id, queue_wait_seconds).
+
+        The locked state update runs in a worker thread so a lock held by another
+        process does not stall the event loop.
+        """
+        t0 = time.time()
+        while True:
+            sid, wait = await asyncio.to_thread(self._try_acquire, max(0, int(est_tokens)))
+            if sid is not None:
+                return sid, time.time() - t0
+            await asyncio.sleep(min(max(wait, 0.01), _POLL_S * 4))
+
+    def release(self, slot_id: str, *, tokens_used: Optional[int] = None, rate_limited: bool = False) -> None:
+        """Free the slot, settle token use against the estimate, and adapt the cooldown."""
+        with file_lock(self.path + ".lock"):
+            now = time.time()
+            state = self._read()
+            self._refill(state, now)
+            slot = state["slots"].pop(slot_id, None) or {}
+            if self.tpm > 0 and tokens_used is not None:
+                # May go negative: an under-estimate becomes debt the next callers wait out
+                state["tok_tokens"] = float(state.get("tok_tokens", self.tpm)) - (int(tokens_used) - int(slot.get("est", 0)))
+            backoff = float(state.get("backoff_s", 0.0))
+            if rate_limited:
+                backoff = min(MAX_BACKOFF_S, max(1.0, backoff * 2))
+                state["cooldown_until"] = max(float(state.get("cooldown_until", 0.0)), now + backoff)
+                state["throttled"] = int(state.get("throttled", 0)) + 1
+            elif backoff:
+                backoff = backoff / 2 if backoff >= 1.0 else 0.0
+            state["backoff_s"] = backoff
+            self._write(state)
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self._read()
+        return {
+            "provider": self.provider, "model": self.model,
+            "inflight": len(state.get("slots") or {}), "max_inflight": self.max_inflight,
+            "rpm": self.rpm, "tpm": self.tpm,
+            "backoff_s": state.get("backoff_s", 0.0), "throttled": state.get("throttled", 0),
+        }
+
+
+def _is_rate_limited(e: BaseException) -> bool:
+    return getattr(e, "status_code", None) == 429 or type(e).__name__ == "RateLimitError"
+
+
+def _estimate_tokens(messages: Any, extra_create_args: Optional[Dict[str, Any]]) -> int:
+    try:
+        chars = sum(len(str(getattr(m, "content", m))) for m in (messages or []))
+    except Exception:
+        chars = 0
+    return chars // 4 + int((extra_create_args or {}).get("max_tokens") or 512)
+
+
+def _usage_tokens(result: Any) -> Optional[int]:
+    u = getattr(result, "usage", None)
+    if u is None:
+        return None
+    return int(getattr(u, "prompt_tokens", 0) or 0) + int(getattr(u, "completion_tokens", 0) or 0)
+
+
+def wrap_client(client: Any, limiter: RateLimiter, *, on_call: Optional[Callable[[Dict[str, Any]], None]] = None) -> Any:
+    """Route `client.create` / `client.create_stream` through `limiter` (patched on the instance).
+
+    `on_call` receives one dict per call: queue_wait_s, duration_s, tokens, status.
+    """
+    orig_create = client.create
+    orig_stream = client.create_stream
+
+    def _report(wait: float, t0: float, tokens: Optional[int], status: str) -> None:
+        if on_call is None:
+            return
+        try:
+            on_call({
+                "provider": limiter.provider, "model": limiter.model,
+                "queue_wait_s": round(wait, 3), "duration_s": round(time.time() - t0, 3),
+                "tokens": tokens, "status": status,
+            })
+        except Exception:
+            pass
+
+    async def _release(sid: str, tokens: Optional[int], limited: bool) -> None:
+        await asyncio.to_thread(limiter.release, sid, tokens_used=tokens, rate_limited=limited)
+
+    async def create(messages, *args, **kwargs):
+        sid, wait = await limiter.acquire(_estimate_tokens(messages, kwargs.get("extra_create_args")))
+        t0 = time.time()
+        tokens, status, limited = None, "ok", False
+        try:
+            res = await orig_create(messages, *args, **kwargs)
+            tokens = _usage_tokens(res)
+            return res
+        except BaseException as e:
+            limited = _is_rate_limited(e)
+            status = "rate_limited" if limited else "error"
+            raise
+        finally:
+            await _release(sid, tokens, limited)
+            _report(wait, t0, tokens, status)
+
+    async def create_stream(messages, *args, **kwargs):
+        sid, wait = await limiter.acquire(_estimate_tokens(messages, kwargs.get("extra_create_args")))
+        t0 = time.time()
+        tokens, status, limited, closed = None, "ok", False, False
+        try:
+            async for item in orig_stream(messages, *args, **kwargs):
+                if not isinstance(item, str):
+                    tokens = _usage_tokens(item)
+                yield item
+        except GeneratorExit:
+            closed = True
+            raise
+        except BaseException as e:
+            limited = _is_rate_limited(e)
+            status = "rate_limited" if limited else "error"
+            raise
+        finally:
+            if closed:
+                # A closing generator may not be able to await: release inline
+                limiter.release(sid, tokens_used=tokens, rate_limited=limited)
+            else:
+                await _release(sid, tokens, limited)
+            _report(wait, t0, tokens, status)
+
+    client.create = create
+    client.create_stream = create_stream
+    return client
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Show shared model-call limiter state")
+    ap.parse_args(argv)
+    if not os.path.isdir(STATE_DIR):
+        print(f"No limiter state in {STATE_DIR}")
+        return 0
+    for fn in sorted(os.listdir(STATE_DIR)):
+        if not fn.endswith(".json"):
+            continue
+        provider, _, model = fn[:-5].partition("__")
+        snap = RateLimiter(provider, model).snapshot()
+        print(f"{provider}/{model}: inflight={snap['inflight']}/{snap['max_inflight'] or '-'} rpm={snap['rpm'] or '-'} tpm={snap['tpm'] or '-'} backoff_s={snap['backoff_s']} throttled={snap['throttled']}")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,138 @@
+"""
+Run a command with stdout/stderr streamed to spool files instead of pipes.
+
+The child writes straight into per-call temp files (SWE_SPOOL_DIR, default the
+system temp dir), so verbose pytest `-vv` or pip output never accumulates in the
+runner's memory. Only the last SWE_OUTPUT_TAIL_BYTES (default 64 KiB) of each
+stream is kept in memory, read from the file end once the command exits. The
+full text stays available lazily until `close()` deletes the spool files.
+
+    with run_spooled(argv, timeout=60) as res:
+        res.code, res.stdout_tail, res.stdout()  # full text, read on demand
+        for ln in res.iter_lines():             # streamed from disk
+            ...
+"""
+
+import os
+import tempfile
+import subprocess
+from typing import Optional, List, Iterator, Union, Dict
+
+
+TAIL_BYTES = int(os.environ.get("SWE_OUTPUT_TAIL_BYTES", str(64 * 1024)))
+
+
+def spool_dir() -> str:
+    d = os.environ.get("SWE_SPOOL_DIR", "") or tempfile.gettempdir()
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+def _read_tail(path: str, limit: int) -> str:
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - limit))
+            data = f.read()
+    except OSError:
+        return ""
+    if size > limit:
+        # Start at a line boundary so callers never see half a line
+        nl = data.find(b"\n")
+        data = data[nl + 1:] if nl >= 0 else data
+    return data.decode("utf-8", errors="replace")
+
+
+class SpooledOutput:
+    """Exit code, in-memory tails and lazy full output of one spooled command."""
+
+    def __init__(self, code: int, stdout_path: str, stderr_path: str, *, tail_bytes: int = TAIL_BYTES):
+        self.code = code
+        self.stdout_path = stdout_path
+        self.stderr_path = stderr_path
+        self.stdout_tail = _read_tail(stdout_path, tail_bytes)
+        self.stderr_tail = _read_tail(stderr_path, tail_bytes) if stderr_path else ""
+
+    def _size(self, path: str) -> int:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    @property
+    def stdout_bytes(self) -> int:
+        return self._size(self.stdout_path)
+
+    @property
+    def stderr_bytes(self) -> int:
+        return self._size(self.stderr_path) if self.stderr_path else 0
+
+    def _read(self, path: str) -> str:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def stdout(self) -> str:
+        return self._read(self.stdout_path)
+
+    def stderr(self) -> str:
+        return self._read(self.stderr_path) if self.stderr_path else ""
+
+    def iter_lines(self, stream: str = "stdout") -> Iterator[str]:
+        """Lines (without newline) of stdout or stderr, read from disk one at a time."""
+        path = self.stdout_path if stream == "stdout" else self.stderr_path
+        if not path:
+            return
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                for ln in f:
+                    yield ln.rstrip("\n")
+        except OSError:
+            return
+
+    def close(self) -> None:
+        for p in (self.stdout_path, self.stderr_path):
+            if p:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def __enter__(self) -> "SpooledOutput":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def run_spooled(argv: Union[str, List[str]], *, timeout: Optional[float] = None, shell: bool = False, env: Optional[Dict[str, str]] = None,
+                merge_stderr: bool = False, tail_bytes: int = TAIL_BYTES) -> SpooledOutput:
+    """Run `argv` with output spooled to disk; exit code 124 on timeout (child killed).
+
+    `merge_stderr` sends stderr into the stdout spool (like `stderr=STDOUT`).
+    """
+    d = spool_dir()
+    fd_o, out_path = tempfile.mkstemp(prefix="demas_out_", dir=d)
+    fd_e, err_path = (-1, "") if merge_stderr else tempfile.mkstemp(prefix="demas_err_", dir=d)
+    try:
+        p = subprocess.Popen(argv, shell=shell, env=env, stdin=subprocess.DEVNULL, stdout=fd_o,
+                             stderr=subprocess.STDOUT if merge_stderr else fd_e)
+    except Exception:
+        for fd, path in ((fd_o, out_path), (fd_e, err_path)):
+            if path:
+                os.close(fd)
+                os.remove(path)
+        raise
+    os.close(fd_o)
+    if err_path:
+        os.close(fd_e)
+    try:
+        code = p.wait(timeout=timeout if timeout and timeout > 0 else None)
+    except subprocess.TimeoutExpired:
+        p.kill()
+        p.wait()
+        code = 124
+    return SpooledOutput(code, out_path, err_path, tail_bytes=tail_bytes)
@@ -56,3 +56,50 @@ def write_agent_csv(rows: List[Dict[str, Any]], csv_path: str) -> None:
             w.writerow(["p95_duration_s", f"{p95:.3f}"])
 
 
+def first_attempt_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Rows of an attempts=N agent run as an attempts=1 run would report them (status/duration/tail of attempt 1).
+
+    Errored rows are kept as they are (they count against both pass rates). Returns []
+    when any other row lacks `attempt_results` (runs before it was recorded): a pass rate
+    over a subset would be wrong, so callers fall back to a real attempts=1 run.
+    """
+    out = []
+    for r in rows:
+        res = r.get("attempt_results") or []
+        if "error" in r:
+            out.append(r)
+            continue
+        if not res:
+            return []
+        durs = r.get("attempt_durations_s") or []
+        tails = r.get("attempt_tails") or []
+        out.append({
+            **r,
+            "status": "pass" if res[0] else "fail",
+            "duration_s": durs[0] if durs else r.get("duration_s", ""),
+            "tail": tails[0] if tails else r.get("tail", ""),
+        })
+    return out
+
+
+def write_test_timings_csv(rows: List[Dict[str, Any]], csv_path: str) -> int:
+    """Per-test outcome/duration for every row with a `pytest_report_path`; returns tests written."""
+    import csv
+    import json
+    n = 0
+    with open(csv_path, "w", newline="", encoding="utf-8") as cf:
+        w = csv.writer(cf)
+        w.writerow(["task_id", "nodeid", "outcome", "duration_s"])  # header
+        for r in rows:
+            path = r.get("pytest_report_path") or ""
+            if not path:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    rep = json.load(f)
+            except Exception:
+                continue
+            for c in sorted(rep.get("cases", []), key=lambda c: -float(c.get("duration_s", 0.0))):
+                w.writerow([r.get("task_id", ""), c.get("nodeid", ""), c.get("outcome", ""), c.get("duration_s", "")])
+                n += 1
+    return n
@@ -0,0 +1,132 @@
+"""
+Expected task durations from earlier batch runs, for longest-first dispatch.
+
+History is read from the newest SWE_COST_HISTORY_RUNS (default 50) run dirs under
+sandbox/agent_batch_runs and sandbox/batch_runs: `results.jsonl` rows
+(`duration_s`, whole task incl. all attempts) or, for runs without results,
+`profile.csv` (`total_s`). Observations are keyed by (task_id, model, mode),
+mode being "agent" or "baseline"; baseline rows have an empty model.
+
+An estimate is the median of the latest observations for the exact key, then
+for the task under any model in the same mode; unknown tasks get the median of
+the known estimates in the batch (or SWE_COST_PRIOR_S, default 120 s).
+
+The makespan of n tasks on `jobs` workers can not beat
+max(sum / jobs, longest task); `schedule_report` compares wall-clock with it.
+"""
+
+import os
+import csv
+import json
+import glob
+import statistics
+from typing import Dict, Any, List, Tuple, Iterable, Optional
+
+from demas.core import config as _cfg
+from demas.core import jsonl_logger
+
+
+HISTORY_RUNS = int(os.environ.get("SWE_COST_HISTORY_RUNS", "50"))
+PRIOR_S = float(os.environ.get("SWE_COST_PRIOR_S", "120"))
+# Latest observations per key that enter the median
+KEEP = 5
+
+Key = Tuple[str, str, str]
+
+
+def _run_dirs(workdir: str, exclude: str = "") -> List[Tuple[str, str]]:
+    """(mode, run_dir) of the newest runs first; run dir names are UTC timestamps."""
+    dirs: List[Tuple[str, str, str]] = []
+    for mode, sub in (("agent", "agent_batch_runs"), ("baseline", "batch_runs")):
+        for d in glob.glob(os.path.join(workdir, sub, "*")):
+            if os.path.isdir(d) and os.path.abspath(d) != exclude:
+                dirs.append((os.path.basename(d), mode, d))
+    dirs.sort(reverse=True)
+    return [(mode, d) for _, mode, d in dirs[:max(0, HISTORY_RUNS)]]
+
+
+def _results_obs(path: str) -> Iterable[Tuple[str, str, float]]:
+    for ln in jsonl_logger.iter_lines(path):
+        try:
+            r = json.loads(ln)
+        except Exception:
+            continue
+        d = r.get("duration_s")
+        if r.get("task_id") and "error" not in r and isinstance(d, (int, float)) and d > 0:
+            yield r["task_id"], str(r.get("model") or ""), float(d)
+
+
+def _profile_obs(path: str) -> Iterable[Tuple[str, str, float]]:
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for r in csv.DictReader(f):
+                try:
+                    d = float(r.get("total_s") or 0)
+                except ValueError:
+                    continue
+                if r.get("task_id") and d > 0:
+                    yield r["task_id"], str(r.get("model") or ""), d
+    except OSError:
+        return
+
+
+def load_history(workdir: Optional[str] = None, *, exclude: str = "") -> Dict[Key, List[float]]:
+    """Observed durations by (task_id, model, mode), newest first (at most KEEP each)."""
+    hist: Dict[Key, List[float]] = {}
+    for mode, d in _run_dirs(workdir or _cfg.WORKDIR, os.path.abspath(exclude) if exclude else ""):
+        res = os.path.join(d, "results.jsonl")
+        obs = _results_obs(res) if os.path.isfile(res) else _profile_obs(os.path.join(d, "profile.csv"))
+        for task_id, model, dur in obs:
+            vals = hist.setdefault((task_id, model if mode == "agent" else "", mode), [])
+            if len(vals) < KEEP:
+                vals.append(dur)
+    return hist
+
+
+def estimate(tasks: List[Dict[str, Any]], hist: Dict[Key, List[float]], *, model: str, mode: str) -> Dict[str, Tuple[float, str]]:
+    """task_id -> (expected seconds, source) with source in exact|task|prior."""
+    model = model if mode == "agent" else ""
+    by_task: Dict[str, List[float]] = {}
+    for (tid, _m, md), vals in hist.items():
+        if md == mode:
+            by_task.setdefault(tid, []).extend(vals)
+    est: Dict[str, Tuple[float, str]] = {}
+    for t in tasks:
+        tid = t.get("task_id", "")
+        if (tid, model, mode) in hist:
+            est[tid] = (statistics.median(hist[(tid, model, mode)]), "exact")
+        elif tid in by_task:
+            est[tid] = (statistics.median(by_task[tid]), "task")
+    known = [v for v, _ in est.values()]
+    prior = statistics.median(known) if known else PRIOR_S
+    for t in tasks:
+        est.setdefault(t.get("task_id", ""), (prior, "prior"))
+    return est
+
+
+def longest_first(tasks: List[Dict[str, Any]], est: Dict[str, Tuple[float, str]]) -> List[Dict[str, Any]]:
+    """Stable sort by expected duration, longest first (ties keep file order)."""
+    return sorted(tasks, key=lambda t: -est.get(t.get("task_id", ""), (0.0, ""))[0])
+
+
+def lower_bound(durations: List[float], jobs: int) -> float:
+    if not durations:
+        return 0.0
+    return max(sum(durations) / max(1, jobs), max(durations))
+
+
+def schedule_report(durations: List[float], *, jobs: int, wall_s: float, order: str, predicted: Optional[List[float]] = None) -> Dict[str, Any]:
+    lb = lower_bound(durations, jobs)
+    rep: Dict[str, Any] = {
+        "order": order,
+        "tasks": len(durations),
+        "jobs": jobs,
+        "wall_s": round(wall_s, 3),
+        "sum_task_s": round(sum(durations), 3),
+        "max_task_s": round(max(durations), 3) if durations else 0.0,
+        "lower_bound_s": round(lb, 3),
+        "efficiency": round(lb / wall_s, 3) if wall_s > 0 else 0.0,
+    }
+    if predicted is not None:
+        rep["predicted_lower_bound_s"] = round(lower_bound(predicted, jobs), 3)
+    return rep
@@ -0,0 +1,89 @@
+"""
+Test-result cache keyed by working-tree content.
+
+A key is sha256(tree hash, installed-deps fingerprint, pytest args, test timeout):
+- tree hash: `git write-tree` over a scratch index with every non-ignored file
+  added (bytecode and .pytest_cache excluded), so it covers edits, patches and
+  untracked files without touching the project's real index
+- deps fingerprint: `pip freeze` of the container plus the /workspace/_deps listing
+
+Entries are small JSON files under sandbox/_test_cache shared by all runners, so a
+later attempt (or task) on the same tree reuses results too. Timed-out runs are
+not stored. TEST_CACHE=0 disables it; TEST_CACHE_TTL_S bounds entry age (default 7 days).
+"""
+
+import os
+import json
+import time
+import hashlib
+from typing import Optional, Dict, Any
+
+from demas.core import config as _cfg
+
+
+CACHE_DIR = os.path.join(_cfg.WORKDIR, "_test_cache")
+TTL_S = float(os.environ.get("TEST_CACHE_TTL_S", str(7 * 24 * 3600)))
+# Stdout kept per entry (tail end); enough for the tools' tail/last-200-lines views
+MAX_OUT_CHARS = 65536
+
+# Run from the project dir; prints "TREE <sha>" and "DEPS <md5>"
+KEY_CMD = (
+    "idx=$(mktemp); cp -f .git/index \"$idx\" 2>/dev/null; "
+    "tree=$(GIT_INDEX_FILE=\"$idx\" git add -A -- . "
+    "':(exclude,glob)**/__pycache__/**' ':(exclude,glob)**/*.pyc' ':(exclude,glob).pytest_cache/**' "
+    ">/dev/null 2>&1 && GIT_INDEX_FILE=\"$idx\" git write-tree 2>/dev/null); rm -f \"$idx\"; "
+    "echo TREE ${tree}; "
+    "echo DEPS $( (python -m pip freeze --all 2>/dev/null; ls -1 /workspace/_deps 2>/dev/null) | md5sum | cut -d' ' -f1)"
+)
+
+
+def cache_enabled() -> bool:
+    return os.environ.get("TEST_CACHE", "1").strip().lower() not in ("0", "false", "no", "")
+
+
+def parse_state(out: str) -> str:
+    """'<tree>:<deps>' from KEY_CMD output, or "" when the tree could not be hashed."""
+    tree = deps = ""
+    for ln in (out or "").splitlines():
+        parts = ln.split()
+        if len(parts) == 2 and parts[0] == "TREE":
+            tree = parts[1]
+        elif len(parts) == 2 and parts[0] == "DEPS":
+            deps = parts[1]
+    return f"{tree}:{deps}" if tree and deps else ""
+
+
+def cache_key(state: str, pytest_args: str, timeout: int) -> str:
+    h = hashlib.sha256()
+    for part in (state, " ".join((pytest_args or "").split()), str(timeout)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:24]
+
+
+def _path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_path(key), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except Exception:
+        return None
+    if time.time() - float(entry.get("created", 0)) > TTL_S:
+        return None
+    return entry
+
+
+def put(key: str, *, code: int, out: str, err: str, report: Optional[Dict[str, Any]]) -> None:
+    if code == 124:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = _path(key) + f".{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "code": code, "out": (out or "")[-MAX_OUT_CHARS:], "err": (err or "")[-MAX_OUT_CHARS:], "report": report}, f)
+        os.replace(tmp, _path(key))
+    except Exception:
+        pass
@@ -0,0 +1,144 @@
+"""
+Affected-test selection after a patch (testmon-style impact analysis).
+
+SWE_TEST_IMPACT=1 enables it:
+1) the first pytest run on an unpatched tree also records per-test coverage
+   (pytest-cov `--cov-context=test`) into /workspace/_impact/<name>.coverage
+2) after a patch, `select_cmd` maps the changed files (`git diff` vs HEAD plus
+   untracked files) to the tests that executed them, and only those run
+3) SWE_TEST_IMPACT_CONFIRM=1 adds one full run once the selected tests pass
+
+Selection is file-level and conservative: conftest.py, non-Python changes (docs
+aside), or a changed module that no recorded test executed fall back to the full
+run. Module-level code runs outside any test context, so a test that only imports
+a changed constant is missed; the confirm run covers that case.
+"""
+
+import os
+import json
+import shlex
+from typing import Dict, Any
+
+from demas.core import config as _cfg
+
+
+IMPACT_DIR = os.path.join(_cfg.WORKDIR, "_impact")
+CONTAINER_IMPACT_DIR = "/workspace/_impact"
+# Above this many node ids the selection collapses to test files, then to a full run
+MAX_SELECTED = int(os.environ.get("SWE_TEST_IMPACT_MAX", "300"))
+
+
+def impact_enabled() -> bool:
+    return os.environ.get("SWE_TEST_IMPACT", "0").strip().lower() in ("1", "true", "yes")
+
+
+def confirm_enabled() -> bool:
+    return os.environ.get("SWE_TEST_IMPACT_CONFIRM", "0").strip().lower() in ("1", "true", "yes")
+
+
+def coverage_file(name: str) -> str:
+    """Container path of the coverage map for `name` (e.g. the project dir)."""
+    return f"{CONTAINER_IMPACT_DIR}/{name}.coverage"
+
+
+def record_prefix(cov_file: str) -> str:
+    """Shell prefix that sets $covargs; append "$covargs" to the pytest args of the recording run.
+
+    Without pytest-cov in the image $covargs stays empty and the run is a plain one.
+    """
+    return (
+        f"mkdir -p {CONTAINER_IMPACT_DIR}; rm -f {shlex.quote(cov_file)}; export COVERAGE_FILE={shlex.quote(cov_file)}; "
+        "covargs=$(python -c 'import pytest_cov' >/dev/null 2>&1 && echo '--cov=. --cov-context=test --cov-report='); "
+    )
+
+
+_SELECT_PY = r'''
+import json, os, subprocess, sys
+cov_file, sel_file, max_items = sys.argv[1], sys.argv[2], int(sys.argv[3])
+def done(mode, **kw):
+    if sel_file:
+        with open(sel_file, "w") as f:
+            f.write("\n".join(kw.get("tests", [])) if mode == "selected" else "")
+    print("IMPACT_SELECTION: " + json.dumps(dict(mode=mode, **kw)))
+    sys.exit(0)
+def git(*a):
+    r = subprocess.run(["git", *a], capture_output=True, text=True)
+    return [ln for ln in r.stdout.splitlines() if ln.strip()] if r.returncode == 0 else None
+try:
+    from coverage import CoverageData
+except ImportError:
+    done("full", reason="coverage not installed")
+if not os.path.exists(cov_file):
+    done("full", reason="no coverage map recorded")
+diff = git("diff", "--name-only", "HEAD")
+if diff is None:
+    done("full", reason="git diff unavailable")
+changed = sorted(set(diff + (git("ls-files", "-o", "--exclude-standard") or [])))
+data = CoverageData(basename=cov_file)
+data.read()
+root = os.getcwd()
+tests_by_file, recorded = {}, set()
+for f in data.measured_files():
+    rel = os.path.relpath(f, root)
+    if rel.startswith(".."):
+        continue
+    ctxs = set()
+    for lst in data.contexts_by_lineno(f).values():
+        ctxs.update(c.split("|")[0] for c in lst if c)
+    tests_by_file[rel] = ctxs
+    recorded |= ctxs
+def is_test(p):
+    b = os.path.basename(p)
+    return b.startswith("test_") or b.endswith("_test.py")
+nodes, files = set(), set()
+for p in changed:
+    if "__pycache__" in p or p.endswith((".pyc", ".md", ".rst")):
+        continue
+    if not p.endswith(".py") or os.path.basename(p) == "conftest.py":
+        done("full", reason=f"non-source change: {p}", changed=changed)
+    if is_test(p):
+        if os.path.exists(p):
+            files.add(p)
+        continue
+    hit = tests_by_file.get(p)
+    if not hit:
+        done("full", reason=f"{p} not executed by any recorded test", changed=changed)
+    nodes |= {t.split("[")[0] for t in hit}
+tests = sorted(n for n in nodes if n.split("::")[0] not in files) + sorted(files)
+if not tests:
+    done("full", reason="nothing selected", changed=changed)
+if len(tests) > max_items:
+    tests = sorted({t.split("::")[0] for t in tests})
+if len(tests) > max_items:
+    done("full", reason=f"{len(tests)} test files selected", changed=changed)
+done("selected", tests=tests, changed=changed, recorded_tests=len(recorded))
+'''
+
+
+def select_cmd(cov_file: str, sel_file: str = "") -> str:
+    """Shell command (run from the project dir) printing an IMPACT_SELECTION line.
+
+    With `sel_file`, selected node ids are also written there one per line (empty on a full run).
+    """
+    args = " ".join(shlex.quote(a) for a in (cov_file, sel_file, str(MAX_SELECTED)))
+    return f"python - {args} <<'PY'\n{_SELECT_PY.strip()}\nPY\n"
+
+
+def parse_selection(out: str) -> Dict[str, Any]:
+    """{"mode": "selected"|"full", "tests": [...], "changed": [...], "reason": ...} from select_cmd output."""
+    for ln in (out or "").splitlines():
+        if ln.startswith("IMPACT_SELECTION: "):
+            try:
+                return json.loads(ln.split(": ", 1)[1])
+            except ValueError:
+                break
+    return {"mode": "full", "reason": "selection failed"}
+
+
+def cleanup(name: str) -> None:
+    """Remove the host copies of a run's coverage map and selection file."""
+    for suffix in (".coverage", ".sel"):
+        try:
+            os.remove(os.path.join(IMPACT_DIR, name + suffix))
+        except OSError:
+            pass
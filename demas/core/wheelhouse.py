@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Shared pip wheelhouse for task containers.
+
+Every container gets PIP_FIND_LINKS=/workspace/_wheelhouse and a persistent
+PIP_CACHE_DIR (see config.pip_container_env). This module pre-builds wheels for a
+task file's dependencies so repeat installs are served locally, and reads per-run
+pip cache stats back from the container's pip log.
+
+Prefetch (network needed once; later installs can run with SWE_PIP_OFFLINE=1):
+  python -m demas.core.wheelhouse --seeds sandbox/swe_tasks.jsonl
+"""
+
+import os
+import shlex
+from typing import List, Dict, Any
+
+from demas.core import config as _cfg
+from demas.core import git_cache
+from demas.core.docker_exec import run_docker_bash
+
+
+# Build backends the install recipes pull in for most projects
+BUILD_BACKENDS = "hatchling hatch-vcs meson-python ninja cython setuptools_scm wheel setuptools"
+
+# Counts lines of the appending pip log: wheelhouse hits, http-cache hits, network downloads
+PIP_STATS_CMD = (
+    f"if [ -f {_cfg.PIP_LOG} ]; then "
+    f"echo PIP_STATS $(grep -c 'Processing /workspace/_wheelhouse/' {_cfg.PIP_LOG}) "
+    f"$(grep -c 'Using cached ' {_cfg.PIP_LOG}) "
+    f"$(grep -c 'Downloading ' {_cfg.PIP_LOG}); "
+    "else echo PIP_STATS 0 0 0; fi"
+)
+
+
+def parse_pip_stats(out: str) -> Dict[str, int]:
+    """Parse PIP_STATS_CMD output into {wheelhouse_hits, cache_hits, downloads}."""
+    for ln in (out or "").splitlines():
+        parts = ln.split()
+        if len(parts) == 4 and parts[0] == "PIP_STATS":
+            try:
+                wh, ch, dl = (int(x) for x in parts[1:])
+            except ValueError:
+                break
+            return {"wheelhouse_hits": wh, "cache_hits": ch, "downloads": dl}
+    return {}
+
+
+def _prefetch_script(task: Dict[str, Any], proj: str) -> str:
+    repo = task.get("repo", "")
+    ref = task.get("ref", "") or ""
+    proj_q = shlex.quote(proj)
+    sha = git_cache.ensure_mirror(repo, ref) if git_cache.mirror_enabled() else ""
+    if sha:
+        clone = git_cache.checkout_script(repo, sha, proj)
+    else:
+        clone = f"git clone -q --depth 1 {shlex.quote(repo)} {proj_q}\n"
+        if ref:
+            clone += f"git -C {proj_q} fetch -q --depth 1 origin {shlex.quote(ref)} && git -C {proj_q} checkout -q {shlex.quote(ref)}\n"
+    # Offline mode would defeat the purpose here: this is the one step allowed to hit the index.
+    # The project itself is never wheeled: the build is slow, the wheel unused, and a
+    # dependent could later resolve to one built from another ref
+    return (
+        "set -e\nunset PIP_NO_INDEX\n"
+        f"rm -rf {proj_q}\n" + clone + f"cd {proj_q}\n"
+        "set +e\n"
+        f"python -m pip wheel -q -w /workspace/_wheelhouse {BUILD_BACKENDS}\n"
+        "for r in requirements.txt testing/requirements.txt; do "
+        "if [ -f \"$r\" ]; then python -m pip wheel -q -w /workspace/_wheelhouse -r \"$r\"; fi; done\n"
+        f"cd /workspace && rm -rf {proj_q}\n"
+        "true\n"
+    )
+
+
+def prefetch(tasks: List[Dict[str, Any]], *, timeout: int = 900) -> Dict[str, int]:
+    """Build wheels for each task's requirement files and the build backends; returns {task_id: exit_code}."""
+    out: Dict[str, int] = {}
+    for t in tasks:
+        tid = t.get("task_id", "") or t.get("repo", "")
+        if not t.get("repo") or str(t.get("repo")).startswith("/workspace/"):
+            continue
+        proj = f"_wheel_prefetch_{tid.replace('/', '_')}"
+        code, _, _ = run_docker_bash(_prefetch_script(t, proj), image=_cfg.DOCKER_IMAGE, workdir=_cfg.WORKDIR, timeout=timeout)
+        out[tid] = code
+        print(f"{tid} -> {'ok' if code == 0 else f'exit {code}'}")
+    return out
+
+
+def main(argv: List[str]) -> int:
+    import argparse
+    from demas.core.io import load_seed_tasks
+    ap = argparse.ArgumentParser(description="Pre-build wheels for a task file's dependencies into the shared wheelhouse")
+    ap.add_argument("--seeds", default=os.path.join("sandbox", "swe_tasks.jsonl"), help="Seed tasks JSONL (default: sandbox/swe_tasks.jsonl)")
+    ap.add_argument("--timeout", type=int, default=900, help="Per-task cap in seconds (default: 900)")
+    args = ap.parse_args(argv)
+    res = prefetch(load_seed_tasks(args.seeds), timeout=args.timeout)
+    n_wheels = len([f for f in os.listdir(_cfg.WHEELHOUSE_DIR) if f.endswith(".whl")]) if os.path.isdir(_cfg.WHEELHOUSE_DIR) else 0
+    print(f"Prefetched {sum(1 for c in res.values() if c == 0)}/{len(res)} tasks; wheelhouse has {n_wheels} wheels ({_cfg.WHEELHOUSE_DIR})")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main(sys.argv[1:]))
@@ -20,10 +20,12 @@ import time
 import base64
 import subprocess
 from datetime import datetime
-from typing import Optional, Tuple, Dict, Any
-from demas.core.docker_exec import run_docker_bash
+from typing import Optional, Tuple, Dict, Any, List
+from demas.core.docker_exec import run_docker_bash, run_docker_bash_spooled, DockerSession, open_session, sessions_enabled
 from demas.core import config as _cfg
+from demas.core import git_cache, env_cache, wheelhouse, pytest_report, pytest_server, test_impact
 from demas.core.io import extract_pytest_tail
+from demas.core.spool import SpooledOutput
 
 
 DOCKER_IMAGE = _cfg.DOCKER_IMAGE
@@ -35,10 +37,27 @@ TIMEOUT_INSTALL = _cfg.TIMEOUT_INSTALL
 TIMEOUT_TEST = _cfg.TIMEOUT_TEST
 
 
+# Per-run container session (see main); None -> per-call `docker run --rm`
+_SESSION: Optional[DockerSession] = None
+
+
 def run_in_container(cmd: str, *, timeout: Optional[int] = None) -> Tuple[int, str, str]:
+    if _SESSION is not None:
+        return _SESSION.run(cmd, timeout=timeout)
     return run_docker_bash(cmd, image=DOCKER_IMAGE, workdir=WORKDIR, timeout=timeout)
 
 
+def run_in_container_spooled(cmd: str, *, timeout: Optional[int] = None) -> SpooledOutput:
+    """run_in_container with output left on disk (see demas.core.spool); caller closes the result."""
+    if _SESSION is not None:
+        return _SESSION.run_spooled(cmd, timeout=timeout)
+    return run_docker_bash_spooled(cmd, image=DOCKER_IMAGE, workdir=WORKDIR, timeout=timeout)
+
+
+# Lines of the setup/test scripts' stdout that main() parses
+_MARKERS = ("STAGE:", "BEFORE_TAIL:", "AFTER_TAIL:", "IMPACT_SELECTION: ", "IMPACT_CONFIRM")
+
+
 def nonempty_tail(text: str) -> str:
     lines = [ln for ln in (text or "").splitlines() if ln.strip()]
     return lines[-1] if lines else ""
@@ -111,46 +130,55 @@ def main(argv: list[str]) -> int:
             patch_embed = ""
             patch_applied_flag = False
 
-    # Build a single-session script with per-step timeouts using coreutils `timeout`
+    # Build setup/test scripts with per-step timeouts using coreutils `timeout`
     # If `timeout` is unavailable, outer timeout in run_in_container still caps the whole run.
     # Optional pre-run before applying patch, then apply patch, then run tests again.
     # Always do a quick pre-test run to avoid blocking on install under strict caps
+    # Both runs also write a JUnit report (parsed on the host; see demas.core.pytest_report)
+    junit_before, report_before_path = pytest_report.junit_flag(f"{proj_dir}_before")
+    junit_after, report_after_path = pytest_report.junit_flag(f"{proj_dir}_after")
+    # Affected-test selection (SWE_TEST_IMPACT=1): the pre-patch run records per-test
+    # coverage, the post-patch run executes only tests touching the changed files
+    impact = test_impact.impact_enabled() and bool(patch_embed)
+    cov_file = test_impact.coverage_file(proj_dir)
+    # Optional xdist sharding across the per-task CPU budget (SWE_TEST_WORKERS)
+    shard = pytest_report.shard_flag()
+    # Plain pytest: the two runs are split by the install, so a warm server (SWE_PYTEST_SERVER)
+    # would be stale for the second one; it pays off only for the agent's repeated runs
+    pytest_bin = pytest_server.COLD_CMD
     pre_run_cmd = (
-        f"btail=$(export PYTHONPATH=\$PWD:\$PWD/src:\$PYTHONPATH; timeout {TIMEOUT_TEST}s python -m pytest -q {kflag} | tail -n 1)\n"
+        f"{pytest_report.mkdir_cmd()}\n"
+        + (test_impact.record_prefix(cov_file) + "\n" if impact else "")
+        + f"btail=$(export PYTHONPATH=\$PWD:\$PWD/src:\$PYTHONPATH; timeout {TIMEOUT_TEST}s {pytest_bin} -q {kflag}{' $covargs' if impact else ''} {shard} {junit_before} | tail -n 1)\n"
         "echo BEFORE_TAIL: ${btail}\n"
     )
 
-    post_run_cmd = (
-        f"atail=$(export PYTHONPATH=\$PWD:\$PWD/src:\$PYTHONPATH; timeout {TIMEOUT_TEST}s python -m pytest -q {kflag} | tail -n 1)\n"
-        "echo AFTER_TAIL: ${atail}\n"
-    )
-
-    bash_script = f"""
-set -e
-rm -rf {proj_q}
-echo STAGE:CLONE:START $(date +%s.%N)
-repo_src={shlex.quote(repo)}
-# Prefer direct copy for local paths under /workspace (mounted host sandbox). Fallback to git clone otherwise.
-case "${{repo_src}}" in 
-  /workspace/*)
-    rm -rf {proj_q} && mkdir -p {proj_q} && cp -R "${{repo_src}}/." {proj_q} ;;
-  *)
-    timeout {TIMEOUT_CLONE}s git clone --depth 1 "${{repo_src}}" {proj_q} ;;
-esac
-cd {proj_q}
-if [ -n {shlex.quote(ref or '')} ]; then \
-  timeout {TIMEOUT_CLONE}s git fetch --depth 1 origin {shlex.quote(ref)} && \
-  git checkout -q {shlex.quote(ref)}; \
-fi
-echo STAGE:CLONE:END $(date +%s.%N)
-
-# Quick pre-test run before install to capture an immediate pass when possible
-{pre_run_cmd}
-
-echo STAGE:INSTALL:START $(date +%s.%N)
-# Allow best-effort installs under strict caps without aborting the whole script
+    full_run = f"atail=$(export PYTHONPATH=\$PWD:\$PWD/src:\$PYTHONPATH; timeout {TIMEOUT_TEST}s {pytest_bin} -q {kflag} {shard} {junit_after} | tail -n 1)\n"
+    if impact:
+        sel_file = f"{test_impact.CONTAINER_IMPACT_DIR}/{proj_dir}.sel"
+        post_run_cmd = (
+            f"{pytest_report.mkdir_cmd()}\n"
+            f"{test_impact.select_cmd(cov_file, sel_file)}"
+            f"if [ -s {sel_file} ]; then\n"
+            "  aout=$(mktemp); arc=0\n"
+            # One node id per line; an array keeps ids with spaces or brackets intact
+            f"  mapfile -t sel < {sel_file}\n"
+            f"  (export PYTHONPATH=\$PWD:\$PWD/src:\$PYTHONPATH; timeout {TIMEOUT_TEST}s {pytest_bin} -q {kflag} \"${{sel[@]}}\" {shard} {junit_after} > \"$aout\") || arc=$?\n"
+            "  atail=$(tail -n 1 \"$aout\"); rm -f \"$aout\"\n"
+            + (f"  if [ $arc -eq 0 ]; then echo IMPACT_CONFIRM; {full_run}  fi\n" if test_impact.confirm_enabled() else "")
+            + f"else\n  {full_run}fi\n"
+            "echo AFTER_TAIL: ${atail}\n"
+        )
+    else:
+        post_run_cmd = (
+            f"{pytest_report.mkdir_cmd()}\n"
+            f"{full_run}"
+            "echo AFTER_TAIL: ${atail}\n"
+        )
+
+    install_block = f"""# Allow best-effort installs under strict caps without aborting the whole script
 set +e
-python -m pip install -q -U pip || true
+# pip itself is upgraded at image build time; wheels come from the shared wheelhouse/cache
 # Common build backends used by modern projects
 timeout 10s python -m pip install -q hatchling hatch-vcs meson-python ninja cython setuptools_scm || true
 # Editable install of the project; fallback to regular install if needed
@@ -177,8 +205,57 @@ if [ -d src/dateutil/zoneinfo ]; then \
   fi; \
 fi
 set -e
-echo STAGE:INSTALL:END $(date +%s.%N)
+"""
 
+    # Prepared-environment cache (needs a session to snapshot/start from the image)
+    env_key = ""
+    env_hit = None
+    if env_cache.cache_enabled() and sessions_enabled() and not repo.startswith("/workspace/"):
+        env_key = env_cache.env_key(repo, ref or "", DOCKER_IMAGE, install_block)
+        env_hit = env_cache.lookup(env_key)
+
+    # Clone stage: prepared environment, else offline checkout from the host mirror cache
+    t_mirror = time.time()
+    mirror_sha = git_cache.ensure_mirror(repo, ref or "") if (git_cache.mirror_enabled() and not env_hit) else ""
+    mirror_s = round(time.time() - t_mirror, 3)
+    if env_hit:
+        clone_block = env_cache.restore_script(env_key, proj_dir, env_hit.get("project", "")) + f"cd {proj_q}"
+        install_block = "# Prepared environment restored from cache: install skipped\n"
+    elif mirror_sha:
+        clone_block = git_cache.checkout_script(repo, mirror_sha, proj_dir) + f"cd {proj_q}"
+    else:
+        clone_block = f"""repo_src={shlex.quote(repo)}
+# Prefer direct copy for local paths under /workspace (mounted host sandbox). Fallback to git clone otherwise.
+case "${{repo_src}}" in 
+  /workspace/*)
+    rm -rf {proj_q} && mkdir -p {proj_q} && cp -R "${{repo_src}}/." {proj_q} ;;
+  *)
+    timeout {TIMEOUT_CLONE}s git clone --depth 1 "${{repo_src}}" {proj_q} ;;
+esac
+cd {proj_q}
+if [ -n {shlex.quote(ref or '')} ]; then \
+  timeout {TIMEOUT_CLONE}s git fetch --depth 1 origin {shlex.quote(ref)} && \
+  git checkout -q {shlex.quote(ref)}; \
+fi"""
+
+    setup_script = f"""
+set -e
+rm -rf {proj_q}
+echo STAGE:CLONE:START $(date +%s.%N)
+{clone_block}
+echo STAGE:CLONE:END $(date +%s.%N)
+
+# Quick pre-test run before install to capture an immediate pass when possible
+{pre_run_cmd}
+
+echo STAGE:INSTALL:START $(date +%s.%N)
+{install_block}
+echo STAGE:INSTALL:END $(date +%s.%N)
+"""
+    # Test stage runs as a second command so the installed state can be snapshotted in between
+    test_script = f"""
+set -e
+cd {proj_q}
 # Apply patch if provided
 {patch_embed}
 # Run tests after (or only run if no pre-patch)
@@ -187,9 +264,33 @@ echo STAGE:TEST:START $(date +%s.%N)
 echo STAGE:TEST:END $(date +%s.%N)
 """
 
+    global _SESSION
+    pip_stats: Dict[str, int] = {}
+    # Script output stays in spool files: only marker lines and the last command's tails are read back
+    spools: List[SpooledOutput] = []
     t0 = time.time()
-    code, out, err = run_in_container(bash_script)
+    try:
+        _SESSION = open_session(image=env_hit["image_tag"] if env_hit else DOCKER_IMAGE, workdir=WORKDIR, attach=env_hit is None)
+        spools.append(run_in_container_spooled(setup_script))
+        code = spools[-1].code
+        if code == 0:
+            if env_key and not env_hit and _SESSION is not None:
+                env_cache.store(env_key, _SESSION, proj_dir, meta={"repo": repo, "ref": ref, "image": DOCKER_IMAGE})
+            spools.append(run_in_container_spooled(test_script))
+            code = spools[-1].code
+        if _SESSION is not None:
+            pip_stats = wheelhouse.parse_pip_stats(run_in_container(wheelhouse.PIP_STATS_CMD)[1])
+    finally:
+        if _SESSION is not None:
+            _SESSION.close()
+            _SESSION = None
     elapsed = time.time() - t0
+    try:
+        out = "\n".join(ln for sp in spools for ln in sp.iter_lines() if ln.startswith(_MARKERS))
+        last_out, last_err = (spools[-1].stdout_tail, spools[-1].stderr_tail) if spools else ("", "")
+    finally:
+        for sp in spools:
+            sp.close()
     # Extract BEFORE/AFTER tails and stage timings if present
     before_tail = ""
     after_tail = ""
@@ -209,9 +310,25 @@ echo STAGE:TEST:END $(date +%s.%N)
                     t_markers[stage][kind.lower()] = ts
             except Exception:
                 pass
-    tail = after_tail or extract_pytest_tail(out, err)
-
-    status = "pass" if (" passed" in tail and " failed" not in tail and " error" not in tail) else ("fail" if code != 0 else "ok")
+    report_before = pytest_report.collect(report_before_path)
+    report_after = pytest_report.collect(report_after_path)
+    impact_info: Dict[str, Any] = {}
+    if impact:
+        sel = test_impact.parse_selection(out)
+        impact_info = {"mode": sel.get("mode"), "selected": len(sel.get("tests") or []), "reason": sel.get("reason", ""),
+                       "confirmed": "IMPACT_CONFIRM" in (out or "")}
+        test_impact.cleanup(proj_dir)
+    # Structured report decides; tail scraping remains the fallback when pytest wrote none
+    if report_after is not None and report_after.get("tests"):
+        tail = pytest_report.summary_line(report_after)
+        passed = pytest_report.is_pass(report_after)
+    else:
+        tail = after_tail or extract_pytest_tail(last_out, last_err)
+        passed = " passed" in tail and " failed" not in tail and " error" not in tail
+    if report_before is not None and report_before.get("tests"):
+        before_tail = pytest_report.summary_line(report_before)
+
+    status = "pass" if passed else ("fail" if code != 0 else "ok")
 
     # Prepare result directory (allow caller to override for parallel safety)
     ts = os.environ.get("RUN_TS") or datetime.utcnow().strftime("%Y%m%d_%H%M%S")
@@ -221,6 +338,10 @@ echo STAGE:TEST:END $(date +%s.%N)
     # Write artifacts
     with open(os.path.join(run_dir, "pytest_tail.txt"), "w", encoding="utf-8") as f:
         f.write(tail + "\n")
+    for name, rep in (("pytest_report.json", report_after), ("pytest_report_before.json", report_before)):
+        if rep is not None:
+            with open(os.path.join(run_dir, name), "w", encoding="utf-8") as f:
+                json.dump(rep, f, indent=2)
 
     # Compute durations if both start/end are present
     def _dur(stage: str) -> float:
@@ -242,12 +363,19 @@ echo STAGE:TEST:END $(date +%s.%N)
         "patch_applied": bool(args.patch_file) and patch_applied_flag,
         "tail_before": before_tail if args.pre_patch_run else "",
         "status_before": (
-            ("pass" if (" passed" in before_tail and " failed" not in before_tail and " error" not in before_tail) else ("fail" if before_tail else ""))
+            (("pass" if pytest_report.is_pass(report_before) else "fail") if report_before is not None and report_before.get("tests")
+             else ("pass" if (" passed" in before_tail and " failed" not in before_tail and " error" not in before_tail) else ("fail" if before_tail else "")))
             if args.pre_patch_run else ""
         ),
         "duration_clone_s": _dur("CLONE"),
+        "git_mirror_hit": bool(mirror_sha),
+        "env_cache_hit": bool(env_hit),
+        "pip_cache": pip_stats,
+        "duration_mirror_s": mirror_s,
         "duration_install_s": _dur("INSTALL"),
         "duration_test_s": _dur("TEST"),
+        "pytest_report": pytest_report.compact(report_after) if report_after is not None else {},
+        "test_impact": impact_info,
     }
     with open(os.path.join(run_dir, "result.json"), "w", encoding="utf-8") as f:
         json.dump(result, f, indent=2)
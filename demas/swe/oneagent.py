@@ -3,9 +3,10 @@
 # pip install -U autogen-agentchat autogen-ext[openai]
 # docker build -f Dockerfile.swe -t swebench-lite:py3.10 .
 
-import os, shlex, time, asyncio, subprocess, json, uuid
+import os, shlex, time, asyncio, subprocess, json, uuid, threading, contextvars, shutil
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional, Callable, Any, Dict
+from typing import List, Optional, Any, Dict, Tuple
 
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.teams import RoundRobinGroupChat
@@ -15,8 +16,9 @@ from autogen_agentchat.ui import Console
 from autogen_core.models import UserMessage
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 from demas.core import config as _cfg
+from demas.core import git_cache, env_cache, wheelhouse, ratelimit, preflight_cache, cassette, checkpoint, jsonl_logger, pipeline, pytest_report, pytest_server, test_cache, test_impact
 from demas.core.io import extract_pytest_tail
-from demas.core.docker_exec import run_docker_bash
+from demas.core.docker_exec import run_docker_bash, run_docker_bash_spooled, DockerSession, open_session, sessions_enabled
 
 # ---------------- config ----------------
 CHUTES_API_KEY  = os.environ.get("CHUTES_API_KEY")
@@ -47,6 +49,7 @@ TIMEOUT_CLONE  = _cfg.TIMEOUT_CLONE
 TIMEOUT_INSTALL= _cfg.TIMEOUT_INSTALL
 TIMEOUT_TEST   = _cfg.TIMEOUT_TEST
 DEPS_DIR      = "/workspace/_deps"  # persisted on host via volume mount
+MAX_CANDIDATES = int(os.environ.get("SWE_EVAL_MAX_CANDIDATES", "6"))  # swe_eval_patches fan-out
 
 TARGET_REPO = os.environ.get("TARGET_REPO", "https://github.com/pytest-dev/pytest")
 TARGET_REF  = os.environ.get("TARGET_REF", "")
@@ -64,6 +67,73 @@ RUN_ID = str(uuid.uuid4())
 LOG_DIR = os.path.join(RUN_BASE_DIR, "logs") if RUN_BASE_DIR else ""
 LOG_PATH = os.path.join(LOG_DIR, f"{TASK_ID or 'task'}.jsonl") if LOG_DIR else ""
 ATTEMPT_HINT = os.environ.get("ATTEMPT_HINT", "").strip()
+ATTEMPT_INDEX = int(os.environ.get("ATTEMPT_INDEX", "1") or 1)
+# Checkpoints shared by a task's attempts (set by swebench_batch.py when attempts > 1)
+CHECKPOINT_SCOPE = os.environ.get("CHECKPOINT_SCOPE", "")
+RESUME_CHECKPOINT = os.environ.get("RESUME_CHECKPOINT", "")
+
+
+@dataclass
+class AttemptState:
+    """Everything one agent attempt needs; tools read it via _st().
+
+    Defaults come from the env (standalone `python -m demas.swe.oneagent`); the
+    in-process batch engine builds one per attempt so many attempts can share a process.
+    """
+    target_repo: str = TARGET_REPO
+    target_ref: str = TARGET_REF
+    pytest_k: str = PYTEST_K
+    project_dir: Optional[str] = PROJECT_DIR
+    task_id: str = TASK_ID
+    run_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    log_path: str = LOG_PATH
+    attempt_hint: str = ATTEMPT_HINT
+    attempt: int = ATTEMPT_INDEX
+    model_name: str = MODEL_NAME
+    temperature: float = MODEL_TEMPERATURE
+    max_turns: int = MAX_TURNS
+    timeout_clone: int = TIMEOUT_CLONE
+    timeout_install: int = TIMEOUT_INSTALL
+    timeout_test: int = TIMEOUT_TEST
+    # Warm-pool container to attach to (None -> SWE_CONTAINER env)
+    container: Optional[str] = None
+    # One container per attempt when sessions are enabled; None -> per-call `docker run --rm`
+    session: Optional[DockerSession] = None
+    # Prepared-environment cache: key, hit entry, background store
+    env_key: str = ""
+    env_hit: Optional[Dict[str, Any]] = None
+    env_store: Optional[threading.Thread] = None
+    # Test-result cache: "<tree>:<deps>" fingerprint of the project (""=stale) and hit counters
+    tree_state: str = ""
+    test_cache_hits: int = 0
+    test_cache_misses: int = 0
+    # Affected-test selection: coverage map recorded on the unpatched tree, patch applied since
+    impact_recorded: bool = False
+    patched: bool = False
+    # Checkpoints: scope ("" -> per project), checkpoint to resume from, its meta, background save
+    checkpoint_scope: str = CHECKPOINT_SCOPE
+    resume_checkpoint: str = RESUME_CHECKPOINT
+    resume: Optional[Dict[str, Any]] = None
+    ckpt_store: Optional[threading.Thread] = None
+
+    @property
+    def project(self) -> str:
+        return self.project_dir or f"project_{(self.task_id or 'task').replace('/', '_')}_{self.run_id[:8]}"
+
+    @property
+    def ckpt_scope(self) -> str:
+        return self.checkpoint_scope or self.project
+
+
+_ATTEMPT: "contextvars.ContextVar[AttemptState]" = contextvars.ContextVar("demas_attempt")
+_DEFAULT_STATE = AttemptState(run_id=RUN_ID)
+
+def _st() -> AttemptState:
+    return _ATTEMPT.get(_DEFAULT_STATE)
+
+def _log_fields() -> Dict[str, Any]:
+    st = _st()
+    return {"run_id": st.run_id, "task_id": st.task_id, "model": st.model_name or None, "temperature": st.temperature}
 
 # ------------- model + preflight -------------
 def _provider_for_model(model_name: str) -> str:
@@ -77,65 +147,124 @@ def _provider_for_model(model_name: str) -> str:
 def make_client(model_name: str, *, temperature: float) -> OpenAIChatCompletionClient:
     provider = _provider_for_model(model_name)
     if provider == "openrouter":
-        if not OPENROUTER_API_KEY:
+        if not OPENROUTER_API_KEY and cassette.mode() != "replay":
             raise RuntimeError("OPENROUTER_API_KEY is not set but required for model '%s'" % model_name)
         client = OpenAIChatCompletionClient(
             model=model_name,
-            api_key=OPENROUTER_API_KEY,
+            api_key=OPENROUTER_API_KEY or "cassette-replay",
             base_url=OPENROUTER_BASE_URL,
             temperature=temperature,
             include_name_in_message=True,
             model_info=BASE_MODEL_INFO,
         )
-        return _enable_usage_injection(client)
+        return _enable_cassette(_enable_rate_limit(_enable_usage_injection(client), provider, model_name), model_name)
     # Default provider: Chutes
     client = OpenAIChatCompletionClient(
         model=model_name,
-        api_key=CHUTES_API_KEY,
+        # Replay never reaches the provider; the client still wants a key
+        api_key=CHUTES_API_KEY or ("cassette-replay" if cassette.mode() == "replay" else None),
         base_url=CHUTES_BASE_URL,
         temperature=temperature,
         include_name_in_message=True,
         model_info=BASE_MODEL_INFO,
     )
-    return _enable_usage_injection(client)
+    return _enable_cassette(_enable_rate_limit(_enable_usage_injection(client), provider, model_name), model_name)
 
 
 def _enable_usage_injection(client: OpenAIChatCompletionClient) -> OpenAIChatCompletionClient:
     # No-op: token usage capture removed for now
     return client
 
+def _enable_rate_limit(client: OpenAIChatCompletionClient, provider: str, model_name: str) -> OpenAIChatCompletionClient:
+    """Share in-flight/RPM/TPM limits for this provider+model across all workers (see demas.core.ratelimit)."""
+    if not ratelimit.limiter_enabled():
+        return client
+    return ratelimit.wrap_client(client, ratelimit.RateLimiter(provider, model_name), on_call=_log_llm_call)
+
+def _enable_cassette(client: OpenAIChatCompletionClient, model_name: str) -> OpenAIChatCompletionClient:
+    """LLM_CASSETTE=record|replay: capture or serve calls per model and task attempt (see demas.core.cassette)."""
+    return cassette.wrap_client(
+        client,
+        lambda: f"{model_name}__{_st().task_id or 'task'}__attempt{_st().attempt}",
+        # The attempt's log path is unique per run, task and attempt
+        lambda: os.path.abspath(_st().log_path) if _st().log_path else f"pid{os.getpid()}",
+    )
+
+def _log_llm_call(info: Dict[str, Any]) -> None:
+    _log_record({
+        "timestamp": _now_iso(), "role": "system", "content": "llm_call",
+        "tool_name": None, "tool_args": None, "tool_result": None, "usage": None,
+        **_log_fields(), "llm_call": info,
+    })
+
 async def preflight(client: OpenAIChatCompletionClient) -> bool:
     try:
-        stream = client.create_stream(
-            messages=[UserMessage(content="hi", source="user")],
-            extra_create_args={"max_tokens": 4, "stream_options": {"include_usage": True}},
-        )
-        async for _ in stream:
-            pass
+        # Probes are not part of a task trajectory: keep them out of cassettes
+        with cassette.bypass():
+            stream = client.create_stream(
+                messages=[UserMessage(content="hi", source="user")],
+                extra_create_args={"max_tokens": 4, "stream_options": {"include_usage": True}},
+            )
+            async for _ in stream:
+                pass
         return True
     except Exception:
         return False
 
-async def pick_ready_model() -> OpenAIChatCompletionClient:
+async def _preflight_cached(client: OpenAIChatCompletionClient, model_name: str, *, trust_failure: bool = True) -> bool:
+    """Preflight via the shared TTL cache: probe only when there is no fresh entry.
+
+    With trust_failure=False a cached failure is re-probed instead of returned.
+    """
+    if cassette.mode() == "replay":
+        return True
+    ok = preflight_cache.get(model_name)
+    if ok is None or (not ok and not trust_failure):
+        ok = await preflight(client)
+        preflight_cache.put(model_name, ok)
+    return ok
+
+async def preflight_all(models: Optional[List[str]] = None, *, temperature: Optional[float] = None) -> Dict[str, bool]:
+    """Probe all (Chutes) candidates concurrently and refresh the shared cache; OpenRouter is never probed."""
+    names = [m for m in (models or MODEL_CANDIDATES) if _provider_for_model(m) != "openrouter"]
+    if cassette.mode() == "replay":
+        return {m: True for m in names}
+    temperature = MODEL_TEMPERATURE if temperature is None else temperature
+
+    async def _probe(m: str) -> bool:
+        try:
+            ok = await preflight(make_client(m, temperature=temperature))
+        except Exception:
+            ok = False
+        preflight_cache.put(m, ok)
+        return ok
+
+    results = await asyncio.gather(*(_probe(m) for m in names))
+    return dict(zip(names, results))
+
+async def pick_ready_model(model_name: Optional[str] = None, temperature: Optional[float] = None) -> OpenAIChatCompletionClient:
+    model_name = MODEL_NAME if model_name is None else model_name
+    temperature = MODEL_TEMPERATURE if temperature is None else temperature
     # If a specific model is requested, use it directly
-    if MODEL_NAME:
-        c = make_client(MODEL_NAME, temperature=MODEL_TEMPERATURE)
+    if model_name:
+        c = make_client(model_name, temperature=temperature)
         # Skip preflight for OpenRouter to avoid false negatives on stream quirks
-        if _provider_for_model(MODEL_NAME) == "openrouter":
-            print(f"[preflight] Skipping preflight; using OpenRouter model: {MODEL_NAME}")
+        if _provider_for_model(model_name) == "openrouter":
+            print(f"[preflight] Skipping preflight; using OpenRouter model: {model_name}")
             return c
-        # For Chutes, keep a quick preflight
-        ok = await preflight(c)
+        # For Chutes, keep a quick preflight (skipped on a fresh success); a cached failure
+        # may be a transient blip and there is no fallback model, so re-probe it
+        ok = await _preflight_cached(c, model_name, trust_failure=False)
         if ok:
-            print(f"[preflight] Using model: {MODEL_NAME}")
+            print(f"[preflight] Using model: {model_name}")
             return c
-        raise RuntimeError(f"Requested model not available: {MODEL_NAME}")
+        raise RuntimeError(f"Requested model not available: {model_name}")
     for m in MODEL_CANDIDATES:
-        c = make_client(m, temperature=MODEL_TEMPERATURE)
+        c = make_client(m, temperature=temperature)
         if _provider_for_model(m) == "openrouter":
             print(f"[preflight] Skipping preflight; using OpenRouter model: {m}")
             return c
-        if await preflight(c):
+        if await _preflight_cached(c, m):
             print(f"[preflight] Using model: {m}")
             return c
         print(f"[preflight] Model not ready: {m} -> next")
@@ -157,14 +286,42 @@ def ensure_docker_image() -> None:
     except Exception:
         pass
 
+def _store_env_snapshot(proj: str, req_file: str) -> None:
+    """Snapshot project + container after a successful install (once, in the background).
+
+    Only a clean tree installed with the default recipe matches the cache key; tools that
+    change the tree or env wait for the snapshot first (_settle_env_snapshot).
+    """
+    st = _st()
+    if not st.env_key or st.session is None or st.env_hit is not None or st.env_store is not None:
+        return
+    if st.patched or req_file != "requirements.txt":
+        return
+    meta = {"repo": st.target_repo, "ref": st.target_ref, "image": DOCKER_IMAGE}
+    st.env_store = threading.Thread(target=env_cache.store, args=(st.env_key, st.session, proj), kwargs={"meta": meta}, daemon=True)
+    st.env_store.start()
+
+def _settle_env_snapshot() -> None:
+    """Wait for a running env-cache snapshot so it cannot capture a later change."""
+    st = _st()
+    if st.env_store is not None:
+        st.env_store.join(300)
+
 def _docker(cmd: str) -> tuple[int, str, str]:
-    return run_docker_bash(cmd, image=DOCKER_IMAGE, workdir="sandbox")
+    session = _st().session
+    if session is not None:
+        return session.run(cmd)
+    return run_docker_bash(cmd, image=DOCKER_IMAGE, workdir=_cfg.WORKDIR)
 
-# -------- logging helpers --------
-def _ensure_log_dir() -> None:
-    if LOG_DIR:
-        os.makedirs(LOG_DIR, exist_ok=True)
+def _docker_tail(cmd: str) -> tuple[int, str, str]:
+    """_docker for verbose commands (pytest, pip): output is spooled to disk and only the
+    last SWE_OUTPUT_TAIL_BYTES of each stream is returned (see demas.core.spool)."""
+    session = _st().session
+    res = session.run_spooled(cmd) if session is not None else run_docker_bash_spooled(cmd, image=DOCKER_IMAGE, workdir=_cfg.WORKDIR)
+    with res:
+        return res.code, res.stdout_tail, res.stderr_tail
 
+# -------- logging helpers --------
 def _truncate(s: str, limit: int = 8192) -> str:
     if s is None:
         return ""
@@ -189,14 +346,11 @@ def _redact(obj: Any) -> Any:
         return obj
 
 def _log_record(record: Dict[str, Any]) -> None:
-    if not LOG_PATH:
+    log_path = _st().log_path
+    if not log_path:
         return
-    _ensure_log_dir()
-    try:
-        with open(LOG_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
-    except Exception:
-        pass
+    # Queued; serialized and appended in batches by the logger's flusher thread
+    jsonl_logger.get(log_path).write(record)
 
 def _now_iso() -> str:
     return datetime.utcnow().isoformat() + "Z"
@@ -206,45 +360,62 @@ async def swe_clone(*, repo_url: str, ref: Optional[str] = None) -> str:
     _log_record({
         "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_clone",
         "tool_name": "swe_clone", "tool_args": _redact({"repo_url": repo_url, "ref": ref}),
-        "tool_result": "", "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": "", "usage": None, **_log_fields(),
     })
     # Determine a unique project directory name
-    proj = PROJECT_DIR or f"project_{(TASK_ID or 'task').replace('/', '_')}_{RUN_ID[:8]}"
+    st = _st()
+    proj = st.project
     proj_q = shlex.quote(proj)
-    # Support local path sources under /workspace (mounted host sandbox) as well as git URLs
-    script = (
-        "set -e\n"
-        f"rm -rf {proj_q}\n"
-        f"repo_src={shlex.quote(repo_url)}\n"
-        "case \"${repo_src}\" in \n"
-        f"  /workspace/*) mkdir -p {proj_q} && cp -R \"${{repo_src}}/.\" {proj_q} ;;\n"
-        f"  *) timeout {TIMEOUT_CLONE}s git clone --depth 1 {shlex.quote(repo_url)} {proj_q} ;;\n"
-        "esac\n"
-    )
-    if ref:
-        script += (
-            f"cd {proj_q} && timeout {TIMEOUT_CLONE}s git fetch --depth 1 origin {shlex.quote(ref)} && git checkout -q {shlex.quote(ref)}\n"
+    # Prefer the prepared-environment cache, then an offline checkout from the host
+    # mirror cache; fall back to a network clone
+    from_ckpt = st.resume is not None and repo_url == st.target_repo and (ref or "") == st.target_ref
+    from_env = not from_ckpt and st.env_hit is not None and repo_url == st.target_repo and (ref or "") == st.target_ref
+    sha = await asyncio.to_thread(git_cache.ensure_mirror, repo_url, ref or "") if (git_cache.mirror_enabled() and not (from_env or from_ckpt)) else ""
+    if from_ckpt:
+        # Resume from the previous attempt's post-install checkpoint
+        script = "set -e\n" + checkpoint.restore_script(st.ckpt_scope, st.resume_checkpoint, proj, st.resume.get("project", ""))
+    elif from_env:
+        script = "set -e\n" + env_cache.restore_script(st.env_key, proj, st.env_hit.get("project", ""))
+    elif sha:
+        script = "set -e\n" f"rm -rf {proj_q}\n" + git_cache.checkout_script(repo_url, sha, proj)
+    else:
+        # Support local path sources under /workspace (mounted host sandbox) as well as git URLs
+        script = (
+            "set -e\n"
+            f"rm -rf {proj_q}\n"
+            f"repo_src={shlex.quote(repo_url)}\n"
+            "case \"${repo_src}\" in \n"
+            f"  /workspace/*) mkdir -p {proj_q} && cp -R \"${{repo_src}}/.\" {proj_q} ;;\n"
+            f"  *) timeout {st.timeout_clone}s git clone --depth 1 {shlex.quote(repo_url)} {proj_q} ;;\n"
+            "esac\n"
         )
-    code, out, err = _docker(script)
+        if ref:
+            script += (
+                f"cd {proj_q} && timeout {st.timeout_clone}s git fetch --depth 1 origin {shlex.quote(ref)} && git checkout -q {shlex.quote(ref)}\n"
+            )
+    await asyncio.to_thread(_settle_env_snapshot)
+    code, out, err = await asyncio.to_thread(_docker, script)
+    _invalidate_tree()
+    if code == 0 and from_env and checkpoint.checkpoints_enabled() and st.ckpt_store is None:
+        # Cached environment == post-install state: make it the swe_restore point
+        await asyncio.to_thread(_checkpoint, checkpoint.AUTO_NAME, background=True)
     res = "(cloned)" if code == 0 else f"(exit {code})\nSTDOUT:\n{out}\nSTDERR:\n{err}"
     _log_record({
         "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_clone",
         "tool_args": _redact({"repo_url": repo_url, "ref": ref}),
-        "tool_result": _truncate(res), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": _truncate(res), "usage": None, **_log_fields(),
     })
     return res
 
-async def swe_install(*, req_file: str = "requirements.txt") -> str:
-    proj = PROJECT_DIR or f"project_{(TASK_ID or 'task').replace('/', '_')}_{RUN_ID[:8]}"
-    proj_q = shlex.quote(proj)
-    cmd = (
+def _install_cmd(proj_q: str, req_file: str) -> str:
+    """Install recipe for the project; its text also keys the prepared-environment cache."""
+    st = _st()
+    return (
         f"cd {proj_q} && "
-        "python -m pip install -q -U pip && "
+        # pip itself is upgraded at image build time; wheels come from the shared wheelhouse/cache
         "timeout 10s python -m pip install -q hatchling hatch-vcs meson-python ninja cython || true && "
         # Try editable install first, then fallback to regular install if it fails
-        f"(timeout {TIMEOUT_INSTALL}s python -m pip install -q -e . || timeout {TIMEOUT_INSTALL}s python -m pip install -q . || true) && "
+        f"(timeout {st.timeout_install}s python -m pip install -q -e . || timeout {st.timeout_install}s python -m pip install -q . || true) && "
         # If meson build artifacts exist, copy compiled .so into package dir to persist
         "if [ -d build ]; then so=$(find build -name '*_cfinancial*.so' | head -n1); "
         "if [ -n \"$so\" ]; then cp -f \"$so\" numpy_financial/; fi; fi && "
@@ -262,26 +433,122 @@ async def swe_install(*, req_file: str = "requirements.txt") -> str:
         "    fi; "
         "  fi; "
         "fi && "
-        f"if [ -f {shlex.quote(req_file)} ]; then timeout {TIMEOUT_INSTALL}s python -m pip install -q -r {shlex.quote(req_file)}; else echo 'no requirements.txt'; fi && "
+        f"if [ -f {shlex.quote(req_file)} ]; then timeout {st.timeout_install}s python -m pip install -q -r {shlex.quote(req_file)}; else echo 'no requirements.txt'; fi && "
         # testing requirements if present
-        f"if [ -f testing/requirements.txt ]; then timeout {TIMEOUT_INSTALL}s python -m pip install -q -r testing/requirements.txt; else echo 'no testing/requirements.txt'; fi"
+        f"if [ -f testing/requirements.txt ]; then timeout {st.timeout_install}s python -m pip install -q -r testing/requirements.txt; else echo 'no testing/requirements.txt'; fi"
     )
+
+async def swe_install(*, req_file: str = "requirements.txt") -> str:
+    proj = _st().project
+    proj_q = shlex.quote(proj)
+    cmd = _install_cmd(proj_q, req_file)
     _log_record({
         "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_install",
         "tool_name": "swe_install", "tool_args": _redact({"req_file": req_file}),
-        "tool_result": "", "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": "", "usage": None, **_log_fields(),
     })
-    code, out, err = _docker(cmd)
+    st = _st()
+    await asyncio.to_thread(_settle_env_snapshot)
+    if st.resume is not None and req_file == "requirements.txt":
+        code, out, err = 0, f"(checkpoint {st.resume_checkpoint}) install skipped", ""
+    elif st.env_hit is not None and req_file == "requirements.txt":
+        code, out, err = 0, f"(cached env {st.env_key[:12]}) install skipped", ""
+    else:
+        code, out, err = await asyncio.to_thread(_docker_tail, cmd)
+        _invalidate_tree()
+        if code == 0:
+            _store_env_snapshot(proj, req_file)
+            # Rollback point for swe_restore; later attempts of the task resume from it,
+            # so only a clean (unpatched) install qualifies
+            if checkpoint.checkpoints_enabled() and st.ckpt_store is None and not st.patched:
+                await asyncio.to_thread(_checkpoint, checkpoint.AUTO_NAME, background=True)
     res = (out or "ok").strip() if code == 0 else f"(exit {code})\nSTDOUT:\n{out}\nSTDERR:\n{err}"
     _log_record({
         "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_install",
         "tool_args": _redact({"req_file": req_file}),
-        "tool_result": _truncate(res), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": _truncate(res), "usage": None, **_log_fields(),
     })
     return res
 
+def _tree_state() -> str:
+    """Fingerprint of the project tree + installed deps, memoized until a tool mutates them."""
+    st = _st()
+    if not st.tree_state:
+        code, out, _ = _docker(f"cd {shlex.quote(st.project)} && {test_cache.KEY_CMD}")
+        st.tree_state = test_cache.parse_state(out) if code == 0 else ""
+    return st.tree_state
+
+def _invalidate_tree() -> None:
+    _st().tree_state = ""
+
+def _pytest_run(pytest_args: str) -> Tuple[int, str, str, Optional[Dict[str, Any]], str]:
+    """Run pytest in the project with a JUnit report.
+
+    Returns (code, stdout tail, stderr tail, parsed report or None, test cache "hit"|"miss"|"off");
+    tails are capped at SWE_OUTPUT_TAIL_BYTES, the same bound test-cache entries keep.
+    """
+    st = _st()
+    proj = st.project
+    # First run on the unpatched tree records per-test coverage for later selection
+    record = test_impact.impact_enabled() and not st.patched and not st.impact_recorded
+    key = ""
+    if test_cache.cache_enabled():
+        state = _tree_state()
+        key = test_cache.cache_key(state, pytest_args, st.timeout_test) if state else ""
+    if key and not record:
+        hit = test_cache.get(key)
+        if hit is not None:
+            st.test_cache_hits += 1
+        else:
+            st.test_cache_misses += 1
+    else:
+        hit = None
+    if record:
+        st.impact_recorded = True
+        st.test_cache_misses += bool(key)
+    if hit is not None:
+        code, out, err, report = int(hit.get("code", 1)), hit.get("out", ""), hit.get("err", ""), hit.get("report")
+    else:
+        junit, host_path = pytest_report.junit_flag()
+        prefix = test_impact.record_prefix(test_impact.coverage_file(proj)) if record else ""
+        cmd = (
+            f"export PYTHONPATH=/workspace/{proj}:/workspace/{proj}/src:{DEPS_DIR}:$PYTHONPATH; {prefix}"
+            f"{pytest_report.mkdir_cmd()} && cd {shlex.quote(proj)} && timeout {st.timeout_test}s {pytest_server.pytest_cmd(st.session is not None)} {pytest_args}{' $covargs' if record else ''} {pytest_report.shard_flag()} {junit}"
+        )
+        with pipeline.test_slot():
+            code, out, err = _docker_tail(cmd)
+        report = pytest_report.collect(host_path)
+        if key:
+            test_cache.put(key, code=code, out=out, err=err, report=report)
+    if report is not None and st.log_path:
+        # Latest full report of the attempt, next to its JSONL log
+        try:
+            with open(os.path.splitext(st.log_path)[0] + ".pytest_report.json", "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        except Exception:
+            pass
+    return code, out, err, report, ("hit" if hit is not None else "miss") if key else "off"
+
+def _impact_selection() -> Optional[Dict[str, Any]]:
+    """Tests affected by the patch so far (see demas.core.test_impact); None when not applicable."""
+    st = _st()
+    if not (test_impact.impact_enabled() and st.patched and st.impact_recorded):
+        return None
+    _, out, _ = _docker(f"cd {shlex.quote(st.project)} && {test_impact.select_cmd(test_impact.coverage_file(st.project))}")
+    return test_impact.parse_selection(out)
+
+def _pytest_tail(out: str, err: str, report: Optional[Dict[str, Any]]) -> str:
+    """Summary line from the structured report; stdout scraping only when pytest wrote none."""
+    if report is not None and (report.get("tests") or not (out or "").strip()):
+        return pytest_report.summary_line(report)
+    return extract_pytest_tail(out, err)
+
+def _report_fields(report: Optional[Dict[str, Any]], cache: str = "off") -> Dict[str, Any]:
+    fields: Dict[str, Any] = {"test_cache": cache}
+    if report is not None:
+        fields["pytest_report"] = pytest_report.compact(report)
+    return fields
+
 async def swe_pytest_auto(*, pytest_args: str = "-q") -> str:
     """Run pytest; if ModuleNotFoundError occurs, attempt to install the missing
     module via pip (site-packages under DEPS_DIR), then re-run tests once.
@@ -291,20 +558,14 @@ async def swe_pytest_auto(*, pytest_args: str = "-q") -> str:
     _log_record({
         "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_pytest_auto",
         "tool_name": "swe_pytest_auto", "tool_args": _redact({"pytest_args": pytest_args}),
-        "tool_result": "", "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": "", "usage": None, **_log_fields(),
     })
 
     # First attempt
-    proj = PROJECT_DIR or f"project_{(TASK_ID or 'task').replace('/', '_')}_{RUN_ID[:8]}"
-    proj_q = shlex.quote(proj)
-    cmd = (
-        f"export PYTHONPATH=/workspace/{proj}:/workspace/{proj}/src:{DEPS_DIR}:$PYTHONPATH; "
-        f"cd {proj_q} && timeout {TIMEOUT_TEST}s python -m pytest {pytest_args}"
-    )
-    code, out, err = _docker(cmd)
+    proj = _st().project
+    code, out, err, report, cache = await asyncio.to_thread(_pytest_run, pytest_args)
     combined = (out or "") + ("\n" + err if err else "")
-    tail = extract_pytest_tail(out, err)
+    tail = _pytest_tail(out, err, report)
 
     # Detect ModuleNotFoundError
     missing = None
@@ -323,8 +584,7 @@ async def swe_pytest_auto(*, pytest_args: str = "-q") -> str:
         _log_record({
             "timestamp": _now_iso(), "role": "assistant", "content": f"Detected missing module: {missing}; attempting pip install",
             "tool_name": "swe_pytest_auto", "tool_args": _redact({"missing": missing}),
-            "tool_result": "", "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-            "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+            "tool_result": "", "usage": None, **_log_fields(),
         })
         # Prefer installing the top-level package name
         top_pkg = missing.split(".")[0]
@@ -338,7 +598,7 @@ async def swe_pytest_auto(*, pytest_args: str = "-q") -> str:
             f"export PYTHONPATH=/workspace/{proj}:{DEPS_DIR}:$PYTHONPATH; "
             f"python -c 'import {top_pkg}; print(\"ok\")'"
         )
-        vcode, vout, verr = _docker(verify_cmd)
+        vcode, vout, verr = await asyncio.to_thread(_docker, verify_cmd)
         if vcode != 0:
             # Install via pip into deps dir
             try:
@@ -346,89 +606,74 @@ async def swe_pytest_auto(*, pytest_args: str = "-q") -> str:
                 _log_record({
                     "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_pip_install",
                     "tool_args": _redact({"packages": top_pkg}),
-                    "tool_result": _truncate(install_res), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-                    "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+                    "tool_result": _truncate(install_res), "usage": None, **_log_fields(),
                 })
             except Exception as e:
                 _log_record({
                     "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_pip_install",
                     "tool_args": _redact({"packages": top_pkg}),
-                    "tool_result": _truncate(f"install_error: {e}"), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-                    "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+                    "tool_result": _truncate(f"install_error: {e}"), "usage": None, **_log_fields(),
                 })
         # Re-run pytest and return the tail
-        code2, out2, err2 = _docker(cmd)
-        tail2 = extract_pytest_tail(out2, err2)
+        code2, out2, err2, report2, cache2 = await asyncio.to_thread(_pytest_run, pytest_args)
+        tail2 = _pytest_tail(out2, err2, report2)
         res = tail2 or tail or "(no stdout)"
         _log_record({
             "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_pytest_auto",
             "tool_args": _redact({"pytest_args": pytest_args}),
-            "tool_result": _truncate(res), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-            "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+            "tool_result": _truncate(res), "usage": None, **_log_fields(), **_report_fields(report2 or report, cache2),
         })
         return res
 
-    # No missing module detected; if tests succeeded but we didn't capture a pytest
-    # summary line, run a quick summary-only pass to get a proper tail that contains
-    # " passed" so termination can trigger reliably.
-    if code == 0 and ((" passed" not in tail) or not tail.strip()):
-        code_s, out_s, err_s = _docker(
-            f"export PYTHONPATH=/workspace/{proj}:/workspace/{proj}/src:{DEPS_DIR}:$PYTHONPATH; "
-            f"cd {proj_q} && timeout {TIMEOUT_TEST}s python -m pytest -q | tail -n 1"
-        )
-        last_s = [ln for ln in (out_s or "").splitlines() if ln.strip()]
-        if last_s:
-            tail = last_s[-1]
-    # No missing module detected; return final tail
+    # No missing module detected; the JUnit report always yields a summary line,
+    # so no extra summary-only pass is needed for termination to trigger
     res = tail or "(no stdout)"
     _log_record({
         "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_pytest_auto",
         "tool_args": _redact({"pytest_args": pytest_args}),
-        "tool_result": _truncate(res), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": _truncate(res), "usage": None, **_log_fields(), **_report_fields(report, cache),
     })
     return res
 
 async def swe_pytest(*, pytest_args: str = "-q") -> str:
-    proj = PROJECT_DIR or f"project_{(TASK_ID or 'task').replace('/', '_')}_{RUN_ID[:8]}"
-    proj_q = shlex.quote(proj)
-    cmd = (
-        f"export PYTHONPATH=/workspace/{proj}:/workspace/{proj}/src:{DEPS_DIR}:$PYTHONPATH; "
-        f"cd {proj_q} && timeout {TIMEOUT_TEST}s python -m pytest {pytest_args}"
-    )
     _log_record({
         "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_pytest",
         "tool_name": "swe_pytest", "tool_args": _redact({"pytest_args": pytest_args}),
-        "tool_result": "", "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": "", "usage": None, **_log_fields(),
     })
-    code, out, err = _docker(cmd)
-    tail = extract_pytest_tail(out, err)
+    # After a patch, run only the tests that executed the changed files (SWE_TEST_IMPACT=1)
+    sel = await asyncio.to_thread(_impact_selection)
+    impact: Dict[str, Any] = {}
+    if sel is not None and sel.get("mode") == "selected":
+        tests = sel.get("tests") or []
+        code, out, err, report, cache = await asyncio.to_thread(_pytest_run, f"{pytest_args} " + " ".join(shlex.quote(t) for t in tests))
+        impact = {"mode": "selected", "selected": len(tests), "changed": sel.get("changed", [])[:20], "recorded_tests": sel.get("recorded_tests")}
+        if test_impact.confirm_enabled() and report is not None and pytest_report.is_pass(report):
+            code, out, err, report, cache = await asyncio.to_thread(_pytest_run, pytest_args)
+            impact["confirmed"] = True
+    else:
+        code, out, err, report, cache = await asyncio.to_thread(_pytest_run, pytest_args)
+        if sel is not None:
+            impact = {"mode": "full", "reason": sel.get("reason", "")}
+    tail = _pytest_tail(out, err, report)
     res = tail or "(no stdout)"
     _log_record({
         "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_pytest",
         "tool_args": _redact({"pytest_args": pytest_args}),
-        "tool_result": _truncate(res), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": _truncate(res), "usage": None, **_log_fields(), **_report_fields(report, cache),
+        **({"test_impact": impact} if impact else {}),
     })
     return res
 
 async def swe_pytest_full(*, pytest_args: str = "-q -x -vv") -> str:
     """Run pytest and return the last ~200 lines of combined stdout+stderr, with ' passed' sanitized
     to avoid triggering termination conditions inadvertently."""
-    proj = PROJECT_DIR or f"project_{(TASK_ID or 'task').replace('/', '_')}_{RUN_ID[:8]}"
-    proj_q = shlex.quote(proj)
-    cmd = (
-        f"export PYTHONPATH=/workspace/{proj}:/workspace/{proj}/src:{DEPS_DIR}:$PYTHONPATH; "
-        f"cd {proj_q} && timeout {TIMEOUT_TEST}s python -m pytest {pytest_args}"
-    )
     _log_record({
         "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_pytest_full",
         "tool_name": "swe_pytest_full", "tool_args": _redact({"pytest_args": pytest_args}),
-        "tool_result": "", "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": "", "usage": None, **_log_fields(),
     })
-    code, out, err = _docker(cmd)
+    code, out, err, report, cache = await asyncio.to_thread(_pytest_run, pytest_args)
     text = (out or "") + ("\n" + err if err else "")
     lines = [ln for ln in text.splitlines() if ln is not None]
     tail_block = "\n".join(lines[-200:])
@@ -437,8 +682,7 @@ async def swe_pytest_full(*, pytest_args: str = "-q -x -vv") -> str:
     _log_record({
         "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_pytest_full",
         "tool_args": _redact({"pytest_args": pytest_args}),
-        "tool_result": _truncate(res), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": _truncate(res), "usage": None, **_log_fields(), **_report_fields(report, cache),
     })
     return res
 
@@ -446,7 +690,7 @@ async def swe_read_file(*, path: str, max_bytes: int = 20000) -> str:
     """Read a file inside the project (relative path), returning up to max_bytes."""
     rp = shlex.quote(path)
     mb = max(1, int(max_bytes))
-    proj = PROJECT_DIR or f"project_{(TASK_ID or 'task').replace('/', '_')}_{RUN_ID[:8]}"
+    proj = _st().project
     proj_q = shlex.quote(proj)
     cmd = (
         f"cd {proj_q} && if [ -f {rp} ]; then head -c {mb} -- {rp}; else echo '(file not found)'; fi"
@@ -454,16 +698,14 @@ async def swe_read_file(*, path: str, max_bytes: int = 20000) -> str:
     _log_record({
         "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_read_file",
         "tool_name": "swe_read_file", "tool_args": _redact({"path": path, "max_bytes": max_bytes}),
-        "tool_result": "", "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": "", "usage": None, **_log_fields(),
     })
-    code, out, err = _docker(cmd)
+    code, out, err = await asyncio.to_thread(_docker, cmd)
     res = (out or "(empty)") if code == 0 else f"(exit {code})\nSTDOUT:\n{out}\nSTDERR:\n{err}"
     _log_record({
         "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_read_file",
         "tool_args": _redact({"path": path, "max_bytes": max_bytes}),
-        "tool_result": _truncate(res), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": _truncate(res), "usage": None, **_log_fields(),
     })
     return res
 
@@ -472,23 +714,24 @@ async def swe_pip_install(*, packages: str) -> str:
     pk = packages.strip()
     if not pk:
         return "(no packages)"
+    st = _st()
     cmd = (
         f"mkdir -p {DEPS_DIR} && "
-        f"timeout {TIMEOUT_INSTALL}s python -m pip install -q -t {DEPS_DIR} {shlex.quote(pk)}"
+        f"timeout {st.timeout_install}s python -m pip install -q -t {DEPS_DIR} {shlex.quote(pk)}"
     )
     _log_record({
         "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_pip_install",
         "tool_name": "swe_pip_install", "tool_args": _redact({"packages": packages}),
-        "tool_result": "", "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": "", "usage": None, **_log_fields(),
     })
-    code, out, err = _docker(cmd)
+    await asyncio.to_thread(_settle_env_snapshot)
+    code, out, err = await asyncio.to_thread(_docker_tail, cmd)
+    _invalidate_tree()
     res = "ok" if code == 0 else f"(exit {code})\nSTDOUT:\n{out}\nSTDERR:\n{err}"
     _log_record({
         "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_pip_install",
         "tool_args": _redact({"packages": packages}),
-        "tool_result": _truncate(res), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": _truncate(res), "usage": None, **_log_fields(),
     })
     return res
 async def swe_apply_patch_text(*, diff_text: str) -> str:
@@ -497,10 +740,9 @@ async def swe_apply_patch_text(*, diff_text: str) -> str:
         "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_apply_patch_text",
         "tool_name": "swe_apply_patch_text",
         "tool_args": _redact({"diff_text": f"<diff_len={len(diff_text)}>"}),
-        "tool_result": "", "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": "", "usage": None, **_log_fields(),
     })
-    proj = PROJECT_DIR or f"project_{(TASK_ID or 'task').replace('/', '_')}_{RUN_ID[:8]}"
+    proj = _st().project
     script = (
         "set -e\n"
         "cd /workspace\n"
@@ -508,58 +750,326 @@ async def swe_apply_patch_text(*, diff_text: str) -> str:
         f"cd {shlex.quote(proj)}\n"
         "timeout 3s git apply /workspace/patch.diff && echo PATCH_APPLIED || (echo PATCH_FAILED >&2; exit 3)\n"
     )
-    code, out, err = _docker(script)
+    await asyncio.to_thread(_settle_env_snapshot)
+    code, out, err = await asyncio.to_thread(_docker, script)
+    # Any patch (even a failed, partially applied one) makes cached test results stale
+    _invalidate_tree()
+    _st().patched = True
     res = (out or "").strip() if code == 0 else f"(exit {code})\nSTDOUT:\n{out}\nSTDERR:\n{err}"
     _log_record({
         "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_apply_patch_text",
         "tool_args": _redact({"diff_text": f"<diff_len={len(diff_text)}>"}),
-        "tool_result": _truncate(res), "usage": None, "run_id": RUN_ID, "task_id": TASK_ID,
-        "model": MODEL_NAME or None, "temperature": MODEL_TEMPERATURE,
+        "tool_result": _truncate(res), "usage": None, **_log_fields(),
+    })
+    return res
+
+def _sanitize_tail(text: str) -> str:
+    """Keep pytest summaries from tripping the team's termination conditions."""
+    return text.replace(" passed", " p✓ssed").replace(" no tests ran", " no tests r✓n")
+
+def _eval_patches(diffs: List[str], pytest_args: str) -> List[Dict[str, Any]]:
+    """Apply each diff to its own copy of the project and test all copies concurrently."""
+    st = _st()
+    proj = st.project
+    tag = f"{proj}__{uuid.uuid4().hex[:6]}"
+    host_dir = os.path.join(_cfg.WORKDIR, "_candidates", tag)
+    ctr_dir = f"/workspace/_candidates/{tag}"
+    os.makedirs(host_dir, exist_ok=True)
+    reports: List[str] = []
+    script = f"set +e\n{pytest_report.mkdir_cmd()}\n"
+    for i, diff in enumerate(diffs, 1):
+        with open(os.path.join(host_dir, f"{i}.diff"), "w", encoding="utf-8") as f:
+            f.write(diff if diff.endswith("\n") else diff + "\n")
+        junit, host_report = pytest_report.junit_flag(f"{tag}_{i}")
+        reports.append(host_report)
+        cand = shlex.quote(f"{proj}__cand{i}")
+        # Real copies (copy-on-write where the filesystem supports it), not hardlinks: tests
+        # that write files in place (fixtures, sqlite, .git/index) must not touch the
+        # agent's tree or the other candidates
+        script += (
+            f"( rm -rf {cand} && cp -a --reflink=auto {shlex.quote(proj)} {cand} && cd {cand} && "
+            f"if timeout 3s git apply {ctr_dir}/{i}.diff 2> {ctr_dir}/{i}.apply; then "
+            f"export PYTHONPATH=/workspace/{cand}:/workspace/{cand}/src:{DEPS_DIR}:$PYTHONPATH; "
+            f"timeout {st.timeout_test}s python -m pytest {pytest_args} -p no:cacheprovider {junit} > {ctr_dir}/{i}.out 2>&1; "
+            f"echo $? > {ctr_dir}/{i}.rc; else echo apply_failed > {ctr_dir}/{i}.rc; fi ) &\n"
+        )
+    script += "wait\n" + "".join(f"rm -rf {shlex.quote(f'{proj}__cand{i}')}\n" for i in range(1, len(diffs) + 1))
+    with pipeline.test_slot():
+        _docker(script)
+
+    def _read(name: str) -> str:
+        try:
+            with open(os.path.join(host_dir, name), "r", encoding="utf-8", errors="replace") as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    rows: List[Dict[str, Any]] = []
+    for i in range(1, len(diffs) + 1):
+        rc = _read(f"{i}.rc").strip()
+        report = pytest_report.collect(reports[i - 1])
+        applied = bool(rc) and rc != "apply_failed"
+        if not applied:
+            summary = "patch did not apply: " + (" ".join(_read(f"{i}.apply").split())[:200] or "no result")
+        elif report is not None and (report.get("tests") or not _read(f"{i}.out").strip()):
+            summary = pytest_report.summary_line(report)
+        else:
+            summary = extract_pytest_tail(_read(f"{i}.out"), "") or f"(exit {rc})"
+        rows.append({
+            "candidate": i, "applied": applied, "exit_code": int(rc) if rc.isdigit() else None,
+            "passed": bool(report is not None and pytest_report.is_pass(report)),
+            "summary": summary, "report": pytest_report.compact(report) if report is not None else None,
+        })
+    shutil.rmtree(host_dir, ignore_errors=True)
+    return rows
+
+async def swe_eval_patches(*, diffs: List[str], pytest_args: str = "-q") -> str:
+    """Test several candidate unified diffs at once, each in its own copy of the project.
+
+    Returns one line per candidate (applied?, test summary) without changing the project;
+    apply the winner afterwards with swe_apply_patch_text.
+    """
+    diffs = [d for d in (diffs or []) if (d or "").strip()][:MAX_CANDIDATES]
+    _log_record({
+        "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_eval_patches",
+        "tool_name": "swe_eval_patches",
+        "tool_args": _redact({"diffs": [f"<diff_len={len(d)}>" for d in diffs], "pytest_args": pytest_args}),
+        "tool_result": "", "usage": None, **_log_fields(),
+    })
+    if not diffs:
+        return "(no diffs)"
+    await asyncio.to_thread(_settle_env_snapshot)
+    rows = await asyncio.to_thread(_eval_patches, diffs, pytest_args)
+    best = max(rows, key=lambda r: (r["passed"], (r["report"] or {}).get("passed") or 0, -((r["report"] or {}).get("failed") or 0)))
+    lines = [f"#{r['candidate']} {'applied' if r['applied'] else 'not applied'} | {_sanitize_tail(r['summary'])}" for r in rows]
+    if best["applied"]:
+        lines.append(f"best: #{best['candidate']}")
+    res = "\n".join(lines)
+    _log_record({
+        "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_eval_patches",
+        "tool_args": _redact({"diffs": [f"<diff_len={len(d)}>" for d in diffs], "pytest_args": pytest_args}),
+        "tool_result": _truncate(res), "usage": None, **_log_fields(),
+        "candidates": [{k: v for k, v in r.items() if k != "summary"} for r in rows],
+    })
+    return res
+
+def _checkpoint(name: str, *, background: bool = False) -> str:
+    """Copy the project into checkpoint `name`, then commit the container (optionally in the background)."""
+    st = _st()
+    code, out, err = _docker(checkpoint.snapshot_script(st.project, st.ckpt_scope, name))
+    if code != 0:
+        return f"(exit {code})\nSTDOUT:\n{out}\nSTDERR:\n{err}"
+    session = st.session
+    meta = {"project": st.project, "patched": st.patched}
+    run = session.run if session is not None else (lambda c: run_docker_bash(c, image=DOCKER_IMAGE, workdir=_cfg.WORKDIR))
+    if background:
+        st.ckpt_store = threading.Thread(target=checkpoint.save_env, args=(st.ckpt_scope, name, session, run), kwargs={"meta": meta}, daemon=True)
+        st.ckpt_store.start()
+    else:
+        checkpoint.save_env(st.ckpt_scope, name, session, run, meta=meta)
+    return f"(checkpoint {name} saved)"
+
+def _restore(name: str) -> str:
+    """Restore the project from checkpoint `name`; swap to its container image if pip state differs."""
+    st = _st()
+    if st.ckpt_store is not None:
+        st.ckpt_store.join(300)
+    meta = checkpoint.lookup(st.ckpt_scope, name)
+    if meta is None:
+        return f"(no checkpoint named {name})"
+    env_note = ""
+    if st.session is not None and meta.get("image_tag"):
+        _, fp, _ = _docker(checkpoint.ENV_FINGERPRINT_CMD)
+        if (fp or "").strip() != meta.get("env_fp"):
+            # Owned sessions are removed; an attached pool container is left to the pool
+            old = st.session
+            st.session = open_session(image=meta["image_tag"], workdir=_cfg.WORKDIR, attach=False)
+            old.close()
+            env_note = ", environment restored"
+    code, out, err = _docker(checkpoint.restore_script(st.ckpt_scope, name, st.project, meta.get("project", "")))
+    _invalidate_tree()
+    st.patched = bool(meta.get("patched"))
+    if code != 0:
+        return f"(exit {code})\nSTDOUT:\n{out}\nSTDERR:\n{err}"
+    return f"(restored {name}{env_note})"
+
+async def swe_checkpoint(*, name: str = "manual") -> str:
+    """Save the project dir and installed environment as checkpoint `name` (see swe_restore)."""
+    _log_record({
+        "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_checkpoint",
+        "tool_name": "swe_checkpoint", "tool_args": _redact({"name": name}),
+        "tool_result": "", "usage": None, **_log_fields(),
+    })
+    res = await asyncio.to_thread(_checkpoint, name)
+    _log_record({
+        "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_checkpoint",
+        "tool_args": _redact({"name": name}),
+        "tool_result": _truncate(res), "usage": None, **_log_fields(),
+    })
+    return res
+
+async def swe_restore(*, name: str = checkpoint.AUTO_NAME) -> str:
+    """Roll the project (and its environment) back to checkpoint `name`; "post_install" exists after swe_install."""
+    _log_record({
+        "timestamp": _now_iso(), "role": "assistant", "content": "CALL swe_restore",
+        "tool_name": "swe_restore", "tool_args": _redact({"name": name}),
+        "tool_result": "", "usage": None, **_log_fields(),
+    })
+    res = await asyncio.to_thread(_restore, name)
+    _log_record({
+        "timestamp": _now_iso(), "role": "tool", "content": "", "tool_name": "swe_restore",
+        "tool_args": _redact({"name": name}),
+        "tool_result": _truncate(res), "usage": None, **_log_fields(),
     })
     return res
 
-# ------------- tool wrappers for logging -------------
-def _wrap_tool(func: Callable[..., Any], name: str) -> Callable[..., Any]:
-    async def _wrapped(**kwargs):
-        # log call
+def _log_test_cache_stats() -> None:
+    st = _st()
+    n = st.test_cache_hits + st.test_cache_misses
+    if n:
         _log_record({
-            "timestamp": _now_iso(),
-            "role": "assistant",
-            "content": f"CALL {name}",
-            "tool_name": name,
-            "tool_args": _redact(kwargs),
-            "tool_result": "",
-            "usage": None,
-            "run_id": RUN_ID,
-            "task_id": TASK_ID,
-            "model": MODEL_NAME or None,
-            "temperature": MODEL_TEMPERATURE,
+            "timestamp": _now_iso(), "role": "system", "content": "test_cache_stats",
+            "tool_name": None, "tool_args": None, "tool_result": None, "usage": None,
+            **_log_fields(), "test_cache": {"hits": st.test_cache_hits, "misses": st.test_cache_misses, "hit_rate": round(st.test_cache_hits / n, 3)},
         })
-        res = await func(**kwargs)
+
+def _log_pip_stats() -> None:
+    """Record wheelhouse/cache hits and network downloads for this attempt's pip calls."""
+    try:
+        _, out, _ = _docker(wheelhouse.PIP_STATS_CMD)
+        stats = wheelhouse.parse_pip_stats(out)
+    except Exception:
+        stats = {}
+    if stats:
         _log_record({
-            "timestamp": _now_iso(),
-            "role": "tool",
-            "content": "",
-            "tool_name": name,
-            "tool_args": _redact(kwargs),
-            "tool_result": _truncate(res if isinstance(res, str) else str(res)),
-            "usage": None,
-            "run_id": RUN_ID,
-            "task_id": TASK_ID,
-            "model": MODEL_NAME or None,
-            "temperature": MODEL_TEMPERATURE,
+            "timestamp": _now_iso(), "role": "system", "content": "pip_cache_stats",
+            "tool_name": None, "tool_args": None, "tool_result": None, "usage": None,
+            **_log_fields(), "pip_cache": stats,
         })
-        return res
-    return _wrapped
+
+def _env_key() -> str:
+    st = _st()
+    return env_cache.env_key(st.target_repo, st.target_ref, DOCKER_IMAGE, _install_cmd("<project>", "requirements.txt"))
+
+async def prepare_environment(state: AttemptState) -> Dict[str, Any]:
+    """Clone and install `state`'s task into the prepared-environment cache, without a model.
+
+    Prepare stage of the pipelined batch scheduler: the attempt that follows finds an
+    env-cache hit and starts on an installed workspace. Returns {"env": "hit"|"built"|
+    "failed"|"off", "key": ...}.
+    """
+    repo = state.target_repo
+    if not repo or repo.startswith("/workspace/"):
+        return {"env": "off"}
+    if git_cache.mirror_enabled():
+        await asyncio.to_thread(git_cache.ensure_mirror, repo, state.target_ref or "")
+    if not (env_cache.cache_enabled() and sessions_enabled()):
+        return {"env": "off"}
+    token = _ATTEMPT.set(state)
+    try:
+        key = _env_key()
+        if await asyncio.to_thread(env_cache.lookup, key) is not None:
+            return {"env": "hit", "key": key}
+        state.session = await asyncio.to_thread(open_session, image=DOCKER_IMAGE, workdir=_cfg.WORKDIR, attach=False, container="")
+        if state.session is None:
+            return {"env": "off"}
+        ok = False
+        try:
+            if (await swe_clone(repo_url=repo, ref=state.target_ref or None)) == "(cloned)":
+                code, _, _ = await asyncio.to_thread(_docker_tail, _install_cmd(shlex.quote(state.project), "requirements.txt"))
+                meta = {"repo": repo, "ref": state.target_ref, "image": DOCKER_IMAGE}
+                ok = code == 0 and await asyncio.to_thread(env_cache.store, key, state.session, state.project, meta=meta)
+            await asyncio.to_thread(_docker, f"rm -rf {shlex.quote(state.project)}")
+        finally:
+            await asyncio.to_thread(state.session.close)
+            state.session = None
+        return {"env": "built" if ok else "failed", "key": key}
+    finally:
+        _ATTEMPT.reset(token)
 
 # ---------------- main ----------------
+def _reap_attempt(state: AttemptState) -> None:
+    """Teardown of a cancelled attempt: let its snapshots finish, then drop private
+    checkpoints and the session (the commits need the container alive)."""
+    for t in (state.env_store, state.ckpt_store):
+        if t is not None:
+            t.join(300)
+    if not state.checkpoint_scope:
+        checkpoint.remove_scope(state.ckpt_scope)
+    session, state.session = state.session, None
+    if session is not None:
+        session.close()
+
+async def run_attempt(state: AttemptState, *, model_client: Optional[OpenAIChatCompletionClient] = None, quiet: bool = False) -> Any:
+    """Run one agent attempt with its own container and logs; returns the team result.
+
+    The batch engine calls this concurrently with a shared `model_client`; state is
+    per-coroutine (context variable), so attempts do not see each other's settings.
+    """
+    token = _ATTEMPT.set(state)
+    try:
+        model = model_client or await pick_ready_model(state.model_name, state.temperature)
+        # Prepared-environment cache: start from the snapshot image on a hit (needs a session)
+        if env_cache.cache_enabled() and state.target_repo and not state.target_repo.startswith("/workspace/"):
+            state.env_key = _env_key()
+            state.env_hit = await asyncio.to_thread(env_cache.lookup, state.env_key)
+        if state.resume_checkpoint and state.checkpoint_scope:
+            state.resume = await asyncio.to_thread(checkpoint.lookup, state.checkpoint_scope, state.resume_checkpoint)
+            if state.resume is not None and state.resume.get("patched"):
+                # A later attempt must start from a clean install, not the previous patch
+                state.resume = None
+        resume_image = (state.resume or {}).get("image_tag", "")
+        image = resume_image or (state.env_hit["image_tag"] if state.env_hit else DOCKER_IMAGE)
+        state.session = await asyncio.to_thread(open_session, image=image, workdir=_cfg.WORKDIR, attach=state.env_hit is None and not resume_image, container=state.container)
+        if state.session is None:
+            # Installed state only survives in a session container
+            state.env_key, state.env_hit, state.resume = "", None, None
+        elif state.resume is not None and not quiet:
+            print(f"[checkpoint] Resuming from {state.resume_checkpoint}")
+        elif state.env_hit and not quiet:
+            print(f"[env-cache] Using prepared environment {state.env_key[:12]}")
+        cancelled = False
+        try:
+            return await _run_team(model, quiet=quiet)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            _log_test_cache_stats()
+            test_impact.cleanup(state.project)
+            if cancelled:
+                # Timed out by the caller: hand background snapshots and teardown to a reaper
+                # thread instead of holding the caller's job slot while they finish
+                threading.Thread(target=_reap_attempt, args=(state,), daemon=True).start()
+            else:
+                if state.env_store is not None:
+                    await asyncio.to_thread(state.env_store.join, 300)
+                if state.ckpt_store is not None:
+                    await asyncio.to_thread(state.ckpt_store.join, 300)
+                if not state.checkpoint_scope:
+                    # Attempt-private checkpoints; batch-scoped ones are removed by the batch runner
+                    await asyncio.to_thread(checkpoint.remove_scope, state.ckpt_scope)
+                if state.session is not None:
+                    await asyncio.to_thread(_log_pip_stats)
+                    await asyncio.to_thread(state.session.close)
+                    state.session = None
+            if state.log_path:
+                # Callers read the log right after the attempt
+                await asyncio.to_thread(jsonl_logger.close, state.log_path)
+    finally:
+        _ATTEMPT.reset(token)
+
+
 async def main():
-    if not CHUTES_API_KEY:
+    if not CHUTES_API_KEY and cassette.mode() != "replay":
         raise RuntimeError("CHUTES_API_KEY is not set in the environment.")
     # ensure docker image exists (auto-build if missing)
     ensure_docker_image()
-    model = await pick_ready_model()
+    await run_attempt(_DEFAULT_STATE)
+
 
+async def _run_team(model: OpenAIChatCompletionClient, *, quiet: bool = False) -> Any:
+    st = _st()
     # One agent with the tools
     runner = AssistantAgent(
         "Runner",
@@ -570,6 +1080,9 @@ async def main():
             swe_pytest,
             swe_pytest_auto,
             swe_apply_patch_text,
+            swe_eval_patches,
+            swe_checkpoint,
+            swe_restore,
             swe_pytest_full,
             swe_read_file,
             swe_pip_install,
@@ -582,24 +1095,25 @@ async def main():
         TextMentionTermination(" passed in ")
         | TextMentionTermination(" passed")               # e.g., "1 passed, 1 warning"
         | TextMentionTermination(" no tests ran")         # edge case
-        | MaxMessageTermination(MAX_TURNS)
+        | MaxMessageTermination(st.max_turns)
     )
     team = RoundRobinGroupChat([runner], termination_condition=term)
 
-    kline = f'-k "{PYTEST_K}"' if PYTEST_K else ""
+    kline = f'-k "{st.pytest_k}"' if st.pytest_k else ""
     # Optional hint from previous attempt to guide this run
-    hint_block = ("\n\nPrevious attempt summary (brief):\n" + ATTEMPT_HINT + "\n") if ATTEMPT_HINT else ""
-    is_local = (TARGET_REPO or "").startswith("/workspace/")
+    hint_block = ("\n\nPrevious attempt summary (brief):\n" + st.attempt_hint + "\n") if st.attempt_hint else ""
+    is_local = (st.target_repo or "").startswith("/workspace/")
     if is_local:
         task = f"""
 You are a code-fixing agent working inside a clean Docker container.
 Use ONLY the provided tools. Keep outputs minimal.
 
 Steps (local repo detected; optimize for speed under strict timeouts):
-1) swe_clone(repo_url="{TARGET_REPO}", ref="{TARGET_REF}")
+1) swe_clone(repo_url="{st.target_repo}", ref="{st.target_ref}")
 2) QUICK PRE-TEST: run swe_pytest(pytest_args="-q {kline}".strip()). If tests PASS, STOP immediately.
 3) If pre-test fails, SKIP swe_install; run swe_pytest_full(pytest_args="-q -x -vv") to gather diagnostics.
 4) Attempt EXACTLY ONE minimal unified diff patch to fix the failing test. Apply via swe_apply_patch_text(diff_text=...). Keep the diff as small as possible.
+   If you have several plausible fixes, first compare them with swe_eval_patches(diffs=[...], pytest_args="-q {kline}".strip()) and apply the best one.
 
 Unified diff format example (use correct file path and minimal context):
 --- a/src/pkg/module.py
@@ -619,13 +1133,15 @@ You are a code-fixing agent working inside a clean Docker container.
 Use ONLY the provided tools. Keep outputs minimal.
 
 Steps (optimize for speed under strict timeouts):
-1) swe_clone(repo_url="{TARGET_REPO}", ref="{TARGET_REF}")
+1) swe_clone(repo_url="{st.target_repo}", ref="{st.target_ref}")
 2) QUICK PRE-TEST: run swe_pytest(pytest_args="-q {kline}".strip()). If tests PASS, STOP immediately (do not install or patch). Paste ONLY the returned tail.
 3) If pre-test fails, run swe_pytest_auto(pytest_args="-q {kline}".strip()) to auto-install a missing top-level module once and re-run tests. If PASS, STOP and paste ONLY the tail.
 4) Only if still failing: swe_install() to install the project and test deps.
 5) If still failing, get diagnostics with swe_pytest_full(pytest_args="-q -x -vv"). Use swe_read_file(path="...") if you need to inspect code.
 6) If diagnostics indicate a missing package not auto-installed, use swe_pip_install(packages="<name>") and then re-run swe_pytest.
 7) Attempt EXACTLY ONE minimal unified diff patch (keep it small). Apply via swe_apply_patch_text(diff_text=...). Then re-run tests with swe_pytest and paste ONLY the returned tail. After this second test run, STOP.
+   If a patch made things worse, swe_restore() rolls back to the post-install state (no re-clone or re-install needed).
+   If you have several plausible fixes, first compare them with swe_eval_patches(diffs=[...], pytest_args="-q {kline}".strip()) and apply the best one.
 
 CRITICAL OUTPUT RULE:
 Whenever you run tests, paste ONLY the exact string returned by swe_pytest/swe_pytest_auto (the last non-empty pytest stdout line). No extra words.
@@ -633,7 +1149,7 @@ Whenever you run tests, paste ONLY the exact string returned by swe_pytest/swe_p
 
     t0 = time.time()
     # initial log record
-    if LOG_PATH:
+    if st.log_path:
         _log_record({
             "timestamp": _now_iso(),
             "role": "system",
@@ -642,19 +1158,21 @@ Whenever you run tests, paste ONLY the exact string returned by swe_pytest/swe_p
             "tool_args": None,
             "tool_result": None,
             "usage": None,
-            "run_id": RUN_ID,
-            "task_id": TASK_ID,
-            "model": MODEL_NAME or getattr(model, "model", None),
-            "temperature": MODEL_TEMPERATURE,
+            **_log_fields(),
+            "model": st.model_name or getattr(model, "model", None),
             "started_at": _now_iso(),
         })
-    # Use streaming UI for consistent console output
-    res = await Console(team.run_stream(task=task))
-    print(f"\n--- SUMMARY ---\nElapsed seconds: {time.time() - t0:.2f}")
-    try:
-        print(f"Messages: {len(res.messages)}")
-    except Exception:
-        pass
+    if quiet:
+        # Many attempts share stdout in the batch engine; the JSONL log is the record
+        res = await team.run(task=task)
+    else:
+        # Use streaming UI for consistent console output
+        res = await Console(team.run_stream(task=task))
+        print(f"\n--- SUMMARY ---\nElapsed seconds: {time.time() - t0:.2f}")
+        try:
+            print(f"Messages: {len(res.messages)}")
+        except Exception:
+            pass
     # log terminal tail line as assistant content if detectable via messages
     try:
         for m in getattr(res, "messages", []) or []:
@@ -670,13 +1188,12 @@ Whenever you run tests, paste ONLY the exact string returned by swe_pytest/swe_p
                 "tool_args": None,
                 "tool_result": None,
                 "usage": getattr(m, "usage", None),
-                "run_id": RUN_ID,
-                "task_id": TASK_ID,
-                "model": MODEL_NAME or getattr(model, "model", None),
-                "temperature": MODEL_TEMPERATURE,
+                **_log_fields(),
+                "model": st.model_name or getattr(model, "model", None),
             })
     except Exception:
         pass
+    return res
 
 if __name__ == "__main__":
     # Kept as a runnable shim; module is also exposed under demas.swe.oneagent
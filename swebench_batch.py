@@ -3,19 +3,27 @@ import os
 import sys
 import json
 import time
+import asyncio
 import subprocess
 from datetime import datetime
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 
-from demas.core.io import load_seed_tasks
-from demas.core.summaries import write_baseline_csv, write_agent_csv
+from demas.core.io import load_seed_tasks, write_json_atomic
+from demas.core import task_cost
+from demas.core.summaries import write_baseline_csv, write_agent_csv, write_test_timings_csv, first_attempt_rows
 from demas.core import config as _cfg  # triggers local credentials loading
+from demas.core.docker_exec import remove_sessions
+from demas.core.container_pool import ContainerPool
+from demas.core import cassette, checkpoint, jsonl_logger, pipeline, pytest_report, test_impact
+from demas.core.spool import run_spooled
 
 
 ROOT = os.path.abspath(os.path.dirname(__file__))
-SANDBOX = os.path.join(ROOT, "sandbox")
+# The one host sandbox (ROOT/sandbox): mounted as /workspace by the pool and every
+# runner, and the root of the host-side caches (demas.core.config.WORKDIR)
+SANDBOX = _cfg.WORKDIR
 RUNS_DIR = os.path.join(SANDBOX, "runs")
 SEEDS_DEFAULT = os.path.join(SANDBOX, "seed_tasks.jsonl")
 
@@ -28,7 +36,40 @@ def list_run_subdirs() -> List[str]:
     return names
 
 
-def run_baseline_for_task(task: Dict[str, Any]) -> Dict[str, Any]:
+def _pool_acquire(pool: Optional[ContainerPool], env: Dict[str, str], stats: Dict[str, Any]):
+    """Hand a warm container to the child runner via SWE_CONTAINER; returns the session or None."""
+    if pool is None:
+        return None
+    try:
+        session, hit, acquire_s = pool.acquire()
+    except Exception:
+        return None
+    env["SWE_CONTAINER"] = session.name
+    stats["pool_hits"] += int(hit)
+    stats["pool_misses"] += int(not hit)
+    stats["pool_acquire_s"] = round(stats["pool_acquire_s"] + acquire_s, 3)
+    return session
+
+
+def _new_pool_stats(pool: Optional[ContainerPool]) -> Dict[str, Any]:
+    return {"pool_hits": 0, "pool_misses": 0, "pool_acquire_s": 0.0} if pool is not None else {}
+
+
+def _peak_rss_mb() -> Dict[str, float]:
+    """Peak resident memory of this runner and of its largest finished child process (MB)."""
+    try:
+        import resource
+    except ImportError:
+        return {}
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "runner_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "child_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+def run_baseline_for_task(task: Dict[str, Any], *, pool: Optional[ContainerPool] = None) -> Dict[str, Any]:
     """Invoke swebench_baseline.py with the given task_id and read the latest result.json."""
     before = set(list_run_subdirs())
     task_id = task.get("task_id", "")
@@ -42,7 +83,14 @@ def run_baseline_for_task(task: Dict[str, Any]) -> Dict[str, Any]:
     if task.get("pytest_k"):
         cmd += ["--pytest-k", task["pytest_k"]]
 
-    subprocess.run(cmd, check=False)
+    env = os.environ.copy()
+    pool_stats = _new_pool_stats(pool)
+    session = _pool_acquire(pool, env, pool_stats)
+    try:
+        subprocess.run(cmd, check=False, env=env)
+    finally:
+        if session is not None:
+            pool.release(session)
 
     # Find new run dir
     after = set(list_run_subdirs())
@@ -53,7 +101,11 @@ def run_baseline_for_task(task: Dict[str, Any]) -> Dict[str, Any]:
     result_path = os.path.join(RUNS_DIR, latest, "result.json")
     try:
         with open(result_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+            res = json.load(f)
+        res.update(pool_stats)
+        report_path = os.path.join(RUNS_DIR, latest, "pytest_report.json")
+        res["pytest_report_path"] = report_path if os.path.isfile(report_path) else ""
+        return res
     except Exception as e:
         return {"task_id": task_id, "error": f"result_read_failed: {e}"}
 
@@ -65,24 +117,23 @@ def _build_attempt_hint(log_path: str, size_cap_bytes: int = 2048) -> str:
     missing = ""
     patch = ""
     try:
-        with open(log_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                rec = json.loads(line)
-                tool = rec.get("tool_name")
-                role = rec.get("role", "")
-                content = rec.get("content") or ""
-                result = rec.get("tool_result") or ""
-                if tool in ("swe_pytest", "swe_pytest_auto") and role == "tool":
-                    tail = result
-                if tool == "swe_pytest_full" and role == "tool":
-                    diag = result
-                if role == "assistant" and "Detected missing module:" in content:
-                    missing = content
-                if tool == "swe_apply_patch_text" and role == "tool":
-                    patch = result
+        for line in jsonl_logger.iter_lines(log_path):
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            tool = rec.get("tool_name")
+            role = rec.get("role", "")
+            content = rec.get("content") or ""
+            result = rec.get("tool_result") or ""
+            if tool in ("swe_pytest", "swe_pytest_auto") and role == "tool":
+                tail = result
+            if tool == "swe_pytest_full" and role == "tool":
+                diag = result
+            if role == "assistant" and "Detected missing module:" in content:
+                missing = content
+            if tool == "swe_apply_patch_text" and role == "tool":
+                patch = result
     except Exception:
         pass
     parts = []
@@ -104,7 +155,138 @@ def _build_attempt_hint(log_path: str, size_cap_bytes: int = 2048) -> str:
     return hint
 
 
-def run_agent_for_task(task: Dict[str, Any], *, out_dir: str, model: str, temperature: float, max_turns: int, attempts: int, attempt_cap_s: int) -> Dict[str, Any]:
+def _extract_tail_from_log(log_path: str) -> str:
+    """Read the agent log and return the last pytest tail emitted by swe_pytest/_auto.
+
+    This avoids relying on stdout of the agent process, which may contain
+    wrapper objects (e.g., FunctionExecutionResult) rather than raw tails.
+    """
+    try:
+        last_tail = ""
+        for line in jsonl_logger.iter_lines(log_path):
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            if rec.get("role") == "tool" and rec.get("tool_name") in ("swe_pytest", "swe_pytest_auto"):
+                tr = rec.get("tool_result") or ""
+                if isinstance(tr, str) and tr.strip():
+                    last_tail = tr.strip()
+        return last_tail
+    except Exception:
+        return ""
+
+
+def _last_report_record(log_path: str) -> Optional[Dict[str, Any]]:
+    """Last swe_pytest/_auto tool record that carries a structured pytest report, if any."""
+    last = None
+    try:
+        for line in jsonl_logger.iter_lines(log_path):
+            if '"pytest_report"' not in line:
+                continue
+            rec = json.loads(line)
+            if rec.get("role") == "tool" and rec.get("tool_name") in ("swe_pytest", "swe_pytest_auto") and rec.get("pytest_report"):
+                last = rec
+    except Exception:
+        pass
+    return last
+
+
+def _report_from_log(log_path: str) -> Optional[Dict[str, Any]]:
+    """Last structured pytest report (compact form) logged by swe_pytest/_auto, if any."""
+    rec = _last_report_record(log_path)
+    return rec["pytest_report"] if rec else None
+
+
+def _attempt_passed(log_path: str, tail: str) -> bool:
+    rec = _last_report_record(log_path)
+    if rec:
+        impact = rec.get("test_impact") or {}
+        if impact.get("mode") == "selected" and not impact.get("confirmed"):
+            # Only the tests affected by the patch ran (SWE_TEST_IMPACT without _CONFIRM);
+            # selection can miss tests, so a subset pass does not pass the task
+            return False
+        rep = rec["pytest_report"]
+        if rep.get("tests"):
+            return pytest_report.is_pass(rep)
+    return _is_pass(tail)
+
+
+def _tail_from_output(out: str) -> str:
+    """Fallback tail: last line of agent output that looks like a pytest summary."""
+    for ln in out.splitlines()[::-1]:
+        ln = ln.strip()
+        if not ln:
+            continue
+        if "passed" in ln or "failed" in ln or "error" in ln or "no tests ran" in ln:
+            return ln
+    return ""
+
+
+def _agent_row(task: Dict[str, Any], *, passed: bool, duration_s: float, tail: str, model: str, temperature: float, max_turns: int, pool_stats: Dict[str, Any], log_path: str = "", attempt_log: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    report_path = os.path.splitext(log_path)[0] + ".pytest_report.json" if log_path else ""
+    # Per-attempt outcomes, so an attempts=N run also yields pass@1 (summaries.first_attempt_rows)
+    attempt_log = attempt_log or []
+    return {
+        "task_id": task.get("task_id", ""),
+        "repo": task.get("repo", ""),
+        "ref": task.get("ref", ""),
+        "pytest_k": task.get("pytest_k", ""),
+        "status": "pass" if passed else "fail",
+        "duration_s": round(duration_s, 3),
+        "tail": tail,
+        "model": model,
+        "temperature": temperature,
+        "max_turns": max_turns,
+        "pytest_report": (_report_from_log(log_path) or {}) if log_path else {},
+        "pytest_report_path": report_path if report_path and os.path.isfile(report_path) else "",
+        "attempt_results": [bool(a.get("passed")) for a in attempt_log],
+        "attempt_durations_s": [round(float(a.get("duration_s") or 0.0), 3) for a in attempt_log],
+        "attempt_tails": [a.get("tail", "") for a in attempt_log],
+        "first_attempt_pass": bool(attempt_log and attempt_log[0].get("passed")),
+        **pool_stats,
+    }
+
+
+def _is_pass(tail: str) -> bool:
+    return " passed" in tail and " failed" not in tail and " error" not in tail
+
+
+def _checkpoint_scope(out_dir: str, task: Dict[str, Any]) -> str:
+    """Checkpoint scope shared by a task's attempts within one batch run."""
+    return f"{os.path.basename(out_dir)}__{task.get('task_id', '')}".replace("/", "_")
+
+
+def _attempt_record_path(attempt_dir: str, task: Dict[str, Any]) -> str:
+    return os.path.join(attempt_dir, "logs", f"{task.get('task_id','')}.attempt.json")
+
+
+def _load_attempt(attempt_dir: str, task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Outcome of a finished attempt (written by _save_attempt), e.g. from a run being resumed."""
+    try:
+        with open(_attempt_record_path(attempt_dir, task), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _save_attempt(attempt_dir: str, task: Dict[str, Any], **fields: Any) -> None:
+    try:
+        write_json_atomic(_attempt_record_path(attempt_dir, task), {"task_id": task.get("task_id", ""), **fields})
+    except Exception:
+        pass
+
+
+def _discard_partial_attempt(log_path: str) -> None:
+    """Drop logs of an attempt that never finished (runner killed) before it is rerun."""
+    for p in (log_path, log_path + ".gz", os.path.splitext(log_path)[0] + ".pytest_report.json"):
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+
+def run_agent_for_task(task: Dict[str, Any], *, out_dir: str, model: str, temperature: float, max_turns: int, attempts: int, attempt_cap_s: int, pool: Optional[ContainerPool] = None) -> Dict[str, Any]:
     env = os.environ.copy()
     env.setdefault("SWE_IMAGE", "swebench-lite:py3.10")
     env["TARGET_REPO"] = task.get("repo", "")
@@ -132,118 +314,302 @@ def run_agent_for_task(task: Dict[str, Any], *, out_dir: str, model: str, temper
     start_overall = time.time()
     last_hint = ""
     last_tail = ""
-    def _extract_tail_from_log(log_path: str) -> str:
-        """Read the agent log and return the last pytest tail emitted by swe_pytest/_auto.
+    pool_stats = _new_pool_stats(pool)
+    # Attempt 1 checkpoints its post-install state; later attempts resume from it
+    scope = _checkpoint_scope(out_dir, task) if attempts_n > 1 else ""
+    log_path = ""
+    # Seconds spent in attempts finished before a resume
+    prior_s = 0.0
+    attempt_log: List[Dict[str, Any]] = []
+    try:
+        for k in range(1, attempts_n + 1):
+            env_k = env.copy()
+            attempt_dir = os.path.join(out_dir, f"attempt_{k}")
+            os.makedirs(os.path.join(attempt_dir, "logs"), exist_ok=True)
+            log_path = os.path.join(attempt_dir, "logs", f"{task.get('task_id','')}.jsonl")
+            prev = _load_attempt(attempt_dir, task)
+            if prev is not None:
+                last_tail, last_hint = prev.get("tail") or last_tail, prev.get("hint", "")
+                model_used = model_used or prev.get("model", "")
+                prior_s += float(prev.get("duration_s") or 0.0)
+                attempt_log.append(prev)
+                if prev.get("passed"):
+                    return _agent_row(task, passed=True, duration_s=prior_s + time.time() - start_overall, tail=last_tail, model=model_used, temperature=temperature, max_turns=max_turns, pool_stats=pool_stats, log_path=log_path, attempt_log=attempt_log)
+                continue
+            _discard_partial_attempt(log_path)
+            env_k["RUN_BASE_DIR"] = attempt_dir
+            env_k["TASK_ID"] = task.get("task_id", "")
+            env_k["ATTEMPT_INDEX"] = str(k)
+            if scope:
+                env_k["CHECKPOINT_SCOPE"] = scope
+                env_k["RESUME_CHECKPOINT"] = checkpoint.AUTO_NAME if k > 1 else ""
+            if last_hint:
+                env_k["ATTEMPT_HINT"] = last_hint
+            # Label session containers so a hard-killed attempt does not leak them
+            owner = f"{os.path.basename(out_dir)}_{task.get('task_id', '')}_{k}_{os.getpid()}".replace("/", "_")
+            env_k["DEMAS_SESSION_OWNER"] = owner
+            pool_session = _pool_acquire(pool, env_k, pool_stats)
+            t0 = time.time()
+            try:
+                # Agent stdout (streamed console transcript) goes to a spool file; only its tail is kept
+                res_k = run_spooled([sys.executable, "-m", "demas.swe.oneagent"], env=env_k, merge_stderr=True, timeout=max(1, int(attempt_cap_s)))
+            finally:
+                remove_sessions(owner)
+                if pool_session is not None:
+                    pool.release(pool_session)
+            with res_k:
+                out = res_k.stdout_tail + ("\n(timeout)" if res_k.code == 124 else "")
+                if not model_used:
+                    model_used = next((ln.split(":", 1)[1].strip() for ln in res_k.iter_lines() if ln.strip().startswith("[preflight] Using model:")), "")
+            dt_k = time.time() - t0
+            # Determine tail: prefer reading from the JSONL logs (reliable), fallback to stdout scan
+            tail = _extract_tail_from_log(log_path) or _tail_from_output(out)
+            last_tail = tail or last_tail
+            passed = _attempt_passed(log_path, last_tail)
+            # Build hint for next attempt
+            last_hint = "" if passed else _build_attempt_hint(log_path, size_cap_bytes=2048)
+            attempt_log.append({"passed": passed, "duration_s": dt_k, "tail": tail})
+            _save_attempt(attempt_dir, task, attempt=k, passed=passed, tail=last_tail, hint=last_hint, duration_s=round(dt_k, 3), model=model_used)
+            if passed:
+                return _agent_row(task, passed=True, duration_s=prior_s + time.time() - start_overall, tail=last_tail, model=model_used, temperature=temperature, max_turns=max_turns, pool_stats=pool_stats, log_path=log_path, attempt_log=attempt_log)
+        # All attempts failed
+        return _agent_row(task, passed=False, duration_s=prior_s + time.time() - start_overall, tail=last_tail, model=model_used, temperature=temperature, max_turns=max_turns, pool_stats=pool_stats, log_path=log_path, attempt_log=attempt_log)
+    finally:
+        if scope:
+            checkpoint.remove_scope(scope)
+
+
+async def run_agent_for_task_async(task: Dict[str, Any], *, out_dir: str, client: Any, model: str, temperature: float, max_turns: int, attempts: int, attempt_cap_s: int, pool: Optional[ContainerPool] = None) -> Dict[str, Any]:
+    """In-process counterpart of run_agent_for_task: attempts run as coroutines on a shared model client."""
+    from demas.swe import oneagent
+    to = task.get("timeouts", {}) or {}
+    if not isinstance(to, dict):
+        to = {}
+    start_overall = time.time()
+    last_hint = ""
+    last_tail = ""
+    pool_stats = _new_pool_stats(pool)
+    # Attempt 1 checkpoints its post-install state; later attempts resume from it
+    scope = _checkpoint_scope(out_dir, task) if int(attempts) > 1 else ""
+    log_path = ""
+    # Seconds spent in attempts finished before a resume
+    prior_s = 0.0
+    attempt_log: List[Dict[str, Any]] = []
+    try:
+        for k in range(1, max(1, int(attempts)) + 1):
+            attempt_dir = os.path.join(out_dir, f"attempt_{k}")
+            os.makedirs(os.path.join(attempt_dir, "logs"), exist_ok=True)
+            log_path = os.path.join(attempt_dir, "logs", f"{task.get('task_id','')}.jsonl")
+            prev = _load_attempt(attempt_dir, task)
+            if prev is not None:
+                last_tail, last_hint = prev.get("tail") or last_tail, prev.get("hint", "")
+                prior_s += float(prev.get("duration_s") or 0.0)
+                attempt_log.append(prev)
+                if prev.get("passed"):
+                    return _agent_row(task, passed=True, duration_s=prior_s + time.time() - start_overall, tail=last_tail, model=model, temperature=temperature, max_turns=max_turns, pool_stats=pool_stats, log_path=log_path, attempt_log=attempt_log)
+                continue
+            _discard_partial_attempt(log_path)
+            pool_env: Dict[str, str] = {}
+            pool_session = await asyncio.to_thread(_pool_acquire, pool, pool_env, pool_stats)
+            state = oneagent.AttemptState(
+                target_repo=task.get("repo", ""),
+                target_ref=task.get("ref", ""),
+                pytest_k=task.get("pytest_k", ""),
+                project_dir=None,
+                task_id=task.get("task_id", ""),
+                log_path=log_path,
+                attempt_hint=last_hint,
+                attempt=k,
+                model_name=model,
+                temperature=temperature,
+                max_turns=int(max_turns) if max_turns else oneagent.MAX_TURNS,
+                timeout_clone=int(to.get("clone") or oneagent.TIMEOUT_CLONE),
+                timeout_install=int(to.get("install") or oneagent.TIMEOUT_INSTALL),
+                timeout_test=int(to.get("test") or oneagent.TIMEOUT_TEST),
+                container=pool_env.get("SWE_CONTAINER", ""),
+                checkpoint_scope=scope,
+                resume_checkpoint=checkpoint.AUTO_NAME if (scope and k > 1) else "",
+            )
+            t0 = time.time()
+            try:
+                res = await asyncio.wait_for(oneagent.run_attempt(state, model_client=client, quiet=True), timeout=max(1, int(attempt_cap_s)))
+                out = "\n".join(str(getattr(m, "content", "")) for m in (getattr(res, "messages", None) or []))
+            except asyncio.TimeoutError:
+                out = "(timeout)"
+            except Exception as e:
+                out = f"(error) {e}"
+            finally:
+                if pool_session is not None:
+                    await asyncio.to_thread(pool.release, pool_session)
+            tail = _extract_tail_from_log(log_path) or _tail_from_output(out)
+            last_tail = tail or last_tail
+            passed = _attempt_passed(log_path, last_tail)
+            last_hint = "" if passed else _build_attempt_hint(log_path, size_cap_bytes=2048)
+            attempt_log.append({"passed": passed, "duration_s": time.time() - t0, "tail": tail})
+            _save_attempt(attempt_dir, task, attempt=k, passed=passed, tail=last_tail, hint=last_hint, duration_s=round(time.time() - t0, 3), model=model)
+            if passed:
+                return _agent_row(task, passed=True, duration_s=prior_s + time.time() - start_overall, tail=last_tail, model=model, temperature=temperature, max_turns=max_turns, pool_stats=pool_stats, log_path=log_path, attempt_log=attempt_log)
+        return _agent_row(task, passed=False, duration_s=prior_s + time.time() - start_overall, tail=last_tail, model=model, temperature=temperature, max_turns=max_turns, pool_stats=pool_stats, log_path=log_path, attempt_log=attempt_log)
+    finally:
+        if scope:
+            await asyncio.to_thread(checkpoint.remove_scope, scope)
+
+
+async def _run_agent_batch_async(tasks: List[Dict[str, Any]], outf, *, out_dir: str, model: str, temperature: float, max_turns: int, attempts: int, attempt_cap_s: int, jobs: int, pool: Optional[ContainerPool] = None, stages: Optional[Dict[str, int]] = None) -> None:
+    """Run all agent tasks in this process: one preflight, one model client, `jobs` concurrent tasks.
 
-        This avoids relying on stdout of the agent process, which may contain
-        wrapper objects (e.g., FunctionExecutionResult) rather than raw tails.
-        """
+    With `stages` ({"prepare", "ahead", "test"} sizes) tasks flow through the pipelined scheduler instead.
+    """
+    from demas.swe import oneagent
+    # Tool calls block in docker exec threads; size the executor for the concurrency
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max(32, 2 * jobs + 4 + (stages or {}).get("prepare", 0))))
+    await asyncio.to_thread(oneagent.ensure_docker_image)
+    await oneagent.preflight_all([model] if model else None, temperature=temperature)
+    client = await oneagent.pick_ready_model(model, temperature)
+    model_used = model or getattr(client, "_raw_config", {}).get("model", "")
+    sem = asyncio.Semaphore(max(1, jobs))
+
+    async def _one(task: Dict[str, Any]) -> None:
         try:
-            last_tail = ""
-            with open(log_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    rec = json.loads(line)
-                    if rec.get("role") == "tool" and rec.get("tool_name") in ("swe_pytest", "swe_pytest_auto"):
-                        tr = rec.get("tool_result") or ""
-                        if isinstance(tr, str) and tr.strip():
-                            last_tail = tr.strip()
-            return last_tail
-        except Exception:
-            return ""
-
-    for k in range(1, attempts_n + 1):
-        env_k = env.copy()
-        attempt_dir = os.path.join(out_dir, f"attempt_{k}")
-        os.makedirs(os.path.join(attempt_dir, "logs"), exist_ok=True)
-        env_k["RUN_BASE_DIR"] = attempt_dir
-        env_k["TASK_ID"] = task.get("task_id", "")
-        if last_hint:
-            env_k["ATTEMPT_HINT"] = last_hint
-        t0 = time.time()
+            res = await run_agent_for_task_async(task, out_dir=out_dir, client=client, model=model_used, temperature=temperature, max_turns=max_turns, attempts=attempts, attempt_cap_s=attempt_cap_s, pool=pool)
+            msg = f"{task.get('task_id','')} -> {res.get('tail','')} ({res.get('status','?')})"
+        except Exception as e:
+            res = {"task_id": task.get("task_id", ""), "error": f"worker_failed: {e}"}
+            msg = f"{res.get('task_id','')} -> (error) ({e})"
+        # Single event-loop thread: no write lock needed
+        _emit_result(outf, out_dir, res)
+        print(msg)
+
+    async def _run(task: Dict[str, Any]) -> None:
+        async with sem:
+            await _one(task)
+
+    try:
+        if stages:
+            await _run_agent_pipeline(tasks, _one, out_dir=out_dir, agent_jobs=max(1, jobs), **stages)
+        else:
+            await asyncio.gather(*(_run(t) for t in tasks))
+    finally:
         try:
-            p = subprocess.run(
-                [sys.executable, "-m", "demas.swe.oneagent"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                env=env_k,
-                timeout=max(1, int(attempt_cap_s)),
+            await client.close()
+        except Exception:
+            pass
+
+
+async def _run_agent_pipeline(tasks: List[Dict[str, Any]], run_task, *, out_dir: str, agent_jobs: int, prepare: int, ahead: int, test: int) -> None:
+    """Staged scheduler: prepare workers fill a bounded queue of ready tasks that agent workers drain.
+
+    Test runs issued by the agents share `test` slots (demas.core.pipeline.test_slot).
+    Writes per-stage utilization to <out_dir>/pipeline.json.
+    """
+    from demas.swe import oneagent
+    st_prep, st_agent, st_test = pipeline.Stage("prepare", prepare), pipeline.Stage("agent", agent_jobs), pipeline.Stage("test", test)
+    pipeline.set_test_stage(st_test)
+    todo: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    for t in tasks:
+        todo.put_nowait(t)
+    ready: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=max(1, ahead))
+    envs: Dict[str, int] = {}
+    t_start = time.time()
+
+    async def _prepare_worker() -> None:
+        while True:
+            try:
+                task = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            to = task.get("timeouts", {}) if isinstance(task.get("timeouts"), dict) else {}
+            state = oneagent.AttemptState(
+                target_repo=task.get("repo", ""), target_ref=task.get("ref", ""), task_id=task.get("task_id", ""),
+                project_dir=None, log_path="", checkpoint_scope="", resume_checkpoint="",
+                timeout_clone=int(to.get("clone") or oneagent.TIMEOUT_CLONE),
+                timeout_install=int(to.get("install") or oneagent.TIMEOUT_INSTALL),
             )
-            out = p.stdout or ""
-        except subprocess.TimeoutExpired as e:
-            # e.stdout may be bytes depending on the platform/config; coerce safely
-            _s = e.stdout
-            if isinstance(_s, bytes):
+            with st_prep.track():
                 try:
-                    _s = _s.decode("utf-8", errors="ignore")
-                except Exception:
-                    _s = ""
-            out = ( _s or "" ) + "\n(timeout)"
-        dt_k = time.time() - t0
-        # Determine tail: prefer reading from the JSONL logs (reliable), fallback to stdout scan
-        log_path = os.path.join(attempt_dir, "logs", f"{task.get('task_id','')}.jsonl")
-        tail = _extract_tail_from_log(log_path)
-        if not tail:
-            for ln in out.splitlines()[::-1]:
-                ln = ln.strip()
-                if not ln:
-                    continue
-                if "passed" in ln or "failed" in ln or "error" in ln or "no tests ran" in ln:
-                    tail = ln
-                    break
-        last_tail = tail or last_tail
-        # Model detection (first available)
-        if not model_used:
-            for ln in out.splitlines():
-                if ln.strip().startswith("[preflight] Using model:"):
-                    try:
-                        model_used = ln.split(":", 1)[1].strip()
-                    except Exception:
-                        pass
-                    break
-        passed = (" passed" in last_tail and " failed" not in last_tail and " error" not in last_tail)
-        if passed:
-            total_dt = time.time() - start_overall
-            return {
-                "task_id": task.get("task_id", ""),
-                "repo": task.get("repo", ""),
-                "ref": task.get("ref", ""),
-                "pytest_k": task.get("pytest_k", ""),
-                "status": "pass",
-                "duration_s": round(total_dt, 3),
-                "tail": last_tail,
-                "model": model_used,
-                "temperature": temperature,
-                "max_turns": max_turns,
-            }
-        # Build hint for next attempt
-        last_hint = _build_attempt_hint(log_path, size_cap_bytes=2048)
-    # All attempts failed
-    total_dt = time.time() - start_overall
-    return {
-        "task_id": task.get("task_id", ""),
-        "repo": task.get("repo", ""),
-        "ref": task.get("ref", ""),
-        "pytest_k": task.get("pytest_k", ""),
-        "status": "fail",
-        "duration_s": round(total_dt, 3),
-        "tail": last_tail,
-        "model": model_used,
-        "temperature": temperature,
-        "max_turns": max_turns,
-    }
+                    info = await oneagent.prepare_environment(state)
+                except Exception as e:
+                    info = {"env": "failed", "error": str(e)}
+            envs[info.get("env", "failed")] = envs.get(info.get("env", "failed"), 0) + 1
+            # A full ready queue means the agents are the bottleneck
+            t0 = time.time()
+            await ready.put(task)
+            st_prep.add(blocked=time.time() - t0)
+
+    async def _agent_worker() -> None:
+        while True:
+            t0 = time.time()
+            task = await ready.get()
+            st_agent.add(wait=time.time() - t0)
+            if task is None:
+                return
+            with st_agent.track():
+                await run_task(task)
+
+    preparers = [asyncio.create_task(_prepare_worker()) for _ in range(st_prep.workers)]
+    agents = [asyncio.create_task(_agent_worker()) for _ in range(st_agent.workers)]
+    try:
+        await asyncio.gather(*preparers)
+        for _ in agents:
+            await ready.put(None)
+        await asyncio.gather(*agents)
+    finally:
+        pipeline.set_test_stage(None)
+        wall = time.time() - t_start
+        report = {"wall_s": round(wall, 3), "prepared_envs": envs, "stages": {s.name: s.report(wall) for s in (st_prep, st_agent, st_test)}}
+        try:
+            with open(os.path.join(out_dir, "pipeline.json"), "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        except Exception:
+            pass
+        for s in (st_prep, st_agent, st_test):
+            r = report["stages"][s.name]
+            print(f"[pipeline] {s.name:8s} workers={r['workers']:<3d} items={r['items']:<4d} util={r['utilization']:.0%} busy={r['busy_s']:.0f}s wait={r['wait_s']:.0f}s blocked={r['blocked_s']:.0f}s")
+
+
+def _record_path(out_dir: str, task_id: str) -> str:
+    return os.path.join(out_dir, "records", f"{task_id.replace('/', '_')}.json")
 
 
-def _run_single_task(task: Dict[str, Any], *, agent: bool, out_dir: str, model: str, temperature: float, max_turns: int, attempts: int, attempt_cap_s: int) -> Tuple[Dict[str, Any], str]:
+def _emit_result(outf, out_dir: str, res: Dict[str, Any]) -> None:
+    """Persist one finished task: an atomic per-task record (what --resume trusts), then its results.jsonl line."""
+    if res.get("task_id") and "error" not in res:
+        try:
+            write_json_atomic(_record_path(out_dir, res["task_id"]), res)
+        except Exception as e:
+            print(f"(record write failed for {res['task_id']}): {e}")
+    outf.write(json.dumps(res) + "\n")
+    outf.flush()
+
+
+def _load_records(out_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Finished tasks of a run dir by task_id (errored tasks have no record and run again)."""
+    done: Dict[str, Dict[str, Any]] = {}
+    rec_dir = os.path.join(out_dir, "records")
+    try:
+        names = sorted(os.listdir(rec_dir))
+    except OSError:
+        return done
+    for n in names:
+        if not n.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(rec_dir, n), "r", encoding="utf-8") as f:
+                rec = json.load(f)
+        except Exception:
+            continue
+        if rec.get("task_id"):
+            done[rec["task_id"]] = rec
+    return done
+
+
+def _run_single_task(task: Dict[str, Any], *, agent: bool, out_dir: str, model: str, temperature: float, max_turns: int, attempts: int, attempt_cap_s: int, pool: Optional[ContainerPool] = None) -> Tuple[Dict[str, Any], str]:
     if agent:
-        res = run_agent_for_task(task, out_dir=out_dir, model=model, temperature=temperature, max_turns=max_turns, attempts=attempts, attempt_cap_s=attempt_cap_s)
+        res = run_agent_for_task(task, out_dir=out_dir, model=model, temperature=temperature, max_turns=max_turns, attempts=attempts, attempt_cap_s=attempt_cap_s, pool=pool)
     else:
         # Ensure unique timestamp per baseline task to avoid collisions
         os.environ["RUN_TS"] = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")
-        res = run_baseline_for_task(task)
+        res = run_baseline_for_task(task, pool=pool)
     msg = f"{task.get('task_id','')} -> {res.get('tail','')} ({res.get('status','?')})"
     return res, msg
 
@@ -262,6 +628,15 @@ def main(argv: List[str]) -> int:
     parser.add_argument("--attempt-cap-s", type=int, default=60, help="Per-attempt wall-clock cap in seconds (default: 60)")
     parser.add_argument("--bench-notes", default=os.environ.get("BENCH_NOTES", ""), help="Optional notes to include when auto-appending full-suite agent results to BENCHMARKS.md (include 'full' to appear on leaderboard)")
     parser.add_argument("--no-auto-append", action="store_true", help="Disable auto-append to BENCHMARKS.md even for full agent runs")
+    parser.add_argument("--pool-size", type=int, default=int(os.environ.get("SWE_POOL_SIZE", "0")), help="Warm container pool size shared by workers (0 = off; env SWE_POOL_SIZE)")
+    parser.add_argument("--engine", choices=["subprocess", "async"], default=os.environ.get("SWE_BATCH_ENGINE", "subprocess"), help="Agent mode: one interpreter per attempt (subprocess) or all attempts as coroutines in this process (async; env SWE_BATCH_ENGINE)")
+    parser.add_argument("--resume", default="", metavar="RUN_DIR", help="Run into RUN_DIR (created if missing), skipping tasks and attempts that already finished there; summaries cover the whole run")
+    parser.add_argument("--order", choices=["longest", "file"], default=os.environ.get("SWE_TASK_ORDER", "longest"), help="Dispatch order: longest expected duration first from earlier runs (longest) or seed-file order (file); env SWE_TASK_ORDER")
+    parser.add_argument("--pool-max-reuse", type=int, default=4, help="Recycle a pooled container after this many task attempts (default: 4)")
+    parser.add_argument("--pipeline", action="store_true", default=os.environ.get("SWE_PIPELINE", "").strip().lower() in ("1", "true", "yes"), help="Agent mode: staged scheduler (prepare -> agent -> test pools) on the async engine (env SWE_PIPELINE)")
+    parser.add_argument("--prepare-jobs", type=int, default=int(os.environ.get("SWE_PREPARE_JOBS", "0")), help="Pipeline: clone/install workers (0 = max(1, jobs // 2); env SWE_PREPARE_JOBS)")
+    parser.add_argument("--prepare-ahead", type=int, default=int(os.environ.get("SWE_PREPARE_AHEAD", "0")), help="Pipeline: prepared tasks queued ahead of the agents (0 = jobs; env SWE_PREPARE_AHEAD)")
+    parser.add_argument("--test-jobs", type=int, default=int(os.environ.get("SWE_TEST_JOBS", "0")), help="Pipeline: concurrent pytest runs across agents (0 = cpu_count // SWE_TEST_WORKERS; env SWE_TEST_JOBS)")
     args = parser.parse_args(argv)
 
     tasks = load_seed_tasks(args.seeds)
@@ -281,29 +656,80 @@ def main(argv: List[str]) -> int:
             print(f"[parallel] Auto-selected jobs={args.jobs} (cpu={cpu})")
         except Exception:
             pass
+    # Per-task CPU budget for in-container test sharding (SWE_TEST_WORKERS=auto)
+    os.environ.setdefault("SWE_CPU_BUDGET", str(max(1, (_os.cpu_count() or 1) // max(1, args.jobs))))
+    stages: Optional[Dict[str, int]] = None
+    if args.agent and args.pipeline:
+        if args.engine != "async":
+            print("[pipeline] Stages share one process: using --engine async")
+            args.engine = "async"
+        stages = {
+            "prepare": args.prepare_jobs if args.prepare_jobs > 0 else max(1, args.jobs // 2),
+            "ahead": args.prepare_ahead if args.prepare_ahead > 0 else args.jobs,
+            "test": args.test_jobs if args.test_jobs > 0 else max(1, (_os.cpu_count() or 1) // _cfg.test_workers()),
+        }
+        print(f"[pipeline] {json.dumps(stages)} agent={args.jobs}")
+    if args.agent and test_impact.impact_enabled() and not test_impact.confirm_enabled():
+        # A pass on affected tests alone is not a task pass: confirm it with one full run
+        print("[test-impact] Batch pass/fail needs a full run: setting SWE_TEST_IMPACT_CONFIRM=1")
+        os.environ["SWE_TEST_IMPACT_CONFIRM"] = "1"
     if args.agent:
-        if not os.environ.get("CHUTES_API_KEY"):
+        if not os.environ.get("CHUTES_API_KEY") and cassette.mode() != "replay":
             print("Error: CHUTES_API_KEY not set in env.", file=sys.stderr)
             return 2
         out_dir = os.path.join(SANDBOX, "agent_batch_runs", ts)
     else:
         out_dir = os.path.join(SANDBOX, "batch_runs", ts)
+    if args.resume:
+        out_dir = os.path.abspath(args.resume)
     os.makedirs(out_dir, exist_ok=True)
     if args.agent:
         os.makedirs(os.path.join(out_dir, "logs"), exist_ok=True)
     out_path = os.path.join(out_dir, "results.jsonl")
     csv_path = os.path.join(out_dir, "summary.csv")
+    done = _load_records(out_dir) if args.resume else {}
+    if args.resume:
+        # Rebuild results.jsonl from the per-task records: drops a torn last line and errored rows that rerun now
+        with open(out_path + ".tmp", "w", encoding="utf-8") as f:
+            for rec in done.values():
+                f.write(json.dumps(rec) + "\n")
+        os.replace(out_path + ".tmp", out_path)
+        tasks = [t for t in tasks if t.get("task_id", "") not in done]
+        print(f"[resume] {out_dir}: {len(done)} tasks already finished, {len(tasks)} to run")
+
+    # Longest-expected-first dispatch so a slow task does not start last and set the makespan
+    est = task_cost.estimate(tasks, task_cost.load_history(SANDBOX, exclude=out_dir), model=args.model, mode="agent" if args.agent else "baseline")
+    if args.order == "longest":
+        tasks = task_cost.longest_first(tasks, est)
+    src = [v[1] for v in est.values()]
+    print(f"[schedule] order={args.order} estimates: exact={src.count('exact')} task={src.count('task')} prior={src.count('prior')}")
+
+    pool: Optional[ContainerPool] = None
+    if args.pool_size > 0:
+        pool = ContainerPool(size=args.pool_size, image=os.environ.get("SWE_IMAGE", _cfg.DOCKER_IMAGE), workdir=_cfg.WORKDIR, max_reuse=args.pool_max_reuse).start()
+        print(f"[pool] Warm containers ready: {pool.stats().get('idle', 0)}/{args.pool_size}")
+
+    if args.agent and args.engine == "subprocess":
+        # One concurrent probe of all candidates; per-attempt runners then hit the shared cache
+        try:
+            from demas.swe.oneagent import preflight_all
+            ready = asyncio.run(preflight_all([args.model] if args.model else None, temperature=args.temperature))
+            print(f"[preflight] {json.dumps(ready)}")
+        except Exception as e:
+            print(f"[preflight] batch preflight skipped: {e}")
 
     t0 = time.time()
     # Write results incrementally with a lock to support parallel workers
     write_lock = threading.Lock()
-    with open(out_path, "w", encoding="utf-8") as outf:
-        if max(1, args.jobs) > 1:
+    with open(out_path, "a" if args.resume else "w", encoding="utf-8") as outf:
+        if args.agent and args.engine == "async":
+            asyncio.run(_run_agent_batch_async(tasks, outf, out_dir=out_dir, model=args.model, temperature=args.temperature, max_turns=args.max_turns, attempts=args.attempts, attempt_cap_s=args.attempt_cap_s, jobs=max(1, args.jobs), pool=pool, stages=stages))
+        elif max(1, args.jobs) > 1:
             # Parallel runs (agent or baseline)
             workers = max(1, args.jobs)
             with ThreadPoolExecutor(max_workers=workers) as ex:
                 future_to_task = {
-                    ex.submit(_run_single_task, task, agent=args.agent, out_dir=out_dir, model=args.model, temperature=args.temperature, max_turns=args.max_turns, attempts=args.attempts, attempt_cap_s=args.attempt_cap_s): task
+                    ex.submit(_run_single_task, task, agent=args.agent, out_dir=out_dir, model=args.model, temperature=args.temperature, max_turns=args.max_turns, attempts=args.attempts, attempt_cap_s=args.attempt_cap_s, pool=pool): task
                     for task in tasks
                 }
                 for fut in as_completed(future_to_task):
@@ -313,17 +739,21 @@ def main(argv: List[str]) -> int:
                         res = {"task_id": future_to_task[fut].get("task_id", ""), "error": f"worker_failed: {e}"}
                         msg = f"{res.get('task_id','')} -> (error) ({e})"
                     with write_lock:
-                        outf.write(json.dumps(res) + "\n")
-                        outf.flush()
+                        _emit_result(outf, out_dir, res)
                     print(msg)
         else:
             # Sequential (baseline or single-job agent)
             for task in tasks:
-                res, msg = _run_single_task(task, agent=args.agent, out_dir=out_dir, model=args.model, temperature=args.temperature, max_turns=args.max_turns, attempts=args.attempts, attempt_cap_s=args.attempt_cap_s)
-                outf.write(json.dumps(res) + "\n")
-                outf.flush()
+                res, msg = _run_single_task(task, agent=args.agent, out_dir=out_dir, model=args.model, temperature=args.temperature, max_turns=args.max_turns, attempts=args.attempts, attempt_cap_s=args.attempt_cap_s, pool=pool)
+                _emit_result(outf, out_dir, res)
                 print(msg)
 
+    wall_s = time.time() - t0
+
+    if pool is not None:
+        print(f"[pool] {json.dumps(pool.stats())}")
+        pool.close()
+
     # CSV summary via shared helper
     try:
         rows = []
@@ -335,9 +765,28 @@ def main(argv: List[str]) -> int:
                     pass
         if args.agent:
             write_agent_csv(rows, csv_path)
+            if args.attempts > 1:
+                # pass@1 of the same run from first-attempt outcomes (no separate attempts=1 batch needed)
+                csv1_path = os.path.join(out_dir, "summary_attempt1.csv")
+                rows1 = first_attempt_rows(rows)
+                if rows1:
+                    write_agent_csv(rows1, csv1_path)
+                    print(f"Wrote attempt-1 CSV: {csv1_path}")
+                elif os.path.exists(csv1_path):
+                    # Resumed over rows without per-attempt outcomes: no pass@1 for this run
+                    os.remove(csv1_path)
         else:
             write_baseline_csv(rows, csv_path)
+        ran = {t.get("task_id", "") for t in tasks}
+        durs = [float(r["duration_s"]) for r in rows if r.get("task_id") in ran and isinstance(r.get("duration_s"), (int, float))]
+        sched = task_cost.schedule_report(durs, jobs=max(1, args.jobs), wall_s=wall_s, order=args.order, predicted=[est[t][0] for t in ran if t in est])
+        write_json_atomic(os.path.join(out_dir, "schedule.json"), sched)
+        print(f"[schedule] {json.dumps(sched)}")
+        timings_path = os.path.join(out_dir, "test_timings.csv")
+        n_tests = write_test_timings_csv(rows, timings_path)
         print(f"Wrote results: {out_path}\nWrote CSV: {csv_path}")
+        if n_tests:
+            print(f"Wrote per-test timings ({n_tests} tests): {timings_path}")
         # Auto-append to BENCHMARKS for full-suite agent runs
         if args.agent and args.limit == 0 and not args.no_auto_append:
             try:
@@ -353,6 +802,7 @@ def main(argv: List[str]) -> int:
         print(f"(CSV summary failed): {e}")
 
     print(f"Elapsed seconds: {time.time() - t0:.2f}")
+    print(f"[resources] {json.dumps(_peak_rss_mb())}")
     return 0
 
 